@@ -0,0 +1,111 @@
+"""Crawler benchmark.
+
+Usage:
+    python -m benchmarks [--sites 2000] [--latency 0.05] ...
+    python -m benchmarks --save-baseline
+
+The report is compared against benchmarks/baseline.json, the exit
+status is 1 if any metric has got worse by more than the tolerance.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from .harness import (
+    BASELINE_PATH,
+    PHASES,
+    compare,
+    format_report,
+    load_baseline,
+    run_benchmark,
+    save_baseline,
+)
+from .server import ServerSettings
+
+
+def parse_value(value: str) -> object:
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Crawl synthetic sites served locally and report "
+        "URLs/sec, p95 latency, peak RSS and database write time.",
+    )
+    defaults = ServerSettings()
+    for name, value in defaults._asdict().items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=type(value),
+            default=value,
+            help=f"server setting (default: {value})",
+        )
+    parser.add_argument(
+        "--phase",
+        action="append",
+        choices=PHASES,
+        help="phase to run, may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="app config override, e.g. CRAWL_CONCURRENCY=100",
+    )
+    parser.add_argument("--config", default="test", help="config_map key")
+    parser.add_argument(
+        "--database-url", help="database URL (default: temporary SQLite)"
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    settings = ServerSettings(
+        **{
+            name: getattr(args, name)
+            for name in ServerSettings._fields
+        }
+    )
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        overrides[key] = parse_value(value)
+    report = run_benchmark(
+        settings,
+        config=args.config,
+        database_url=args.database_url,
+        overrides=overrides,
+        phases=args.phase or PHASES,
+    )
+    if args.save_baseline:
+        save_baseline(report, args.baseline)
+        baseline = None
+    else:
+        baseline = load_baseline(args.baseline)
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(format_report(report, baseline))
+    if baseline is None:
+        return 0
+    if baseline["settings"] != report["settings"]:
+        print("Baseline has been recorded with other settings")
+    regressions = compare(report, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+import asyncio
+import json
+import resource
+import sys
+import tempfile
+import time
+import typing as t
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from project import create_app, db
+from project.main.models import ParseRun, User
+from project.main.parser import (
+    FetchFailure,
+    commit_parsed,
+    crawl,
+    create_sites_list,
+)
+from project.main.timing import percentile
+
+from .server import ServerSettings, SyntheticServer
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+PHASES = ("crawl", "create_sites_list", "commit_parsed")
+# metric name and whether it's better when higher
+METRICS = (
+    ("urls_per_second", True),
+    ("latency_p95_ms", False),
+    ("peak_rss_mb", False),
+    ("db_write_seconds", False),
+)
+CRAWL_SETTINGS = {"CRAWL_TIMEOUT": 2}
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+
+
+class WriteTimer:
+    """Measure the time spent writing to the database.
+
+    Insert, update and delete statements and session commits are timed,
+    statements flushed by a commit count once, as a part of the commit.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): engine to time statements of
+    """
+
+    def __init__(self, engine: t.Any) -> None:
+        self.engine = engine
+        self.seconds = 0.0
+        self._statement_start = None
+        self._commit_start = None
+
+    def _before_execute(self, conn, cursor, statement, *args) -> None:
+        verb = statement.lstrip()[:6].upper()
+        if self._commit_start is None and verb in WRITE_STATEMENTS:
+            self._statement_start = time.perf_counter()
+
+    def _after_execute(self, *args) -> None:
+        if self._statement_start is not None:
+            self.seconds += time.perf_counter() - self._statement_start
+            self._statement_start = None
+
+    def _before_commit(self, session) -> None:
+        self._commit_start = time.perf_counter()
+
+    def _after_commit(self, session) -> None:
+        if self._commit_start is not None:
+            self.seconds += time.perf_counter() - self._commit_start
+            self._commit_start = None
+
+    @property
+    def _listeners(self) -> t.List[t.Tuple[t.Any, str, t.Callable]]:
+        return [
+            (self.engine, "before_cursor_execute", self._before_execute),
+            (self.engine, "after_cursor_execute", self._after_execute),
+            (Session, "before_commit", self._before_commit),
+            (Session, "after_commit", self._after_commit),
+        ]
+
+    def __enter__(self) -> "WriteTimer":
+        for target, name, listener in self._listeners:
+            event.listen(target, name, listener)
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        for target, name, listener in self._listeners:
+            event.remove(target, name, listener)
+
+
+def get_peak_rss() -> float:
+    """Get peak resident set size of the process in megabytes.
+
+    Returns:
+        float: peak RSS, it never goes down within the process
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_crawl(file_path: Path) -> t.Tuple[t.Counter[str], t.List[float]]:
+    """Drive crawl() directly, without parsing titles.
+
+    Args:
+        file_path (Path): file with links
+
+    Returns:
+        Tuple[Counter[str], List[float]]: number of 'parsed' and 'failed'
+        links, time to the first byte of every request in milliseconds
+    """
+    counters = Counter()
+    fetch_stats = []
+
+    async def consume() -> None:
+        async for item in crawl(str(file_path), fetch_stats=fetch_stats):
+            if isinstance(item, FetchFailure):
+                counters["failed"] += 1
+            else:
+                counters["parsed"] += 1
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(consume())
+    finally:
+        loop.close()
+    return counters, [stat["ttfb"] for stat in fetch_stats]
+
+
+def run_create_sites_list(
+    user: User, file_path: Path
+) -> t.Tuple[t.Counter[str], t.List[float]]:
+    """Drive create_sites_list(), sites aren't kept.
+
+    Args:
+        user (User): User model instance
+        file_path (Path): file with links
+
+    Returns:
+        Tuple[Counter[str], List[float]]: number of 'parsed' and 'failed'
+        links, time to the response headers of the parsed ones
+        in milliseconds
+    """
+    counters = Counter()
+    latencies = [
+        site["scrapping_time"]
+        for site in create_sites_list(user, str(file_path), counters)
+    ]
+    return counters, latencies
+
+
+def run_commit_parsed(
+    user: User, file_path: Path
+) -> t.Tuple[t.Counter[str], t.Optional[float]]:
+    """Drive commit_parsed() within a parse run.
+
+    Args:
+        user (User): User model instance
+        file_path (Path): file with links
+
+    Returns:
+        Tuple[Counter[str], Optional[float]]: number of 'parsed' and
+        'failed' links, p95 time to the first byte in milliseconds
+    """
+    run = ParseRun(
+        user_id=user.id, file_name=file_path.name, file_path=str(file_path)
+    )
+    run.commit_to_db()
+    counters = commit_parsed(user, file_path, run)
+    ttfb = (run.stats.get("timings") or {}).get("ttfb") or {}
+    return counters, ttfb.get("p95")
+
+
+def measure(
+    function: t.Callable[[], t.Tuple[t.Counter[str], t.Any]]
+) -> t.Dict[str, t.Any]:
+    """Run the benchmark phase and collect its metrics.
+
+    Args:
+        function (Callable[[], Tuple[Counter[str], Any]]): phase returning
+            link counters and either latencies or their p95
+
+    Returns:
+        Dict[str, Any]: phase metrics
+    """
+    with WriteTimer(db.engine) as timer:
+        start = time.perf_counter()
+        counters, latency = function()
+        seconds = time.perf_counter() - start
+    if isinstance(latency, list):
+        latency = percentile(
+            sorted(value for value in latency if value is not None), 95
+        )
+    urls = counters["parsed"] + counters["failed"]
+    return {
+        "urls": urls,
+        "parsed": counters["parsed"],
+        "failed": counters["failed"],
+        "seconds": round(seconds, 3),
+        "urls_per_second": round(urls / seconds, 1) if seconds else None,
+        "latency_p95_ms": None if latency is None else round(latency, 1),
+        "peak_rss_mb": round(get_peak_rss(), 1),
+        "db_write_seconds": round(timer.seconds, 3),
+    }
+
+
+def run_benchmark(
+    settings: ServerSettings,
+    config: str = "test",
+    database_url: t.Optional[str] = None,
+    overrides: t.Optional[t.Dict[str, t.Any]] = None,
+    phases: t.Sequence[str] = PHASES,
+) -> t.Dict[str, t.Any]:
+    """Crawl the synthetic sites with every phase in turn.
+
+    Every phase crawls all the sites from scratch: crawl() alone,
+    create_sites_list() adding title parsing and commit_parsed() adding
+    database writes. The database is a new SQLite file unless the URL
+    is given, its tables are created if missing. Peak RSS is the peak
+    of the whole process so far, so it's growing phase by phase.
+
+    Args:
+        settings (ServerSettings): synthetic server settings
+        config (str, optional): config_map key. Defaults to "test".
+        database_url (Optional[str], optional): database to write sites
+            to. Defaults to None.
+        overrides (Optional[Dict[str, Any]], optional): app config values
+            overriding the config ones. Defaults to None.
+        phases (Sequence[str], optional): phases to run. Defaults to PHASES.
+
+    Returns:
+        Dict[str, Any]: report with the settings and metrics of the phases
+    """
+    overrides = {**CRAWL_SETTINGS, **(overrides or {})}
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as directory:
+        app = create_app(config)
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI=(
+                database_url or f"sqlite:///{Path(directory) / 'db.sqlite3'}"
+            ),
+            **overrides,
+        )
+        file_path = Path(directory) / "links.txt"
+        with SyntheticServer(settings) as server, app.app_context():
+            file_path.write_text("\n".join(server.urls))
+            db.create_all()
+            user = User(
+                username=f"benchmark-{uuid.uuid4().hex[:8]}", password=""
+            )
+            user.commit_to_db()
+            runs = {
+                "crawl": lambda: run_crawl(file_path),
+                "create_sites_list": lambda: run_create_sites_list(
+                    user, file_path
+                ),
+                "commit_parsed": lambda: run_commit_parsed(user, file_path),
+            }
+            report = {}
+            for phase in phases:
+                report[phase] = measure(runs[phase])
+                # robots.txt rules cached by the phase aren't kept
+                db.session.rollback()
+            db.session.remove()
+    return {
+        "settings": settings._asdict(),
+        "config": overrides,
+        "phases": report,
+    }
+
+
+def compare(
+    report: t.Dict[str, t.Any],
+    baseline: t.Dict[str, t.Any],
+    tolerance: float = 0.2,
+) -> t.List[str]:
+    """Find metrics which have got worse than the baseline ones
+    by more than the tolerance.
+
+    Args:
+        report (Dict[str, Any]): run_benchmark() report
+        baseline (Dict[str, Any]): baseline report
+        tolerance (float, optional): allowed relative change.
+            Defaults to 0.2.
+
+    Returns:
+        List[str]: regression descriptions
+    """
+    regressions = []
+    for phase, metrics in report["phases"].items():
+        expected = baseline["phases"].get(phase, {})
+        for name, higher_is_better in METRICS:
+            value, base = metrics.get(name), expected.get(name)
+            if value is None or not base:
+                continue
+            change = (value - base) / base
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(
+                    f"{phase} {name}: {value} vs {base} ({change:+.0%})"
+                )
+    return regressions
+
+
+def format_report(
+    report: t.Dict[str, t.Any], baseline: t.Optional[t.Dict[str, t.Any]]
+) -> str:
+    """Format the report as a table, with the baseline values if given.
+
+    Args:
+        report (Dict[str, Any]): run_benchmark() report
+        baseline (Optional[Dict[str, Any]]): baseline report
+
+    Returns:
+        str: table text
+    """
+    names = ["urls", "seconds", *(name for name, _ in METRICS)]
+    lines = [f"{'phase':<20}" + "".join(f"{name:>18}" for name in names)]
+    for phase, metrics in report["phases"].items():
+        lines.append(
+            f"{phase:<20}"
+            + "".join(f"{str(metrics[name]):>18}" for name in names)
+        )
+        expected = (baseline or {}).get("phases", {}).get(phase)
+        if expected:
+            lines.append(
+                f"{'  baseline':<20}"
+                + "".join(
+                    f"{str(expected.get(name)):>18}" for name in names
+                )
+            )
+    return "\n".join(lines)
+
+
+def load_baseline(path: Path) -> t.Optional[t.Dict[str, t.Any]]:
+    """Load the saved baseline report.
+
+    Args:
+        path (Path): baseline file path
+
+    Returns:
+        Optional[Dict[str, Any]]: baseline report, None if there's none
+    """
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def save_baseline(report: t.Dict[str, t.Any], path: Path) -> None:
+    """Save the report as the baseline.
+
+    Args:
+        report (Dict[str, Any]): run_benchmark() report
+        path (Path): baseline file path
+    """
+    path.write_text(json.dumps(report, indent=4, sort_keys=True) + "\n")
@@ -0,0 +1,229 @@
+import asyncio
+import multiprocessing
+import random
+import socket
+import typing as t
+
+from aiohttp import web
+
+
+class ServerSettings(t.NamedTuple):
+    """Synthetic sites served by the benchmark server.
+
+    Every site is a single page, its error, timeout and redirect fate is
+    drawn once from the seed, so repeated requests of the site behave
+    the same way. Response latency is drawn for every request from a
+    log-normal distribution with the given median and shape.
+
+    Attributes:
+        sites (int): number of sites
+        hosts (int): number of loopback addresses the sites are spread
+            over, 127.0.0.1 and up
+        latency (float): median response latency in seconds
+        latency_sigma (float): log-normal shape, 0 for a fixed latency
+        page_size (int): page size in bytes
+        title_position (float): fraction of the page preceding the title
+        error_rate (float): fraction of sites failing with 500
+        timeout_rate (float): fraction of sites hanging for timeout seconds
+        timeout (float): number of seconds timed out sites hang for
+        redirect_rate (float): fraction of sites redirecting to their page
+        seed (int): random seed
+    """
+
+    sites: int = 2000
+    hosts: int = 8
+    latency: float = 0.05
+    latency_sigma: float = 0.5
+    page_size: int = 32 * 1024
+    title_position: float = 0.0
+    error_rate: float = 0.01
+    timeout_rate: float = 0.0
+    timeout: float = 5.0
+    redirect_rate: float = 0.05
+    seed: int = 0
+
+
+def get_urls(settings: ServerSettings, port: int) -> t.List[str]:
+    """Get URLs of the synthetic sites.
+
+    Args:
+        settings (ServerSettings): server settings
+        port (int): server port
+
+    Returns:
+        List[str]: site URLs
+    """
+    return [
+        f"http://127.0.0.{number % settings.hosts + 1}:{port}/site/{number}/"
+        for number in range(settings.sites)
+    ]
+
+
+def get_fate(settings: ServerSettings, number: int) -> str:
+    """Get the behaviour of the site.
+
+    Args:
+        settings (ServerSettings): server settings
+        number (int): site number
+
+    Returns:
+        str: 'error', 'timeout', 'redirect' or 'ok'
+    """
+    value = random.Random(settings.seed * 1000003 + number).random()
+    for fate, rate in (
+        ("error", settings.error_rate),
+        ("timeout", settings.timeout_rate),
+        ("redirect", settings.redirect_rate),
+    ):
+        if value < rate:
+            return fate
+        value -= rate
+    return "ok"
+
+
+def create_page(settings: ServerSettings, number: int) -> bytes:
+    """Create the site page of page_size bytes with the title placed
+    after title_position of the page.
+
+    Args:
+        settings (ServerSettings): server settings
+        number (int): site number
+
+    Returns:
+        bytes: HTML page
+    """
+    head = "<html><head><style>"
+    title = f"</style><title>Site {number}</title></head><body>"
+    tail = "</body></html>"
+    padding = max(settings.page_size - len(head + title + tail), 0)
+    before = int(padding * min(max(settings.title_position, 0), 1))
+    return (
+        f"{head}{'x' * before}{title}{'x' * (padding - before)}{tail}"
+    ).encode()
+
+
+def create_app(settings: ServerSettings) -> web.Application:
+    """Create aiohttp application serving the synthetic sites.
+
+    Args:
+        settings (ServerSettings): server settings
+
+    Returns:
+        web.Application: aiohttp application
+    """
+    rng = random.Random(settings.seed)
+
+    async def delay() -> None:
+        if settings.latency_sigma:
+            await asyncio.sleep(
+                rng.lognormvariate(0, settings.latency_sigma)
+                * settings.latency
+            )
+        else:
+            await asyncio.sleep(settings.latency)
+
+    def get_number(request: web.Request) -> int:
+        number = int(request.match_info["number"])
+        if not 0 <= number < settings.sites:
+            raise web.HTTPNotFound()
+        return number
+
+    async def site(request: web.Request) -> web.Response:
+        number = get_number(request)
+        fate = get_fate(settings, number)
+        if fate == "timeout":
+            await asyncio.sleep(settings.timeout)
+        await delay()
+        if fate == "error":
+            raise web.HTTPInternalServerError()
+        if fate == "redirect":
+            raise web.HTTPFound(f"/site/{number}/home/")
+        return page(number)
+
+    async def home(request: web.Request) -> web.Response:
+        number = get_number(request)
+        await delay()
+        return page(number)
+
+    def page(number: int) -> web.Response:
+        return web.Response(
+            body=create_page(settings, number),
+            content_type="text/html",
+        )
+
+    app = web.Application()
+    app.router.add_get("/site/{number}/", site)
+    app.router.add_get("/site/{number}/home/", home)
+    return app
+
+
+def get_free_port() -> int:
+    """Get a free TCP port on the loopback interface.
+
+    Returns:
+        int: port number
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(settings: ServerSettings, port: int, ready: t.Any) -> None:
+    """Serve the synthetic sites on every host until terminated.
+
+    Args:
+        settings (ServerSettings): server settings
+        port (int): port to listen on
+        ready (multiprocessing.Event): event set once the server listens
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    runner = web.AppRunner(create_app(settings), access_log=None)
+    loop.run_until_complete(runner.setup())
+    for host in range(1, settings.hosts + 1):
+        site = web.TCPSite(runner, f"127.0.0.{host}", port, backlog=1024)
+        loop.run_until_complete(site.start())
+    ready.set()
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+
+class SyntheticServer:
+    """Benchmark server running in a separate process, so its memory
+    and CPU time don't count against the crawler.
+
+    Loopback addresses other than 127.0.0.1 are available on Linux only.
+
+    Args:
+        settings (ServerSettings): server settings
+    """
+
+    def __init__(self, settings: ServerSettings) -> None:
+        self.settings = settings
+        self.port = get_free_port()
+        self._process = None
+
+    @property
+    def urls(self) -> t.List[str]:
+        return get_urls(self.settings, self.port)
+
+    def __enter__(self) -> "SyntheticServer":
+        context = multiprocessing.get_context("spawn")
+        ready = context.Event()
+        self._process = context.Process(
+            target=serve, args=(self.settings, self.port, ready), daemon=True
+        )
+        self._process.start()
+        if not ready.wait(timeout=30):
+            self.__exit__()
+            raise RuntimeError("Benchmark server hasn't started")
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
@@ -1,7 +1,10 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from flask import Flask
+from flask.logging import default_handler
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
@@ -24,11 +27,16 @@ def initialize_extensions(app: Flask) -> Flask:
     Returns:
         Flask: Flask app instance with initialized extentions
     """
+    from .main import metrics
+    from .main.jobs import runner
+
     db.init_app(app)
     login.init_app(app)
     login.login_view = "main_app.login_view"
     csrf.init_app(app)
     migrate.init_app(app, db)
+    runner.init_app(app)
+    metrics.init_app(app)
 
     return app
 
@@ -39,11 +47,23 @@ def register_blueprints(app: Flask) -> None:
     app.register_blueprint(main_blueprint)
 
 
+def register_commands(app: Flask) -> None:
+    from .main.commands import canonicalize_urls_command, crawl_worker_command
+
+    app.cli.add_command(canonicalize_urls_command)
+    app.cli.add_command(crawl_worker_command)
+
+
 def set_logger(app: Flask) -> None:
     """Set application logger.
     Set logger handler, configure logger and assign it
     to the Flask app.
 
+    Records are put into a queue and written to the rotating log file
+    and the console by a background listener thread, so logging doesn't
+    block the crawl on I/O. The listener writes out the queued records
+    and stops on exit, or with stop_logger().
+
     Args:
         app (Flask): Flask app instance
     """
@@ -52,12 +72,35 @@ def set_logger(app: Flask) -> None:
     )
     handler = RotatingFileHandler(
         BASE_DIR / "logs.txt",
-        maxBytes=10000000,
-        backupCount=5,
+        maxBytes=app.config["LOG_MAX_BYTES"],
+        backupCount=app.config["LOG_BACKUP_COUNT"],
     )
     handler.setLevel(logging.DEBUG)
     handler.setFormatter(formatter)
-    app.logger.addHandler(handler)
+    handlers = [handler]
+    if default_handler in app.logger.handlers:
+        app.logger.removeHandler(default_handler)
+        handlers.append(default_handler)
+    records = queue.Queue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    app.logger.addHandler(QueueHandler(records))
+    listener.start()
+    app.extensions["log_listener"] = listener
+    atexit.register(stop_logger, app)
+
+
+def stop_logger(app: Flask) -> None:
+    """Write out the queued log records and stop the listener thread.
+
+    Processes which don't run exit handlers, e.g. multiprocessing
+    workers, have to call it themselves.
+
+    Args:
+        app (Flask): Flask app instance
+    """
+    listener = app.extensions.pop("log_listener", None)
+    if listener is not None:
+        listener.stop()
 
 
 def create_app(config: str = "dev") -> Flask:
@@ -73,8 +116,10 @@ def create_app(config: str = "dev") -> Flask:
     """
     app = Flask(__name__)
     app.config.from_object(config_map[config])
+    app.config["CONFIG_NAME"] = config
     set_logger(app)
     initialize_extensions(app)
     with app.app_context():
         register_blueprints(app)
+        register_commands(app)
     return app
@@ -29,9 +29,81 @@ class BaseConfig:
     MAX_CONTENT_LENGTH = 4 * 1024 * 1024
     SQLALCHEMY_DATABASE_URI = create_db_url()
     SQLALCHEMY_TRACK_MODIFICATIONS = True
-    FILES_DIR = PROJECT_DIR / "files"
+    REPORT_CHUNK_SIZE = int(os.getenv("REPORT_CHUNK_SIZE", "1000"))
     LINKS_FILE = BASE_DIR / "links.txt"
     UPLOADS = BASE_DIR / "uploads"
+    SITES_PAGE_SIZE = int(os.getenv("SITES_PAGE_SIZE", "50"))
+    SITES_PAGE_SIZE_MAX = int(os.getenv("SITES_PAGE_SIZE_MAX", "500"))
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    LINKS_DISCOVERY_CONCURRENCY = int(
+        os.getenv("LINKS_DISCOVERY_CONCURRENCY", "20")
+    )
+    LINKS_WRITE_CHUNK_SIZE = int(os.getenv("LINKS_WRITE_CHUNK_SIZE", "1000"))
+    LINKS_BLOOM_CAPACITY = int(os.getenv("LINKS_BLOOM_CAPACITY", "1000000"))
+    LINKS_BLOOM_ERROR_RATE = float(
+        os.getenv("LINKS_BLOOM_ERROR_RATE", "0.001")
+    )
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+    # seconds between heartbeats of the runs a runner is executing and
+    # without a heartbeat after which a run is considered interrupted
+    PARSE_HEARTBEAT_INTERVAL = int(
+        os.getenv("PARSE_HEARTBEAT_INTERVAL", "30")
+    )
+    PARSE_HEARTBEAT_TIMEOUT = int(os.getenv("PARSE_HEARTBEAT_TIMEOUT", "120"))
+    CRAWL_PROCESSES = int(os.getenv("CRAWL_PROCESSES", "1"))
+    CRAWL_SHARD_BATCH_SIZE = int(os.getenv("CRAWL_SHARD_BATCH_SIZE", "100"))
+    CRAWL_WORK_TABLE = os.getenv("CRAWL_WORK_TABLE", "0") == "1"
+    CRAWL_TASK_BATCH_SIZE = int(os.getenv("CRAWL_TASK_BATCH_SIZE", "500"))
+    CRAWL_TASK_LEASE = int(os.getenv("CRAWL_TASK_LEASE", "600"))
+    CRAWL_TASK_MAX_ATTEMPTS = int(os.getenv("CRAWL_TASK_MAX_ATTEMPTS", "3"))
+    CRAWL_TASK_POLL_INTERVAL = float(
+        os.getenv("CRAWL_TASK_POLL_INTERVAL", "5")
+    )
+    CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "500"))
+    CRAWL_CONCURRENCY_MIN = int(os.getenv("CRAWL_CONCURRENCY_MIN", "8"))
+    CRAWL_CONCURRENCY_INITIAL = int(
+        os.getenv("CRAWL_CONCURRENCY_INITIAL", "50")
+    )
+    CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "30"))
+    CRAWL_QUEUE_SIZE = int(os.getenv("CRAWL_QUEUE_SIZE", "1000"))
+    # retries per retryable error class, 0 to fail at once
+    CRAWL_RETRY_ATTEMPTS = {
+        "server": int(os.getenv("CRAWL_RETRY_SERVER", "3")),
+        "timeout": int(os.getenv("CRAWL_RETRY_TIMEOUT", "2")),
+        "connection": int(os.getenv("CRAWL_RETRY_CONNECTION", "1")),
+    }
+    CRAWL_RETRY_BASE_DELAY = float(os.getenv("CRAWL_RETRY_BASE_DELAY", "1"))
+    CRAWL_RETRY_MAX_DELAY = float(os.getenv("CRAWL_RETRY_MAX_DELAY", "30"))
+    CRAWL_LOOKUP_CHUNK_SIZE = int(os.getenv("CRAWL_LOOKUP_CHUNK_SIZE", "500"))
+    CRAWL_COMMIT_CHUNK_SIZE = int(os.getenv("CRAWL_COMMIT_CHUNK_SIZE", "500"))
+    CRAWL_PER_HOST_LIMIT = int(os.getenv("CRAWL_PER_HOST_LIMIT", "8"))
+    CRAWL_PER_HOST_RATE = float(os.getenv("CRAWL_PER_HOST_RATE", "0")) or None
+    CRAWL_DNS_CACHE_TTL = int(os.getenv("CRAWL_DNS_CACHE_TTL", "300"))
+    CRAWL_KEEPALIVE_TIMEOUT = int(os.getenv("CRAWL_KEEPALIVE_TIMEOUT", "30"))
+    CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "0"))
+    # seconds a parsed site isn't crawled again for, 0 to always crawl
+    CRAWL_FRESHNESS_TTL = int(os.getenv("CRAWL_FRESHNESS_TTL", "0"))
+    CRAWL_SCOPE = os.getenv("CRAWL_SCOPE", "domain")
+    CRAWL_ALLOWED_HOSTS = tuple(
+        host.strip()
+        for host in os.getenv("CRAWL_ALLOWED_HOSTS", "").split(",")
+        if host.strip()
+    )
+    CRAWL_FRONTIER_MEMORY = int(os.getenv("CRAWL_FRONTIER_MEMORY", "100000"))
+    CRAWL_FRONTIER_SPILL_DIR = os.getenv("CRAWL_FRONTIER_SPILL_DIR") or None
+    ROBOTS_ENABLED = os.getenv("ROBOTS_ENABLED", "1") == "1"
+    ROBOTS_USER_AGENT = os.getenv("ROBOTS_USER_AGENT", "*")
+    ROBOTS_TTL = int(os.getenv("ROBOTS_TTL", "86400"))
+    ROBOTS_MAX_CRAWL_DELAY = float(os.getenv("ROBOTS_MAX_CRAWL_DELAY", "60"))
+    CRAWL_ERROR_SAMPLES = int(os.getenv("CRAWL_ERROR_SAMPLES", "3"))
+    CRAWL_FETCH_STATS = os.getenv("CRAWL_FETCH_STATS", "1") == "1"
+    CRAWL_TITLE_ONLY = os.getenv("CRAWL_TITLE_ONLY", "1") == "1"
+    CRAWL_MAX_BODY_BYTES = int(os.getenv("CRAWL_MAX_BODY_BYTES", "65536"))
+    CRAWL_EXTRACT_WORKERS = int(
+        os.getenv("CRAWL_EXTRACT_WORKERS", str(os.cpu_count() or 1))
+    )
+    CRAWL_EXTRACT_BATCH_SIZE = int(os.getenv("CRAWL_EXTRACT_BATCH_SIZE", "64"))
 
 
 class ProductionConfig(BaseConfig):
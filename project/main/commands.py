@@ -0,0 +1,39 @@
+import click
+from flask.cli import with_appcontext
+from project import db
+
+from .models import Site
+from .worktable import work_tasks
+
+
+@click.command("canonicalize-urls")
+@with_appcontext
+def canonicalize_urls_command() -> None:
+    """Bring stored site urls to their canonical form.
+
+    A one-off command to run once after upgrading a database which
+    sites have been stored before urls were canonicalized, new sites
+    are stored canonical. It goes through the whole sites table.
+    """
+    counters = Site.canonicalize_urls()
+    db.session.commit()
+    click.echo(
+        f"{counters['updated']} sites updated, "
+        f"{counters['deleted']} duplicates deleted"
+    )
+
+
+@click.command("crawl-worker")
+@click.option("--name", default=None, help="Worker name.")
+@click.option(
+    "--until-empty",
+    is_flag=True,
+    help="Exit once there are no tasks to claim.",
+)
+@with_appcontext
+def crawl_worker_command(name: str, until_empty: bool) -> None:
+    """Crawl links queued into the work table by distributed runs."""
+    counters = work_tasks(name, until_empty)
+    click.echo(
+        f"{counters['parsed']} sites parsed, {counters['failed']} failed"
+    )
@@ -0,0 +1,148 @@
+import hashlib
+import math
+import typing as t
+from array import array
+from pathlib import PosixPath
+
+
+class BloomFilter:
+    """Compact probabilistic set of strings.
+
+    Takes a couple of bytes per item instead of a whole Python string,
+    so sets of millions of URLs fit into a few megabytes. Membership
+    tests may give false positives at the configured rate, but never
+    false negatives.
+
+    Args:
+        capacity (int): expected number of items
+        error_rate (float, optional): false positive rate at full
+            capacity. Defaults to 0.001.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        capacity = max(capacity, 1)
+        self.size = max(
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 8
+        )
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[index >> 3] & (1 << (index & 7))
+            for index in self._indexes(item)
+        )
+
+    def _indexes(self, item: str) -> t.Iterator[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        for number in range(self.hashes):
+            yield (first + number * second) % self.size
+
+    def add(self, item: str) -> bool:
+        """Add the item to the set.
+
+        Args:
+            item (str): item to add
+
+        Returns:
+            bool: True if the item hasn't been in the set
+        """
+        added = False
+        for index in self._indexes(item):
+            mask = 1 << (index & 7)
+            if not self._bits[index >> 3] & mask:
+                self._bits[index >> 3] |= mask
+                added = True
+        self._count += added
+        return added
+
+
+class HashIndex:
+    """Exact set of 64-bit hashes stored in a flat array.
+
+    An open addressing table of 8-byte slots, doubled whenever it's
+    more than half full, so an item takes 8 bytes divided by the load
+    factor: 16 to 32 bytes, 32 right after the table has grown.
+    That's still several times less than a Python set of ints or
+    URL strings.
+
+    Args:
+        capacity (int, optional): expected number of items, the table
+            grows when it's exceeded. Defaults to 1024.
+    """
+
+    EMPTY = 0
+
+    def __init__(self, capacity: int = 1024) -> None:
+        size = 8
+        while size < capacity * 2:
+            size <<= 1
+        self._table = array("q", bytes(8 * size))
+        self._mask = size - 1
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, value: int) -> bool:
+        return self._table[self._find(value or 1)] != self.EMPTY
+
+    def _find(self, value: int) -> int:
+        index = value & self._mask
+        table = self._table
+        while table[index] != self.EMPTY and table[index] != value:
+            index = (index + 1) & self._mask
+        return index
+
+    def add(self, value: int) -> bool:
+        """Add the hash to the set.
+
+        Args:
+            value (int): signed 64-bit hash
+
+        Returns:
+            bool: True if the hash hasn't been in the set
+        """
+        value = value or 1
+        index = self._find(value)
+        if self._table[index] != self.EMPTY:
+            return False
+        self._table[index] = value
+        self._count += 1
+        if self._count * 2 > len(self._table):
+            self._grow()
+        return True
+
+    def _grow(self) -> None:
+        old = self._table
+        self._table = array("q", bytes(16 * len(old)))
+        self._mask = len(self._table) - 1
+        for value in old:
+            if value != self.EMPTY:
+                self._table[self._find(value)] = value
+
+
+def count_lines(file_path: PosixPath) -> int:
+    """Count lines of the file without loading it into memory.
+
+    Args:
+        file_path (PosixPath): file path
+
+    Returns:
+        int: number of lines, 0 if the file doesn't exist
+    """
+    if not file_path.exists():
+        return 0
+    lines = 0
+    last = b"\n"
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return lines + (last != b"\n")
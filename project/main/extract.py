@@ -0,0 +1,187 @@
+import re
+import typing as t
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+from .urls import canonicalize_url
+
+HEAD_END = re.compile(rb"</(?:title|head)\s*>", re.IGNORECASE)
+CHARSET = re.compile(rb"""charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+UNKNOWN_TITLE = "Unknown title"
+LINK_SCHEMES = frozenset(("http", "https"))
+
+
+class TitleParser(HTMLParser):
+    """Incremental HTML parser that collects the page title.
+
+    The parser can be fed by chunks and sets the 'done' flag as soon
+    as the title (or the whole document head) has been processed.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.done = False
+        self._parts: t.Optional[t.List[str]] = None
+        self._in_title = False
+
+    @property
+    def title(self) -> t.Optional[str]:
+        """Title text collected so far, None if title tag hasn't been met."""
+        if self._parts is None:
+            return None
+        return "".join(self._parts).strip()
+
+    def handle_starttag(self, tag: str, attrs: t.List[t.Any]) -> None:
+        if self.done:
+            return
+        if tag == "title" and self._parts is None:
+            self._parts = []
+            self._in_title = True
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.done:
+            return
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.done = True
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self._parts.append(data)
+
+
+def head_complete(data: bytes, start: int = 0) -> bool:
+    """Check whether the closing title or head tag is in the data.
+
+    Args:
+        data (bytes): beginning of the page body
+        start (int, optional): position to start searching from.
+            Defaults to 0.
+
+    Returns:
+        bool: True if the rest of the page isn't needed to get the title
+    """
+    return HEAD_END.search(data, start) is not None
+
+
+def decode_head(data: bytes) -> str:
+    """Decode the beginning of the page body.
+
+    Encoding is taken from the charset declared in the page
+    and falls back to UTF-8.
+
+    Args:
+        data (bytes): beginning of the page body
+
+    Returns:
+        str: decoded text, undecodable bytes are replaced
+    """
+    match = CHARSET.search(data)
+    encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return data.decode(encoding, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def extract_title(
+    data: t.Union[bytes, str], title_only: bool = False
+) -> str:
+    """Extract the page title.
+
+    Args:
+        data (Union[bytes, str]): page body
+        title_only (bool, optional): use the lightweight incremental
+            parser instead of the full BeautifulSoup parse. Defaults to False.
+
+    Returns:
+        str: page title, 'Unknown title' if the page has no title
+    """
+    if not title_only:
+        soup = BeautifulSoup(data, "lxml")
+        try:
+            return soup.select_one("title").text.strip()
+        except AttributeError:
+            return UNKNOWN_TITLE
+    parser = TitleParser()
+    parser.feed(decode_head(data) if isinstance(data, bytes) else data)
+    title = parser.title
+    return UNKNOWN_TITLE if title is None else title
+
+
+def extract_titles(
+    bodies: t.List[t.Union[bytes, str]], title_only: bool = False
+) -> t.List[str]:
+    """Extract titles of the batch of pages.
+
+    Meant to be run in a worker process, so the batch is
+    transferred between processes at once.
+
+    Args:
+        bodies (List[Union[bytes, str]]): page bodies
+        title_only (bool, optional): use the lightweight incremental
+            parser. Defaults to False.
+
+    Returns:
+        List[str]: page titles in the same order as bodies
+    """
+    return [extract_title(body, title_only) for body in bodies]
+
+
+def resolve_link(base_url: str, href: str) -> t.Optional[str]:
+    """Resolve the link against the page URL.
+
+    Args:
+        base_url (str): URL of the page the link has been found on
+        href (str): link href value
+
+    Returns:
+        Optional[str]: canonical absolute URL, None if the link doesn't
+        lead to a web page (e.g. 'mailto:' or 'javascript:' links)
+    """
+    try:
+        url = urljoin(base_url, href.strip())
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in LINK_SCHEMES or not parts.netloc:
+        return None
+    return canonicalize_url(url)
+
+
+def extract_links(
+    data: t.Union[bytes, str], base_url: str, selector: str = "a"
+) -> t.List[str]:
+    """Extract absolute URLs of the page links.
+
+    Links are resolved against the page URL or its <base> tag and
+    deduplicated keeping the order they appear on the page.
+
+    Args:
+        data (Union[bytes, str]): page body
+        base_url (str): page URL
+        selector (str, optional): CSS selector of link elements.
+            Defaults to "a".
+
+    Returns:
+        List[str]: resolved URLs
+    """
+    soup = BeautifulSoup(data, "lxml")
+    base = soup.select_one("base[href]")
+    if base is not None:
+        base_url = urljoin(base_url, base["href"].strip())
+    links = {}
+    for element in soup.select(selector):
+        href = element.get("href")
+        if href is None:
+            continue
+        link = resolve_link(base_url, href)
+        if link is not None:
+            links[link] = None
+    return list(links)
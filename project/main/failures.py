@@ -0,0 +1,94 @@
+import random
+import typing as t
+from collections import Counter
+
+from .scheduler import get_host
+
+
+class ErrorAggregator:
+    """Aggregate of the crawl failures logged once per run.
+
+    Failures are counted by the error class, host and response status,
+    a few examples of every error class are kept by reservoir sampling,
+    so they come from the whole run rather than from its beginning.
+
+    Args:
+        samples (int, optional): number of examples kept per error class.
+            Defaults to 3.
+        top (int, optional): number of hosts with the most failures
+            in the summary. Defaults to 10.
+    """
+
+    def __init__(self, samples: int = 3, top: int = 10) -> None:
+        self.samples = samples
+        self.top = top
+        self.failed = 0
+        self.errors: t.Counter[str] = Counter()
+        self.hosts: t.Counter[str] = Counter()
+        self.statuses: t.Counter[str] = Counter()
+        self.examples: t.Dict[str, t.List[t.Dict[str, t.Any]]] = {}
+
+    def __len__(self) -> int:
+        return self.failed
+
+    def add(
+        self,
+        url: str,
+        error: str,
+        status: t.Optional[int] = None,
+        message: t.Optional[str] = None,
+    ) -> None:
+        """Count the failure.
+
+        Args:
+            url (str): failed URL
+            error (str): error class name
+            status (Optional[int], optional): response status.
+                Defaults to None.
+            message (Optional[str], optional): error message.
+                Defaults to None.
+        """
+        self.failed += 1
+        self.errors[error] += 1
+        self.hosts[get_host(url)] += 1
+        if status is not None:
+            self.statuses[str(status)] += 1
+        examples = self.examples.setdefault(error, [])
+        example = {"url": url, "status": status, "message": message}
+        if len(examples) < self.samples:
+            examples.append(example)
+            return
+        index = random.randrange(self.errors[error])
+        if index < self.samples:
+            examples[index] = example
+
+    def merge(self, summary: t.Dict[str, t.Any]) -> None:
+        """Add the summary of another aggregator, e.g. of a crawl shard.
+
+        Examples are only added while there's room for them.
+
+        Args:
+            summary (Dict[str, Any]): summary() result
+        """
+        self.failed += summary["failed"]
+        self.errors.update(summary["errors"])
+        self.hosts.update(summary["hosts"])
+        self.statuses.update(summary["statuses"])
+        for error, examples in summary["examples"].items():
+            kept = self.examples.setdefault(error, [])
+            kept.extend(examples[: self.samples - len(kept)])
+
+    def summary(self) -> t.Dict[str, t.Any]:
+        """Get the JSON serializable summary of the failures.
+
+        Returns:
+            Dict[str, Any]: 'failed' count, counts by 'errors', 'hosts'
+            (the top ones only) and 'statuses', 'examples' by the error
+        """
+        return {
+            "failed": self.failed,
+            "errors": dict(self.errors.most_common()),
+            "hosts": dict(self.hosts.most_common(self.top)),
+            "statuses": dict(self.statuses.most_common()),
+            "examples": self.examples,
+        }
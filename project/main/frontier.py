@@ -0,0 +1,188 @@
+import heapq
+import itertools
+import tempfile
+import typing as t
+from collections import Counter
+from pathlib import Path
+
+from .dedup import HashIndex
+from .scheduler import get_host
+from .urls import url_hash
+
+
+class Scope:
+    """Hosts a multi-depth crawl is allowed to expand to.
+
+    Hosts match themselves and all their subdomains, a leading 'www.'
+    is ignored, so 'www.example.com' lets the crawl into
+    'blog.example.com' as well.
+
+    Args:
+        hosts (Optional[Iterable[str]], optional): allowed hosts,
+            any host is allowed if None. Defaults to None.
+    """
+
+    def __init__(self, hosts: t.Optional[t.Iterable[str]] = None) -> None:
+        self.hosts = None
+        if hosts is not None:
+            self.hosts = set()
+            for host in hosts:
+                self.add(host)
+
+    @staticmethod
+    def _domain(host: str) -> str:
+        host = host.lower().strip(".")
+        return host[4:] if host.startswith("www.") else host
+
+    def add(self, host: str) -> None:
+        """Allow the host and its subdomains.
+
+        Args:
+            host (str): host name
+        """
+        if self.hosts is not None:
+            self.hosts.add(self._domain(host))
+
+    def __contains__(self, url: str) -> bool:
+        if self.hosts is None:
+            return True
+        labels = self._domain(get_host(url)).split(".")
+        return any(
+            ".".join(labels[index:]) in self.hosts
+            for index in range(len(labels))
+        )
+
+
+class Frontier:
+    """Priority queue of URLs to crawl with a visited set.
+
+    URLs are handed out by depth first, and within the same depth
+    in round-robin order of their hosts, so a single host with lots of
+    links can't crowd the others out of the crawl queue. Every URL is
+    queued once: visited URLs are kept as 64-bit hashes in a compact
+    index. When more than max_items URLs are queued, new ones are spilled
+    to per-depth files on disk and loaded back in batches when the
+    in-memory queue runs out of URLs of their depth.
+
+    Args:
+        max_items (int, optional): maximum number of URLs kept in memory.
+            Defaults to 100000.
+        spill_dir (Optional[str], optional): directory to create spill
+            files in, system temporary directory if None. Defaults to None.
+    """
+
+    def __init__(
+        self, max_items: int = 100000, spill_dir: t.Optional[str] = None
+    ) -> None:
+        self.max_items = max(max_items, 2)
+        self.visited = HashIndex()
+        self.spilled = 0
+        self._heap: t.List[t.Tuple[int, int, int, str]] = []
+        self._host_counts: t.Counter[str] = Counter()
+        self._sequence = itertools.count()
+        self._spill_dir = None
+        self._spill_root = spill_dir
+        self._writers: t.Dict[int, t.TextIO] = {}
+        self._readers: t.Dict[int, t.TextIO] = {}
+        self._on_disk: t.Counter[int] = Counter()
+
+    def __len__(self) -> int:
+        return len(self._heap) + sum(self._on_disk.values())
+
+    def push(self, url: str, depth: int) -> bool:
+        """Queue the URL unless it has already been queued.
+
+        Args:
+            url (str): canonical URL
+            depth (int): number of links followed from the seed URL
+
+        Returns:
+            bool: True if the URL has been queued
+        """
+        if not self.visited.add(url_hash(url)):
+            return False
+        if len(self._heap) < self.max_items:
+            self._push(url, depth)
+        else:
+            self._spill(url, depth)
+        return True
+
+    def pop(self) -> t.Optional[t.Tuple[str, int]]:
+        """Get the URL to crawl next.
+
+        Returns:
+            Optional[Tuple[str, int]]: URL and its depth,
+            None if the frontier is empty
+        """
+        if self._on_disk:
+            depth = min(self._on_disk)
+            if not self._heap or self._heap[0][0] > depth:
+                self._load(depth)
+        if not self._heap:
+            return None
+        depth, _, _, url = heapq.heappop(self._heap)
+        return url, depth
+
+    def pop_many(self, size: int) -> t.List[t.Tuple[str, int]]:
+        """Get up to size URLs to crawl next.
+
+        Args:
+            size (int): maximum number of URLs
+
+        Returns:
+            List[Tuple[str, int]]: URLs and their depths
+        """
+        items = []
+        while len(items) < size:
+            item = self.pop()
+            if item is None:
+                break
+            items.append(item)
+        return items
+
+    def close(self) -> None:
+        """Remove the spill files."""
+        for file in [*self._writers.values(), *self._readers.values()]:
+            file.close()
+        self._writers.clear()
+        self._readers.clear()
+        self._on_disk.clear()
+        if self._spill_dir is not None:
+            self._spill_dir.cleanup()
+            self._spill_dir = None
+
+    def _push(self, url: str, depth: int) -> None:
+        host = get_host(url)
+        self._host_counts[host] += 1
+        heapq.heappush(
+            self._heap,
+            (depth, self._host_counts[host], next(self._sequence), url),
+        )
+
+    def _spill(self, url: str, depth: int) -> None:
+        writer = self._writers.get(depth)
+        if writer is None:
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.TemporaryDirectory(
+                    prefix="frontier-", dir=self._spill_root
+                )
+            path = Path(self._spill_dir.name) / f"depth-{depth}.txt"
+            writer = self._writers[depth] = open(path, "w")
+            self._readers[depth] = open(path, "r")
+        writer.write(f"{url}\n")
+        self._on_disk[depth] += 1
+        self.spilled += 1
+
+    def _load(self, depth: int) -> None:
+        self._writers[depth].flush()
+        reader = self._readers[depth]
+        count = min(self.max_items // 2 or 1, self._on_disk[depth])
+        for _ in range(count):
+            self._push(reader.readline().rstrip("\n"), depth)
+        self._on_disk[depth] -= count
+        if not self._on_disk[depth]:
+            del self._on_disk[depth]
+            self._writers.pop(depth).close()
+            reader = self._readers.pop(depth)
+            Path(reader.name).unlink()
+            reader.close()
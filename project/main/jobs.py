@@ -0,0 +1,196 @@
+import threading
+import time
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from flask import Flask
+
+from project import db
+
+from .models import ParseRun
+
+
+def _as_utc(date: datetime) -> datetime:
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+class JobRunner:
+    """In-process runner of background parse runs.
+
+    Runs are executed by a pool of worker threads, each one inside
+    its own application context. Run status, counters and errors
+    are persisted on the ParseRun records, so web workers only
+    have to enqueue a run and return. The runner keeps the heartbeat
+    of its runs in the database every PARSE_HEARTBEAT_INTERVAL
+    seconds, so any process can tell a live run from an interrupted one.
+    """
+
+    def __init__(self, app: t.Optional[Flask] = None) -> None:
+        self.app = None
+        self.executor = None
+        self.active: t.Set[int] = set()
+        self._heartbeat: t.Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Bind the runner to the application and start worker pool.
+
+        Args:
+            app (Flask): Flask app instance
+        """
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config["PARSE_WORKERS"],
+            thread_name_prefix="parse-run",
+        )
+
+    def enqueue(self, run: ParseRun, resume: bool = False) -> Future:
+        """Schedule the parse run execution.
+
+        Args:
+            run (ParseRun): committed ParseRun instance
+            resume (bool, optional): continue the run from its checkpoint.
+                Defaults to False.
+
+        Returns:
+            Future: future resolved when the run is over
+        """
+        self.active.add(run.id)
+        self._start_heartbeat()
+        return self.executor.submit(self.execute, run.id, resume)
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(
+                    target=self._beat, name="parse-run-heartbeat", daemon=True
+                )
+                self._heartbeat.start()
+
+    def _beat(self) -> None:
+        interval = self.app.config["PARSE_HEARTBEAT_INTERVAL"]
+        while True:
+            time.sleep(interval)
+            if not self.active:
+                continue
+            with self.app.app_context():
+                try:
+                    ParseRun.beat(list(self.active))
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.warning(
+                        {"heartbeat": e.__class__.__name__}
+                    )
+                finally:
+                    db.session.remove()
+
+    def stale_since(self) -> datetime:
+        """Get the time active runs without a heartbeat since are
+        considered interrupted.
+
+        Returns:
+            datetime: UTC time
+        """
+        return datetime.utcnow() - timedelta(
+            seconds=self.app.config["PARSE_HEARTBEAT_TIMEOUT"]
+        )
+
+    def claim(self, run: ParseRun) -> bool:
+        """Queue the interrupted run again for resuming.
+
+        Only one of the processes resuming the run at once succeeds,
+        the run has to be enqueued by the caller then.
+
+        Args:
+            run (ParseRun): interrupted ParseRun instance
+
+        Returns:
+            bool: True if the run has been claimed by this call
+        """
+        return ParseRun.claim_interrupted(run.id, self.stale_since())
+
+    def is_orphaned(self, run: ParseRun) -> bool:
+        """Whether the run has been interrupted and may be resumed.
+
+        Runs are considered interrupted if they've failed or if they
+        are still marked as active, but their heartbeat has stopped for
+        PARSE_HEARTBEAT_TIMEOUT seconds (e.g. the process executing them
+        has been restarted), whichever process runs them. Distributed
+        runs which links have all been queued are handled by the crawl
+        workers instead.
+
+        Args:
+            run (ParseRun): ParseRun instance
+
+        Returns:
+            bool: True if the run may be resumed
+        """
+        if run.status == ParseRun.FAILED:
+            return True
+        if run.distributed and run.stats is not None:
+            return False
+        return run.is_active and (
+            run.heartbeat_at is None
+            or _as_utc(run.heartbeat_at) < self.stale_since()
+        )
+
+    def execute(self, run_id: int, resume: bool = False) -> None:
+        """Execute the parse run and persist its outcome.
+
+        Distributed runs only get their links queued into the work
+        table, they are finished by the crawl workers.
+
+        Args:
+            run_id (int): ParseRun id
+            resume (bool, optional): continue the run from its checkpoint.
+                Defaults to False.
+        """
+        with self.app.app_context():
+            from .parser import commit_parsed
+            from .worktable import enqueue_tasks, finish_run
+
+            run = ParseRun.query.get(run_id)
+            run.status = ParseRun.RUNNING
+            run.error = None
+            run.heartbeat_at = datetime.utcnow()
+            if not resume or run.started_at is None:
+                run.started_at = datetime.utcnow()
+            run.commit_to_db()
+            try:
+                if run.distributed:
+                    run.stats = {
+                        "tasks": enqueue_tasks(run, Path(run.file_path))
+                    }
+                    finish_run(run)
+                else:
+                    counters = commit_parsed(
+                        run.user, Path(run.file_path), run, resume
+                    )
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception(
+                    {"run": run_id, "error": e.__class__.__name__}
+                )
+                run.status = ParseRun.FAILED
+                run.error = f"{e.__class__.__name__}: {e}"
+                run.finished_at = datetime.utcnow()
+            else:
+                if not run.distributed:
+                    run.status = ParseRun.FINISHED
+                    run.parsed = counters["parsed"]
+                    run.failed = counters["failed"]
+                    run.finished_at = datetime.utcnow()
+            finally:
+                run.commit_to_db()
+                db.session.remove()
+                self.active.discard(run_id)
+
+
+runner = JobRunner()
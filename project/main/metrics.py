@@ -0,0 +1,377 @@
+import abc
+import bisect
+import threading
+import time
+import typing as t
+
+from flask import Flask, g, request
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+Key = t.Tuple[str, ...]
+
+
+class Registry:
+    """Collection of the process metrics rendered by the /metrics route.
+
+    Metrics are aggregated per process: worker processes of a sharded
+    crawl send theirs to the parent process when they are over,
+    'flask crawl-worker' processes keep theirs to themselves.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: t.Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Render all the metrics in Prometheus text format.
+
+        Returns:
+            str: text exposition
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self) -> t.Dict[str, t.Dict[Key, t.Any]]:
+        """Get values of all the metrics to be sent to another process.
+
+        Returns:
+            Dict[str, Dict[Key, Any]]: values by label values by name
+        """
+        return {
+            name: metric.collect() for name, metric in self._metrics.items()
+        }
+
+    def load(self, values: t.Dict[str, t.Dict[Key, t.Any]]) -> None:
+        """Add values dumped by another process to the metrics.
+
+        Args:
+            values (Dict[str, Dict[Key, Any]]): dump() result
+        """
+        for name, samples in values.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.add(samples)
+
+
+REGISTRY = Registry()
+
+
+def format_labels(names: t.Sequence[str], values: t.Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\")
+            .replace("\n", "\\n")
+            .replace('"', '\\"'),
+        )
+        for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}"
+
+
+class Metric(abc.ABC):
+    """Base class of the metrics.
+
+    Every thread updates its own copy of the values, so updates take
+    no locks and never get lost. Copies are summed up on collection,
+    copies of finished threads are folded into a single one.
+
+    Args:
+        name (str): metric name
+        documentation (str): metric description
+        labels (Sequence[str], optional): label names. Defaults to ().
+        registry (Registry, optional): registry to add the metric to.
+            Defaults to REGISTRY.
+    """
+
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: t.Sequence[str] = (),
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: t.Dict[threading.Thread, t.Dict[Key, t.Any]] = {}
+        self._finished: t.Dict[Key, t.Any] = {}
+        registry.register(self)
+
+    def _key(self, labels: t.Dict[str, t.Any]) -> Key:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _shard(self) -> t.Dict[Key, t.Any]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards[threading.current_thread()] = values
+            return values
+
+    @abc.abstractmethod
+    def _merge(
+        self, target: t.Dict[Key, t.Any], key: Key, value: t.Any
+    ) -> None:
+        """Add the value to the one of the key in the target."""
+
+    def collect(self) -> t.Dict[Key, t.Any]:
+        """Get the metric values summed up over all the threads.
+
+        Returns:
+            Dict[Key, Any]: values by label values
+        """
+        with self._lock:
+            for thread in [
+                thread for thread in self._shards if not thread.is_alive()
+            ]:
+                for key, value in self._shards.pop(thread).items():
+                    self._merge(self._finished, key, value)
+            shards = [values.copy() for values in self._shards.values()]
+            total = {}
+            for values in [self._finished, *shards]:
+                for key, value in values.items():
+                    self._merge(total, key, value)
+        return total
+
+    def add(self, values: t.Dict[Key, t.Any]) -> None:
+        """Add the values collected elsewhere.
+
+        Args:
+            values (Dict[Key, Any]): collect() result
+        """
+        shard = self._shard()
+        for key, value in values.items():
+            self._merge(shard, tuple(key), value)
+
+    def render(self) -> t.List[str]:
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for key, value in sorted(self.collect().items())
+        ]
+
+
+class Counter(Metric):
+    """Monotonically growing count."""
+
+    kind = "counter"
+
+    def _merge(
+        self, target: t.Dict[Key, t.Any], key: Key, value: t.Any
+    ) -> None:
+        target[key] = target.get(key, 0) + value
+
+    def inc(self, amount: float = 1, **labels: t.Any) -> None:
+        """Increase the count.
+
+        Args:
+            amount (float, optional): increment. Defaults to 1.
+        """
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """Value going up and down, e.g. the number of requests in flight."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: t.Any) -> None:
+        """Decrease the value.
+
+        Args:
+            amount (float, optional): decrement. Defaults to 1.
+        """
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Distribution of observed values over buckets.
+
+    Args:
+        name (str): metric name
+        documentation (str): metric description
+        labels (Sequence[str], optional): label names. Defaults to ().
+        buckets (Sequence[float], optional): bucket upper bounds.
+            Defaults to DEFAULT_BUCKETS.
+        registry (Registry, optional): registry to add the metric to.
+            Defaults to REGISTRY.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: t.Sequence[str] = (),
+        buckets: t.Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def _merge(
+        self, target: t.Dict[Key, t.Any], key: Key, value: t.Any
+    ) -> None:
+        current = target.get(key)
+        if current is None:
+            target[key] = [list(value[0]), value[1]]
+            return
+        for index, count in enumerate(value[0]):
+            current[0][index] += count
+        current[1] += value[1]
+
+    def observe(self, value: float, **labels: t.Any) -> None:
+        """Record the observed value.
+
+        Args:
+            value (float): observed value, e.g. duration in seconds
+        """
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            state = shard[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def time(self, **labels: t.Any) -> "Timer":
+        """Observe the duration of the with block in seconds.
+
+        Returns:
+            Timer: context manager
+        """
+        return Timer(self, labels)
+
+    def render(self) -> t.List[str]:
+        lines = []
+        names = (*self.labels, "le")
+        for key, (counts, sum_) in sorted(self.collect().items()):
+            cumulative = 0
+            bounds = [*map(str, self.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{format_labels(names, (*key, bound))}"
+                    f" {cumulative}"
+                )
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {sum_}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Timer:
+    """Context manager observing its duration with the histogram."""
+
+    def __init__(self, histogram: Histogram, labels: t.Dict[str, t.Any]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.histogram.observe(
+            time.perf_counter() - self.start, **self.labels
+        )
+
+
+FETCHES = Counter(
+    "crawler_fetches_total",
+    "Page fetches by outcome and response status class.",
+    ("outcome", "status_class"),
+)
+FETCH_SECONDS = Histogram(
+    "crawler_fetch_seconds",
+    "Duration of the page fetches by outcome.",
+    ("outcome",),
+)
+IN_FLIGHT = Gauge(
+    "crawler_requests_in_flight",
+    "Page requests in flight.",
+)
+SLOT_WAIT_SECONDS = Histogram(
+    "crawler_slot_wait_seconds",
+    "Time crawl workers wait for the concurrency limiter and host slots.",
+    ("slot",),
+)
+EXTRACT_SECONDS = Histogram(
+    "crawler_extract_seconds",
+    "Title extraction time per batch of pages.",
+)
+UPSERT_SECONDS = Histogram(
+    "db_upsert_batch_seconds",
+    "Site bulk upsert time per batch.",
+)
+UPSERT_ROWS = Counter(
+    "db_upsert_rows_total",
+    "Sites written by bulk upserts.",
+)
+REPORT_SECONDS = Histogram(
+    "report_generation_seconds",
+    "XML report generation time.",
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Web request latency by route.",
+    ("endpoint", "method", "status"),
+)
+
+
+def init_app(app: Flask) -> None:
+    """Record latency of the app requests.
+
+    Args:
+        app (Flask): Flask app instance
+    """
+
+    @app.before_request
+    def start_timer() -> None:
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=request.endpoint or "none",
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
@@ -1,15 +1,69 @@
 import typing as t
-from datetime import datetime
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
 
 from flask import flash
 from flask_login import UserMixin
 from flask_login.utils import logout_user
 from flask_sqlalchemy import BaseQuery
 from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from project import db, login
 
+from .dedup import HashIndex
 from .errors import EmptyQueryError
+from .metrics import UPSERT_ROWS, UPSERT_SECONDS
+from .timing import PHASES, summarize
+from .urls import canonicalize_url, url_hash
+
+
+def dialect_insert(table: db.Table) -> t.Optional[t.Any]:
+    """Create INSERT statement supporting ON CONFLICT clause.
+
+    Args:
+        table (Table): table to insert into
+
+    Returns:
+        Optional[Insert]: dialect specific INSERT statement, None if the
+        database dialect doesn't support ON CONFLICT
+    """
+    insert = {
+        "postgresql": postgresql.insert,
+        "sqlite": sqlite.insert,
+    }.get(db.engine.dialect.name)
+    return None if insert is None else insert(table)
+
+
+# bind parameters a single statement may take, SQLite builds before
+# 3.32 don't allow more than 999
+MAX_BIND_PARAMS = {"postgresql": 65535, "sqlite": 999}
+
+
+def insert_batches(
+    rows: t.List[t.Dict[str, t.Any]]
+) -> t.Iterator[t.List[t.Dict[str, t.Any]]]:
+    """Split rows of a multi-row INSERT into batches the database takes.
+
+    Every batch has as many rows as fit into MAX_BIND_PARAMS
+    of the dialect, one bind parameter per column of a row, less one
+    row leaving room for the parameters of the rest of the statement.
+
+    Args:
+        rows (List[Dict[str, Any]]): column names and values
+
+    Yields:
+        Iterator[List[Dict[str, Any]]]: batches of the rows
+    """
+    if not rows:
+        return
+    limit = MAX_BIND_PARAMS.get(db.engine.dialect.name, 999)
+    size = max(limit // len(rows[0]) - 1, 1)
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
 
 
 class DBModelMixin:
@@ -59,6 +113,12 @@ class User(db.Model, UserMixin, DBModelMixin):
         backref="user",
         lazy=True,
     )
+    runs = db.relationship(
+        "ParseRun",
+        cascade="all,delete",
+        backref="user",
+        lazy=True,
+    )
 
     def __repr__(self) -> str:
         return str(
@@ -128,6 +188,13 @@ class Site(db.Model, DBModelMixin):
     """Database Site model."""
 
     __tablename__ = "sites"
+    # keyset pagination of the newest sites, all and of the user
+    __table_args__ = (
+        db.Index("ix_sites_created_at_id", "created_at", "id"),
+        db.Index(
+            "ix_sites_user_id_created_at_id", "user_id", "created_at", "id"
+        ),
+    )
 
     id = db.Column(
         db.Integer,
@@ -143,6 +210,13 @@ class Site(db.Model, DBModelMixin):
         nullable=False,
         unique=True,
     )
+    url_hash = db.Column(
+        db.BigInteger,
+        index=True,
+        default=lambda context: url_hash(
+            context.get_current_parameters()["url"]
+        ),
+    )
     title = db.Column(
         db.Text,
         nullable=False,
@@ -156,6 +230,25 @@ class Site(db.Model, DBModelMixin):
         db.Integer,
         nullable=False,
     )
+    etag = db.Column(
+        db.String(255),
+    )
+    last_modified = db.Column(
+        db.String(64),
+    )
+    content_length = db.Column(
+        db.Integer,
+    )
+
+    UPSERT_COLUMNS = (
+        "user_id",
+        "title",
+        "scrapping_time",
+        "created_at",
+        "etag",
+        "last_modified",
+        "content_length",
+    )
 
     @classmethod
     def get_by_url(cls, url: str) -> BaseQuery:
@@ -189,21 +282,1083 @@ class Site(db.Model, DBModelMixin):
         """
         return cls.query.filter_by(user=user).all()
 
+    @classmethod
+    def iter_all(cls, chunk_size: int = 1000) -> t.Iterator["Site"]:
+        """Iterate over all the sites in the id order.
+
+        Rows are fetched from a server-side cursor where the database
+        driver supports it, chunk_size instances at a time, so they
+        aren't all held in memory at once. Users of the sites are loaded
+        by the same query, so the number of queries doesn't depend
+        on the number of sites.
+
+        Args:
+            chunk_size (int, optional): number of rows fetched at once.
+                Defaults to 1000.
+
+        Yields:
+            Iterator[Site]: Site instances
+        """
+        return iter(
+            cls.query.options(joinedload(cls.user))
+            .order_by(cls.id)
+            .yield_per(chunk_size)
+        )
+
+    @classmethod
+    def get_page(
+        cls,
+        user: t.Optional[User] = None,
+        after: t.Optional[t.Tuple[datetime, int]] = None,
+        limit: int = 50,
+    ) -> t.List[t.Any]:
+        """Get a page of the newest sites with the keyset pagination.
+
+        Sites are ordered by (created_at, id) descending and the page
+        starts right after the given key, so the query is an index range
+        scan wherever the page is. Only the listed columns and the
+        username are selected, no Site instances are created.
+
+        Args:
+            user (Optional[User], optional): User the sites are parsed by,
+                all the sites if None. Defaults to None.
+            after (Optional[Tuple[datetime, int]], optional): created_at
+                and id of the last site of the previous page, the first
+                page if None. Defaults to None.
+            limit (int, optional): number of sites. Defaults to 50.
+
+        Returns:
+            List[Row]: rows with id, url, title, scrapping_time,
+            created_at and username attributes
+        """
+        query = db.session.query(
+            cls.id,
+            cls.url,
+            cls.title,
+            cls.scrapping_time,
+            cls.created_at,
+            User.username,
+        ).outerjoin(User, cls.user_id == User.id)
+        if user is not None:
+            query = query.filter(cls.user_id == user.id)
+        if after is not None:
+            created_at, id_ = after
+            query = query.filter(
+                db.or_(
+                    cls.created_at < created_at,
+                    db.and_(cls.created_at == created_at, cls.id < id_),
+                )
+            )
+        return (
+            query.order_by(cls.created_at.desc(), cls.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    @classmethod
+    def lookup(
+        cls, urls: t.Iterable[str], fresh_since: t.Optional[datetime] = None
+    ) -> t.Tuple[t.Set[str], t.Dict[str, t.Dict[str, str]]]:
+        """Look already parsed sites up before crawling them.
+
+        Sites of all the passed urls are fetched with a single query
+        looking them up by their url hashes. Sites parsed after
+        fresh_since are fresh and don't need to be crawled again,
+        validators of the others make their requests conditional.
+
+        Args:
+            urls (Iterable[str]): Site urls
+            fresh_since (Optional[datetime], optional): time sites parsed
+                after are fresh, none are if None. Defaults to None.
+
+        Returns:
+            Tuple[Set[str], Dict[str, Dict[str, str]]]: urls of the fresh
+            sites, If-None-Match and If-Modified-Since headers by url
+            of the other sites, sites without validators are omitted
+        """
+        urls = set(urls)
+        if fresh_since is None:
+            is_fresh = db.literal(False)
+        else:
+            is_fresh = cls.created_at > fresh_since
+        query = db.session.query(
+            cls.url, cls.etag, cls.last_modified, is_fresh
+        ).filter(cls.url_hash.in_([url_hash(url) for url in urls]))
+        if fresh_since is None:
+            query = query.filter(
+                db.or_(cls.etag.isnot(None), cls.last_modified.isnot(None))
+            )
+        fresh = set()
+        validators = {}
+        for url, etag, last_modified, is_fresh in query:
+            if url not in urls:
+                continue
+            if is_fresh:
+                fresh.add(url)
+                continue
+            headers = {}
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            if headers:
+                validators[url] = headers
+        return fresh, validators
+
     @classmethod
     def update_or_create(cls, data: t.Dict[str, t.Any]) -> None:
         """Update existing Site instance, create new one if not exists.
 
+        Data without title stands for the page that hasn't been
+        modified since the last parse, only its timestamp is updated.
+
         Args:
-            data (t.Dict[str, t.Any]): [description]
+            data (t.Dict[str, t.Any]): Site model attributes and values
         """
         try:
-            cls.get_by_url(data["url"]).update(
+            query = cls.get_by_url(data["url"])
+        except EmptyQueryError:
+            if data.get("title") is not None:
+                db.session.add(cls(**data))
+            return
+        if data.get("title") is None:
+            query.update(dict(created_at=data["created_at"]))
+            return
+        query.update(
+            dict(
+                user_id=data["user"].id,
+                title=data["title"],
+                scrapping_time=data["scrapping_time"],
+                created_at=data["created_at"],
+                etag=data.get("etag"),
+                last_modified=data.get("last_modified"),
+                content_length=data.get("content_length"),
+            )
+        )
+
+    @classmethod
+    def bulk_upsert(cls, sites: t.List[t.Dict[str, t.Any]]) -> None:
+        """Update existing Site records and create missing ones in bulk.
+
+        All the modified sites are written with a single multi-row
+        INSERT ... ON CONFLICT (url) DO UPDATE statement, timestamps
+        of not modified ones (without title) are bumped with a single
+        UPDATE. Dialects without ON CONFLICT support fall back
+        to update_or_create(). Changes aren't committed.
+
+        Args:
+            sites (List[Dict[str, Any]]): Site model attributes and values
+        """
+        with UPSERT_SECONDS.time():
+            cls._bulk_upsert(sites)
+        UPSERT_ROWS.inc(len(sites))
+
+    @classmethod
+    def _bulk_upsert(cls, sites: t.List[t.Dict[str, t.Any]]) -> None:
+        insert = dialect_insert(cls.__table__)
+        if insert is None:
+            for site in sites:
+                cls.update_or_create(site)
+            return
+
+        modified = {}
+        not_modified = {}
+        for site in sites:
+            if site.get("title") is None:
+                not_modified[site["url"]] = site["created_at"]
+                continue
+            modified[site["url"]] = {
+                "url": site["url"],
+                "url_hash": url_hash(site["url"]),
+                "user_id": site["user"].id,
+                "title": site["title"],
+                "scrapping_time": site["scrapping_time"],
+                "created_at": site["created_at"],
+                "etag": site.get("etag"),
+                "last_modified": site.get("last_modified"),
+                "content_length": site.get("content_length"),
+            }
+        for batch in insert_batches(list(modified.values())):
+            statement = insert.values(batch)
+            statement = statement.on_conflict_do_update(
+                index_elements=[cls.url],
+                set_={
+                    column: statement.excluded[column]
+                    for column in cls.UPSERT_COLUMNS
+                },
+            )
+            db.session.execute(statement)
+        if not_modified:
+            db.session.execute(
+                cls.__table__.update()
+                .where(cls.url == bindparam("site_url"))
+                .values(created_at=bindparam("site_created_at")),
+                [
+                    {"site_url": url, "site_created_at": created_at}
+                    for url, created_at in not_modified.items()
+                ],
+            )
+
+    @classmethod
+    def canonicalize_urls(cls, chunk_size: int = 1000) -> t.Dict[str, int]:
+        """Bring urls of the stored sites to their canonical form.
+
+        Sites which urls turn out to be the same page are merged,
+        the most recently parsed one is kept. Url hashes are filled
+        for all the sites. Changed rows are written by chunks while
+        the table is read, only the url hashes are kept in memory.
+        Changes aren't committed.
+
+        Args:
+            chunk_size (int, optional): number of rows loaded and
+                written at once. Defaults to 1000.
+
+        Returns:
+            Dict[str, int]: number of 'updated' and 'deleted' sites
+        """
+        seen = HashIndex()
+        counters = {"updated": 0, "deleted": 0}
+        updates = []
+        deleted = []
+        statement = (
+            cls.__table__.update()
+            .where(cls.id == bindparam("site_id"))
+            .values(
+                url=bindparam("site_url"),
+                url_hash=bindparam("site_url_hash"),
+            )
+        )
+
+        def flush() -> None:
+            if deleted:
+                db.session.execute(
+                    cls.__table__.delete().where(cls.id.in_(deleted))
+                )
+            if updates:
+                db.session.execute(statement, updates)
+            counters["updated"] += len(updates)
+            counters["deleted"] += len(deleted)
+            updates.clear()
+            deleted.clear()
+
+        query = (
+            db.session.query(cls.id, cls.url, cls.url_hash)
+            .order_by(cls.created_at.desc(), cls.id.desc())
+            .yield_per(chunk_size)
+        )
+        for id_, url, hash_ in query:
+            canonical = canonicalize_url(url)
+            canonical_hash = url_hash(canonical)
+            if not seen.add(canonical_hash):
+                deleted.append(id_)
+            elif url != canonical or hash_ != canonical_hash:
+                updates.append(
+                    {
+                        "site_id": id_,
+                        "site_url": canonical,
+                        "site_url_hash": canonical_hash,
+                    }
+                )
+            if len(updates) + len(deleted) >= chunk_size:
+                flush()
+        flush()
+        return counters
+
+
+class ParseRun(db.Model, DBModelMixin):
+    """Database model of a background file parse run."""
+
+    __tablename__ = "parse_runs"
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True,
+    )
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.id"),
+        nullable=False,
+    )
+    file_name = db.Column(
+        db.String(255),
+        nullable=False,
+    )
+    file_path = db.Column(
+        db.String(1024),
+        nullable=False,
+    )
+    status = db.Column(
+        db.String(16),
+        nullable=False,
+        default=QUEUED,
+    )
+    parsed = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+    failed = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+    error = db.Column(
+        db.Text,
+    )
+    max_depth = db.Column(
+        db.Integer,
+    )
+    freshness_ttl = db.Column(
+        db.Integer,
+    )
+    distributed = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+    )
+    failures_only = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+    )
+    stats = db.Column(
+        db.JSON,
+    )
+    created_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=datetime.utcnow,
+    )
+    started_at = db.Column(
+        db.DateTime(timezone=True),
+    )
+    finished_at = db.Column(
+        db.DateTime(timezone=True),
+    )
+    heartbeat_at = db.Column(
+        db.DateTime(timezone=True),
+        default=datetime.utcnow,
+    )
+
+    checkpoints = db.relationship(
+        "CrawlCheckpoint",
+        cascade="all,delete",
+        lazy="dynamic",
+    )
+    fetch_stats = db.relationship(
+        "FetchStat",
+        cascade="all,delete",
+        lazy="dynamic",
+    )
+    tasks = db.relationship(
+        "CrawlTask",
+        back_populates="run",
+        cascade="all,delete",
+        lazy="dynamic",
+    )
+
+    @property
+    def is_active(self) -> bool:
+        """Whether the run is waiting or being executed."""
+        return self.status in (self.QUEUED, self.RUNNING)
+
+    @classmethod
+    def get_by_user(cls, user: User) -> t.List["ParseRun"]:
+        """Get ParseRun DB records of the user, newest first.
+
+        Args:
+            user (User): User instance
+
+        Returns:
+            List[ParseRun]: List of ParseRun instances
+        """
+        return (
+            cls.query.filter_by(user=user).order_by(cls.id.desc()).all()
+        )
+
+    @classmethod
+    def beat(cls, ids: t.Iterable[int]) -> None:
+        """Update the heartbeat of the runs. Changes aren't committed.
+
+        Args:
+            ids (Iterable[int]): ParseRun ids
+        """
+        ids = list(ids)
+        if ids:
+            cls.query.filter(cls.id.in_(ids)).update(
+                {"heartbeat_at": datetime.utcnow()},
+                synchronize_session=False,
+            )
+
+    @classmethod
+    def claim_interrupted(cls, run_id: int, stale_since: datetime) -> bool:
+        """Queue the interrupted run again, unless another process has
+        done it or the run is alive after all.
+
+        The run is queued by a single conditional update, so only one
+        of the concurrent callers succeeds. Changes are committed.
+
+        Args:
+            run_id (int): ParseRun id
+            stale_since (datetime): UTC time active runs without
+                a heartbeat since are considered interrupted
+
+        Returns:
+            bool: True if the run has been queued by this call
+        """
+        claimed = cls.query.filter(
+            cls.id == run_id,
+            db.or_(
+                cls.status == cls.FAILED,
+                db.and_(
+                    cls.status.in_((cls.QUEUED, cls.RUNNING)),
+                    db.or_(
+                        cls.heartbeat_at.is_(None),
+                        cls.heartbeat_at < stale_since,
+                    ),
+                ),
+            ),
+        ).update(
+            {"status": cls.QUEUED, "heartbeat_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return bool(claimed)
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        """Serialize the run status.
+
+        Returns:
+            Dict[str, Any]: run attributes with dates in ISO format
+        """
+        return dict(
+            id=self.id,
+            file_name=self.file_name,
+            status=self.status,
+            parsed=self.parsed,
+            failed=self.failed,
+            error=self.error,
+            max_depth=self.max_depth,
+            freshness_ttl=self.freshness_ttl,
+            distributed=self.distributed,
+            failures_only=self.failures_only,
+            stats=self.stats,
+            created_at=_isoformat(self.created_at),
+            started_at=_isoformat(self.started_at),
+            finished_at=_isoformat(self.finished_at),
+        )
+
+
+class CrawlCheckpoint(db.Model):
+    """Database model of the link completed within a parse run.
+
+    Links are stored as 64-bit hashes to keep the checkpoint compact.
+    """
+
+    __tablename__ = "crawl_checkpoints"
+
+    run_id = db.Column(
+        db.Integer,
+        db.ForeignKey("parse_runs.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    url_hash = db.Column(
+        db.BigInteger,
+        primary_key=True,
+        autoincrement=False,
+    )
+
+    @classmethod
+    def get_hashes(cls, run: ParseRun) -> HashIndex:
+        """Get hashes of the links completed within the run.
+
+        Args:
+            run (ParseRun): ParseRun instance
+
+        Returns:
+            HashIndex: link hashes
+        """
+        query = db.session.query(cls.url_hash).filter_by(run_id=run.id)
+        hashes = HashIndex()
+        for hash_, in query.yield_per(10000):
+            hashes.add(hash_)
+        return hashes
+
+    @classmethod
+    def add(cls, run: ParseRun, hashes: t.Iterable[int]) -> None:
+        """Mark links as completed within the run. Changes aren't committed.
+
+        Args:
+            run (ParseRun): ParseRun instance
+            hashes (Iterable[int]): link hashes
+        """
+        rows = [
+            {"run_id": run.id, "url_hash": url_hash}
+            for url_hash in set(hashes)
+        ]
+        if not rows:
+            return
+        insert = dialect_insert(cls.__table__)
+        if insert is None:
+            existing = cls.get_hashes(run)
+            rows = [row for row in rows if row["url_hash"] not in existing]
+            db.session.execute(cls.__table__.insert(), rows)
+            return
+        db.session.execute(insert.on_conflict_do_nothing(), rows)
+
+
+class CrawlFailure(db.Model):
+    """Database model of the link which has failed to be parsed.
+
+    Every user's failed links are kept until they are parsed
+    successfully, with the outcome of the last attempt and the number
+    of runs they have failed in.
+    """
+
+    __tablename__ = "crawl_failures"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    url_hash = db.Column(
+        db.BigInteger,
+        primary_key=True,
+        autoincrement=False,
+    )
+    url = db.Column(
+        db.Text,
+        nullable=False,
+    )
+    error = db.Column(
+        db.String(64),
+        nullable=False,
+    )
+    status = db.Column(
+        db.Integer,
+    )
+    retryable = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+    )
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+    )
+    run_id = db.Column(
+        db.Integer,
+        db.ForeignKey("parse_runs.id", ondelete="SET NULL"),
+    )
+    last_attempt_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    UPDATE_COLUMNS = (
+        "url",
+        "error",
+        "status",
+        "retryable",
+        "run_id",
+        "last_attempt_at",
+    )
+
+    @classmethod
+    def get_hashes(cls, user: User, retryable: bool = True) -> HashIndex:
+        """Get hashes of the user's failed links.
+
+        Args:
+            user (User): User instance
+            retryable (bool, optional): only the links which have failed
+                with a retryable error. Defaults to True.
+
+        Returns:
+            HashIndex: link hashes
+        """
+        query = db.session.query(cls.url_hash).filter_by(user_id=user.id)
+        if retryable:
+            query = query.filter_by(retryable=True)
+        hashes = HashIndex()
+        for hash_, in query.yield_per(10000):
+            hashes.add(hash_)
+        return hashes
+
+    @classmethod
+    def record(
+        cls,
+        user: User,
+        failures: t.Iterable[t.Tuple[str, str, t.Optional[int], bool]],
+        run: t.Optional[ParseRun] = None,
+    ) -> None:
+        """Record the failed attempts, the attempts count of already
+        failed links is increased. Changes aren't committed.
+
+        Args:
+            user (User): User instance
+            failures (Iterable[Tuple[str, str, Optional[int], bool]]):
+                canonical URL, error name, response status and whether
+                the error is retryable
+            run (Optional[ParseRun], optional): run the links have failed
+                in. Defaults to None.
+        """
+        now = datetime.utcnow()
+        rows = {
+            url_hash(url): {
+                "user_id": user.id,
+                "url_hash": url_hash(url),
+                "url": url,
+                "error": error,
+                "status": status,
+                "retryable": retryable,
+                "attempts": 1,
+                "run_id": run and run.id,
+                "last_attempt_at": now,
+            }
+            for url, error, status, retryable in failures
+        }
+        if not rows:
+            return
+        insert = dialect_insert(cls.__table__)
+        if insert is None:
+            existing = {
+                hash_
+                for hash_, in db.session.query(cls.url_hash).filter(
+                    cls.user_id == user.id, cls.url_hash.in_(list(rows))
+                )
+            }
+            for hash_ in existing:
+                row = rows.pop(hash_)
+                cls.query.filter_by(user_id=user.id, url_hash=hash_).update(
+                    {
+                        **{name: row[name] for name in cls.UPDATE_COLUMNS},
+                        "attempts": cls.attempts + 1,
+                    },
+                    synchronize_session=False,
+                )
+            if rows:
+                db.session.execute(cls.__table__.insert(), list(rows.values()))
+            return
+        for batch in insert_batches(list(rows.values())):
+            statement = insert.values(batch)
+            db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[cls.user_id, cls.url_hash],
+                    set_={
+                        **{
+                            name: statement.excluded[name]
+                            for name in cls.UPDATE_COLUMNS
+                        },
+                        "attempts": cls.attempts + 1,
+                    },
+                )
+            )
+
+    @classmethod
+    def clear(cls, user: User, hashes: t.Iterable[int]) -> None:
+        """Forget failures of the links which have been parsed.
+        Changes aren't committed.
+
+        Args:
+            user (User): User instance
+            hashes (Iterable[int]): hashes of the parsed links
+        """
+        hashes = list(set(hashes))
+        if hashes:
+            cls.query.filter(
+                cls.user_id == user.id, cls.url_hash.in_(hashes)
+            ).delete(synchronize_session=False)
+
+
+class FetchStat(db.Model):
+    """Database model of the single request timings.
+
+    Phase durations are stored in milliseconds, phases that
+    haven't happened (e.g. DNS lookup of a cached host) are null.
+    """
+
+    __tablename__ = "fetch_stats"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True,
+    )
+    run_id = db.Column(
+        db.Integer,
+        db.ForeignKey("parse_runs.id", ondelete="CASCADE"),
+        index=True,
+    )
+    url = db.Column(
+        db.Text,
+        nullable=False,
+    )
+    status = db.Column(
+        db.Integer,
+    )
+    error = db.Column(
+        db.String(64),
+    )
+    dns = db.Column(
+        db.Float,
+    )
+    connect = db.Column(
+        db.Float,
+    )
+    ttfb = db.Column(
+        db.Float,
+    )
+    transfer = db.Column(
+        db.Float,
+    )
+    bytes = db.Column(
+        db.Integer,
+    )
+    created_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    @classmethod
+    def add_all(cls, stats: t.List[t.Dict[str, t.Any]]) -> None:
+        """Insert request timings in bulk. Changes aren't committed.
+
+        Args:
+            stats (List[Dict[str, Any]]): FetchStat attributes and values
+        """
+        if stats:
+            db.session.execute(cls.__table__.insert(), stats)
+
+    @classmethod
+    def summary(cls, run: ParseRun) -> t.Dict[str, t.Any]:
+        """Get percentile summary of the run request timings.
+
+        Args:
+            run (ParseRun): ParseRun instance
+
+        Returns:
+            Dict[str, Any]: p50, p95 and p99 by the phase name and 'bytes'
+        """
+        names = (*PHASES, "bytes")
+        query = db.session.query(
+            *(getattr(cls, name) for name in names)
+        ).filter_by(run_id=run.id)
+        columns = list(zip(*query.yield_per(10000))) or [()] * len(names)
+        return {
+            name: summarize(values) for name, values in zip(names, columns)
+        }
+
+
+class CrawlTask(db.Model):
+    """Database model of the link queued for distributed crawl workers.
+
+    Workers claim tasks by batches and hold them for a lease period,
+    tasks which lease has expired are claimed again by other workers.
+    """
+
+    __tablename__ = "crawl_tasks"
+    __table_args__ = (db.UniqueConstraint("run_id", "url_hash"),)
+
+    PENDING = "pending"
+    CLAIMED = "claimed"
+    DONE = "done"
+    FAILED = "failed"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True,
+    )
+    run_id = db.Column(
+        db.Integer,
+        db.ForeignKey("parse_runs.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    url = db.Column(
+        db.Text,
+        nullable=False,
+    )
+    url_hash = db.Column(
+        db.BigInteger,
+        nullable=False,
+    )
+    status = db.Column(
+        db.String(16),
+        nullable=False,
+        default=PENDING,
+        index=True,
+    )
+    worker = db.Column(
+        db.String(255),
+    )
+    lease = db.Column(
+        db.String(32),
+        index=True,
+    )
+    lease_expires_at = db.Column(
+        db.DateTime(timezone=True),
+    )
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+    error = db.Column(
+        db.String(64),
+    )
+    finished_at = db.Column(
+        db.DateTime(timezone=True),
+    )
+
+    run = db.relationship("ParseRun", back_populates="tasks")
+
+    @classmethod
+    def enqueue(cls, run: ParseRun, urls: t.Iterable[str]) -> None:
+        """Queue the links of the run, already queued ones are skipped.
+
+        Changes aren't committed.
+
+        Args:
+            run (ParseRun): ParseRun instance
+            urls (Iterable[str]): canonical URLs
+        """
+        rows = {
+            url_hash(url): {
+                "run_id": run.id,
+                "url": url,
+                "url_hash": url_hash(url),
+                "status": cls.PENDING,
+                "attempts": 0,
+            }
+            for url in urls
+        }
+        if not rows:
+            return
+        insert = dialect_insert(cls.__table__)
+        if insert is None:
+            existing = {
+                hash_
+                for hash_, in db.session.query(cls.url_hash).filter(
+                    cls.run_id == run.id, cls.url_hash.in_(list(rows))
+                )
+            }
+            rows = {
+                hash_: row
+                for hash_, row in rows.items()
+                if hash_ not in existing
+            }
+            if rows:
+                db.session.execute(cls.__table__.insert(), list(rows.values()))
+            return
+        for batch in insert_batches(list(rows.values())):
+            db.session.execute(
+                insert.values(batch).on_conflict_do_nothing(
+                    index_elements=[cls.run_id, cls.url_hash]
+                )
+            )
+
+    @classmethod
+    def claim(
+        cls, worker: str, size: int, lease_seconds: float, max_attempts: int
+    ) -> t.List["CrawlTask"]:
+        """Claim a batch of pending tasks or tasks with expired lease.
+
+        On PostgreSQL the batch is selected with FOR UPDATE SKIP LOCKED,
+        so concurrent workers never wait for each other. Other dialects
+        fall back to a conditional UPDATE (SQLite serializes writers),
+        tasks claimed by somebody else in between are skipped. Expired
+        tasks that have used up their attempts are marked as failed.
+        Changes are committed.
+
+        Args:
+            worker (str): worker name
+            size (int): maximum number of tasks
+            lease_seconds (float): lease period
+            max_attempts (int): maximum number of claims of the task
+
+        Returns:
+            List[CrawlTask]: claimed tasks
+        """
+        now = datetime.utcnow()
+        expired = db.and_(
+            cls.status == cls.CLAIMED, cls.lease_expires_at < now
+        )
+        cls.query.filter(expired, cls.attempts >= max_attempts).update(
+            dict(status=cls.FAILED, error="LeaseExpired", finished_at=now),
+            synchronize_session=False,
+        )
+        claimable = db.and_(
+            db.or_(cls.status == cls.PENDING, expired),
+            cls.attempts < max_attempts,
+        )
+        query = (
+            db.session.query(cls.id)
+            .filter(claimable)
+            .order_by(cls.id)
+            .limit(size)
+        )
+        if db.engine.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        ids = [id_ for id_, in query]
+        lease = uuid.uuid4().hex
+        if ids:
+            cls.query.filter(cls.id.in_(ids), claimable).update(
                 dict(
-                    user_id=data["user"].id,
-                    scrapping_time=data["scrapping_time"],
-                    created_at=data["created_at"],
+                    status=cls.CLAIMED,
+                    worker=worker,
+                    lease=lease,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    attempts=cls.attempts + 1,
+                ),
+                synchronize_session=False,
+            )
+        db.session.commit()
+        if not ids:
+            return []
+        return cls.query.filter_by(lease=lease).order_by(cls.id).all()
+
+    @classmethod
+    def complete(
+        cls, tasks: t.List["CrawlTask"], errors: t.Dict[str, str]
+    ) -> None:
+        """Mark claimed tasks as done or failed.
+
+        Tasks which lease has been taken over by another worker
+        are left alone. Changes aren't committed.
+
+        Args:
+            tasks (List[CrawlTask]): tasks claimed by the worker
+            errors (Dict[str, str]): error names by the failed task url
+        """
+        if not tasks:
+            return
+        statement = (
+            cls.__table__.update()
+            .where(
+                db.and_(
+                    cls.id == bindparam("task_id"),
+                    cls.lease == bindparam("task_lease"),
                 )
             )
-        except EmptyQueryError:
-            new_site = cls(**data)
-            db.session.add(new_site)
+            .values(
+                status=bindparam("task_status"),
+                error=bindparam("task_error"),
+                finished_at=datetime.utcnow(),
+            )
+        )
+        db.session.execute(
+            statement,
+            [
+                {
+                    "task_id": task.id,
+                    "task_lease": task.lease,
+                    "task_status": (
+                        cls.FAILED if task.url in errors else cls.DONE
+                    ),
+                    "task_error": errors.get(task.url),
+                }
+                for task in tasks
+            ],
+        )
+
+    @classmethod
+    def count_by_status(cls, run_id: int) -> t.Counter[str]:
+        """Count the run tasks by their status.
+
+        Args:
+            run_id (int): ParseRun id
+
+        Returns:
+            Counter[str]: number of tasks by the status
+        """
+        query = (
+            db.session.query(cls.status, db.func.count(cls.id))
+            .filter(cls.run_id == run_id)
+            .group_by(cls.status)
+        )
+        return Counter(dict(query.all()))
+
+
+class RobotsRule(db.Model):
+    """Database model of the host robots.txt shared across parse runs."""
+
+    __tablename__ = "robots_rules"
+
+    origin = db.Column(
+        db.String(255),
+        primary_key=True,
+    )
+    status = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+    content = db.Column(
+        db.Text,
+        nullable=False,
+        default="",
+    )
+    fetched_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    @classmethod
+    def get_fresh(
+        cls, origins: t.Iterable[str], since: datetime
+    ) -> t.Dict[str, t.Tuple[int, str]]:
+        """Get robots.txt of the origins fetched after the date.
+
+        Args:
+            origins (Iterable[str]): origins ('scheme://host:port')
+            since (datetime): oldest fetch date to accept
+
+        Returns:
+            Dict[str, Tuple[int, str]]: response status and robots.txt
+            content by the origin, stale and missing origins are omitted
+        """
+        query = db.session.query(cls.origin, cls.status, cls.content).filter(
+            cls.origin.in_(list(origins)), cls.fetched_at >= since
+        )
+        return {origin: (status, content) for origin, status, content in query}
+
+    @classmethod
+    def save_all(cls, rules: t.List[t.Dict[str, t.Any]]) -> None:
+        """Insert or replace robots.txt of the origins.
+
+        Changes aren't committed.
+
+        Args:
+            rules (List[Dict[str, Any]]): RobotsRule attributes and values
+        """
+        if not rules:
+            return
+        insert = dialect_insert(cls.__table__)
+        if insert is None:
+            for rule in rules:
+                db.session.merge(cls(**rule))
+            return
+        for batch in insert_batches(rules):
+            statement = insert.values(batch)
+            statement = statement.on_conflict_do_update(
+                index_elements=[cls.origin],
+                set_={
+                    column: statement.excluded[column]
+                    for column in ("status", "content", "fetched_at")
+                },
+            )
+            db.session.execute(statement)
+
+
+def _isoformat(date: t.Optional[datetime]) -> t.Optional[str]:
+    return date.isoformat() if date else None
@@ -1,19 +1,49 @@
 import asyncio
-import json
+import multiprocessing
+import queue
+import sys
+import threading
 import time
 import typing as t
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import PosixPath
 
 import aiohttp
-import backoff
-import requests
-from bs4 import BeautifulSoup
 from flask import current_app as app
-from flask import flash
 from project import db
 
-from .models import Site, User
-from .utils import create_site_dict
+from .dedup import BloomFilter, HashIndex, count_lines
+from .extract import extract_links, extract_titles, head_complete
+from .failures import ErrorAggregator
+from .frontier import Frontier, Scope
+from .metrics import (
+    EXTRACT_SECONDS,
+    FETCH_SECONDS,
+    FETCHES,
+    IN_FLIGHT,
+    SLOT_WAIT_SECONDS,
+)
+from .models import (
+    CrawlCheckpoint,
+    CrawlFailure,
+    FetchStat,
+    ParseRun,
+    Site,
+    User,
+)
+from .robots import RobotsCache, get_origin
+from .scheduler import (
+    AdaptiveLimiter,
+    HostScheduler,
+    RetryPolicy,
+    get_host,
+)
+from .shards import parse_sites_sharded
+from .timing import PHASES, create_trace_config
+from .urls import canonicalize_url, url_hash
+from .utils import build_site_dict, chunked, drain, site_url
 
 
 class RequestConfig:
@@ -30,162 +60,996 @@ class RequestConfig:
             AppleWebKit/605.1.15 (KHTML, like Gecko) \
                 Version/13.1.1 Safari/605.1.15",
     }
+    CHUNK_SIZE = 4096
 
 
-def parse_links(
-    url: t.Optional[str] = RequestConfig.WEBSITES_LIST_URL,
-    selector: t.Optional[str] = "a",
-    file_name: str = app.config["LINKS_FILE"],
-) -> t.NoReturn:
-    """Parse links from passed url by the css selector
-    and write in into the file.
+TIMEOUT_ERRORS = frozenset(("TimeoutError", "ServerTimeoutError"))
+CONNECTION_ERRORS = frozenset(
+    (
+        "ServerDisconnectedError",
+        "ClientConnectorError",
+        "ClientOSError",
+    )
+)
+CONGESTION_ERRORS = TIMEOUT_ERRORS | CONNECTION_ERRORS
+
+
+class FetchFailure(t.NamedTuple):
+    """Outcome of the request that has failed."""
+
+    url: str
+    error: str
+    status: t.Optional[int] = None
+    message: t.Optional[str] = None
+
+    @property
+    def is_congestion(self) -> bool:
+        """Whether the failure is a sign of overloaded network or host."""
+        return self.error in CONGESTION_ERRORS
+
+    @property
+    def retry_class(self) -> t.Optional[str]:
+        """Name of the retry policy, None if the failure isn't retryable.
+
+        Server errors (5xx and 429 responses), timeouts and connection
+        errors may be retried, other client errors (4xx) never are.
+        """
+        if self.status is not None:
+            if self.status >= 500 or self.status == 429:
+                return "server"
+            return None
+        if self.error in TIMEOUT_ERRORS:
+            return "timeout"
+        if self.error in CONNECTION_ERRORS:
+            return "connection"
+        return None
+
+
+Fetched = t.Tuple[str, t.Optional[bytes], float, t.Dict[str, t.Any]]
+Extracted = t.Tuple[str, t.Optional[str], float, t.Dict[str, t.Any]]
+
+
+def create_fetch_stat(
+    url: str,
+    result: t.Union[Fetched, FetchFailure],
+    timings: t.Dict[str, t.Any],
+) -> t.Dict[str, t.Any]:
+    """Create a dictionary of FetchStat model attributes and values.
 
     Args:
-        url (t.Optional[str], optional): URL to parse to links from.
-            Defaults to RequestConfig.WEBSITES_LIST_URL.
-        selector (t.Optional[str], optional): CSS selector of links to parse.
-            Defaults to "a".
-        file_name (str, optional): File name to save parsed links.
-            Defaults to app.config["LINKS_FILE"].
+        url (str): requested URL
+        result (Union[Fetched, FetchFailure]): fetch() result
+        timings (Dict[str, Any]): timings written by fetch()
 
     Returns:
-        NoReturn
+        Dict[str, Any]: dictionary with FetchStat
+        model attributes and values
     """
-    response = requests.get(
-        url,
-        headers=RequestConfig.HEADERS,
+    failure = result if isinstance(result, FetchFailure) else None
+    stat = dict(
+        url=url,
+        status=failure.status if failure else timings.get("status"),
+        error=failure.error if failure else None,
+        bytes=timings.get("bytes"),
+        created_at=datetime.utcnow(),
     )
-    soup = BeautifulSoup(response.content, "lxml")
-    links = [
-        f"{link['href'].strip()}\n"
-        for link in set(soup.select(selector=selector))
-    ]
-    with open(app.config["UPLOADS"] / file_name, "a") as file:
-        for link in links:
-            file.write(link)
-
-
-@backoff.on_exception(
-    backoff.expo,
-    aiohttp.ClientResponseError,
-    max_tries=3,
-    max_time=30,
-)
-@backoff.on_exception(
-    backoff.expo,
-    asyncio.TimeoutError,
-    max_tries=3,
-    max_time=50,
-)
+    for phase in PHASES:
+        value = timings.get(phase)
+        stat[phase] = None if value is None else value * 1000
+    return stat
+
+
+def record_fetch(
+    result: t.Union[Fetched, FetchFailure],
+    timings: t.Dict[str, t.Any],
+    seconds: float,
+) -> None:
+    """Count the fetch in the crawler metrics.
+
+    Args:
+        result (Union[Fetched, FetchFailure]): fetch() result
+        timings (Dict[str, Any]): timings written by fetch()
+        seconds (float): fetch duration
+    """
+    status = timings.get("status")
+    if isinstance(result, FetchFailure):
+        status = result.status
+        outcome = result.retry_class or "error"
+        if result.status is not None and outcome == "error":
+            outcome = "client"
+    elif result[1] is None:
+        outcome = "not_modified"
+    else:
+        outcome = "ok"
+    FETCHES.inc(
+        outcome=outcome,
+        status_class="none" if status is None else f"{status // 100}xx",
+    )
+    FETCH_SECONDS.observe(seconds, outcome=outcome)
+
+
+async def read_head(response: aiohttp.ClientResponse, limit: int) -> bytes:
+    """Read the response body until the page title is received.
+
+    The body is read by chunks until the closing title or head tag
+    shows up or the byte limit is hit. The rest of the body isn't
+    downloaded, the connection is closed instead.
+
+    Args:
+        response (aiohttp.ClientResponse): response to read
+        limit (int): maximum number of bytes to read
+
+    Returns:
+        bytes: beginning of the response body
+    """
+    data = bytearray()
+    async for chunk in response.content.iter_chunked(RequestConfig.CHUNK_SIZE):
+        start = max(len(data) - len("</title>"), 0)
+        data.extend(chunk)
+        if len(data) >= limit or head_complete(data, start):
+            break
+    if response.content.at_eof():
+        response.release()
+    else:
+        response.close()
+    return bytes(data[:limit])
+
+
 async def fetch(
     session: aiohttp.ClientSession,
-    semaphore: asyncio.Semaphore,
     url: str,
-) -> t.Tuple[str, t.Coroutine[t.Any, t.Any, bytes], float]:
+    validators: t.Optional[t.Dict[str, str]] = None,
+    timings: t.Optional[t.Dict[str, t.Any]] = None,
+    full_body: bool = False,
+) -> t.Union[Fetched, FetchFailure]:
     """Make an asynchronous request on given URL.
 
     Args:
         session (aiohttp.ClientSession): aiohttp Session
-        semaphore (asyncio.Semaphore): asyncio loop Semaphore instance
         url (str): URL to make request on
+        validators (Optional[Dict[str, str]], optional): conditional
+            request headers of the previously parsed page. Defaults to None.
+        timings (Optional[Dict[str, Any]], optional): dictionary the
+            request phase timings, response status and number of body
+            bytes read are written to. Defaults to None.
+        full_body (bool, optional): read the whole body even if
+            CRAWL_TITLE_ONLY is set, e.g. to extract page links.
+            Defaults to False.
 
     Returns:
-        Tuple[str, Coroutine[Any, Any, bytes], time.time]:
+        Union[Tuple[str, Optional[bytes], float, Dict[str, Any]],
+        FetchFailure]: FetchFailure if the request has failed, otherwise
             url (str): URL that's had been requested
-            result Coroutine[Any, Any, bytes]): coroutine containing
-            response data
+            result (Optional[bytes]): response data, None if the page
+            hasn't been modified since the last parse
             time_ (float): Time in took to make a request
+            validators (Dict[str, Any]): etag, last_modified and
+            content_length of the response
     """
-    async with semaphore:
-        try:
-            start = time.perf_counter()
-            async with session.get(
-                url,
-                headers=RequestConfig.HEADERS,
-                raise_for_status=True,
-                timeout=30,
-            ) as response:
-                end = time.perf_counter()
-                time_ = end - start
-                result = await response.read()
-                return url, result, time_
-        except (
-            aiohttp.ServerDisconnectedError,
-            asyncio.TimeoutError,
-        ) as e:
-            app.logger.error(
-                {
-                    "url": url,
-                    "error": e.__class__.__name__,
-                    "message": e,
-                }
-            )
-        except aiohttp.ClientConnectorError as e:
-            app.logger.error(
-                json.dumps(
-                    {
-                        "url": url,
-                        "error": e.__class__.__name__,
-                        "host": e.host,
-                        "port": e.port,
-                        "message": e.strerror,
-                    },
-                    indent=4,
+    headers = RequestConfig.HEADERS
+    if validators:
+        headers = {**headers, **validators}
+    if timings is None:
+        timings = {}
+    try:
+        start = time.perf_counter()
+        async with session.get(
+            url,
+            headers=headers,
+            raise_for_status=True,
+            timeout=app.config["CRAWL_TIMEOUT"],
+            trace_request_ctx=timings,
+        ) as response:
+            end = time.perf_counter()
+            time_ = end - start
+            timings["status"] = response.status
+            content_length = response.content_length
+            if response.status == 304:
+                result = None
+            elif app.config["CRAWL_TITLE_ONLY"] and not full_body:
+                result = await read_head(
+                    response, app.config["CRAWL_MAX_BODY_BYTES"]
                 )
+            else:
+                result = await response.read()
+                content_length = len(result)
+            timings["transfer"] = time.perf_counter() - end
+            timings["bytes"] = len(result or b"")
+            return (
+                url,
+                result,
+                time_,
+                dict(
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                    content_length=content_length,
+                ),
             )
-        except aiohttp.ClientResponseError as e:
-            app.logger.error(
-                json.dumps(
-                    {
-                        "url": url,
-                        "error": e.__class__.__name__,
-                        "status_code": e.status,
-                        "message": e.message,
-                    },
-                    indent=4,
-                )
+    except aiohttp.ClientConnectorError as e:
+        return FetchFailure(url, e.__class__.__name__, message=e.strerror)
+    except aiohttp.ClientResponseError as e:
+        return FetchFailure(url, e.__class__.__name__, e.status, e.message)
+    except Exception as e:
+        return FetchFailure(url, e.__class__.__name__, message=str(e))
+
+
+_DONE = object()
+
+
+async def fetch_page(
+    session: aiohttp.ClientSession, url: str
+) -> t.Union[t.Tuple[str, bytes], FetchFailure]:
+    """Download the whole page the links are discovered on.
+
+    Args:
+        session (aiohttp.ClientSession): aiohttp Session
+        url (str): page URL
+
+    Returns:
+        Union[Tuple[str, bytes], FetchFailure]: final page URL (after
+        redirects) and page body, FetchFailure if the request has failed
+    """
+    try:
+        async with session.get(
+            url,
+            headers=RequestConfig.HEADERS,
+            raise_for_status=True,
+            timeout=app.config["CRAWL_TIMEOUT"],
+        ) as response:
+            return str(response.url), await response.read()
+    except Exception as e:
+        app.logger.warning({"url": url, "error": e.__class__.__name__})
+        return FetchFailure(
+            url, e.__class__.__name__, getattr(e, "status", None)
+        )
+
+
+def read_link_set(file_path: PosixPath) -> BloomFilter:
+    """Build the set of links already written to the links file.
+
+    The file is streamed line by line into a Bloom filter, so even
+    files of millions of links take a few megabytes of memory.
+
+    Args:
+        file_path (PosixPath): links file path
+
+    Returns:
+        BloomFilter: normalized links of the file
+    """
+    seen = BloomFilter(
+        count_lines(file_path) * 2 + app.config["LINKS_BLOOM_CAPACITY"],
+        app.config["LINKS_BLOOM_ERROR_RATE"],
+    )
+    if file_path.exists():
+        with open(file_path) as file:
+            for line in file:
+                if line.strip():
+                    seen.add(canonicalize_url(line))
+    return seen
+
+
+async def discover_links(
+    urls: t.Iterable[str],
+    selector: str,
+    seen: BloomFilter,
+    file: t.TextIO,
+) -> int:
+    """Fetch pages concurrently and append links found on them to the file.
+
+    Links are resolved against their page URL and only the ones missing
+    from the seen set are written. New links are buffered and written
+    in bulk every LINKS_WRITE_CHUNK_SIZE links.
+
+    Args:
+        urls (Iterable[str]): URLs of the pages to discover links on
+        selector (str): CSS selector of link elements
+        seen (BloomFilter): links that are already in the file,
+            new links are added to it
+        file (TextIO): links file opened for appending
+
+    Returns:
+        int: number of links written
+    """
+    workers = app.config["LINKS_DISCOVERY_CONCURRENCY"]
+    chunk_size = app.config["LINKS_WRITE_CHUNK_SIZE"]
+    loop = asyncio.get_event_loop()
+    pages = iter(urls)
+    pending = []
+    written = 0
+
+    def flush() -> None:
+        nonlocal written
+        file.writelines(f"{link}\n" for link in pending)
+        file.flush()
+        written += len(pending)
+        pending.clear()
+
+    async def work(session: aiohttp.ClientSession) -> None:
+        for url in pages:
+            page = await fetch_page(session, url)
+            if isinstance(page, FetchFailure):
+                continue
+            links = await loop.run_in_executor(
+                None, extract_links, page[1], page[0], selector
             )
-        except Exception as e:
-            app.logger.error(
-                {
-                    "url": url,
-                    "error": e.__class__.__name__,
-                    "message": str(e),
-                }
+            pending.extend(link for link in links if seen.add(link))
+            if len(pending) >= chunk_size:
+                flush()
+
+    connector = aiohttp.TCPConnector(
+        ssl=False,
+        limit=workers,
+        limit_per_host=app.config["CRAWL_PER_HOST_LIMIT"],
+        ttl_dns_cache=app.config["CRAWL_DNS_CACHE_TTL"],
+    )
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(work(session) for _ in range(workers)))
+    if pending:
+        flush()
+    return written
+
+
+def parse_links(
+    urls: t.Union[str, t.Iterable[str]] = RequestConfig.WEBSITES_LIST_URL,
+    selector: str = "a",
+    file_name: t.Optional[str] = None,
+) -> int:
+    """Parse links from passed URLs by the CSS selector
+    and append the new ones to the file.
+
+    Pages are fetched concurrently, relative links are resolved and
+    links that are already in the file are skipped without loading
+    the file into memory. The set of known links is probabilistic,
+    so a tiny share of new links (LINKS_BLOOM_ERROR_RATE) may be
+    skipped as well.
+
+    Args:
+        urls (Union[str, Iterable[str]], optional): URL or URLs to parse
+            links from. Defaults to RequestConfig.WEBSITES_LIST_URL.
+        selector (str, optional): CSS selector of links to parse.
+            Defaults to "a".
+        file_name (Optional[str], optional): File name to save parsed
+            links. Defaults to app.config["LINKS_FILE"].
+
+    Returns:
+        int: number of links written
+    """
+    if isinstance(urls, str):
+        urls = [urls]
+    file_path = app.config["UPLOADS"] / (file_name or app.config["LINKS_FILE"])
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    seen = read_link_set(file_path)
+    loop = asyncio.new_event_loop()
+    try:
+        with open(file_path, "a") as file:
+            written = loop.run_until_complete(
+                discover_links(urls, selector, seen, file)
             )
+    finally:
+        loop.close()
+    app.logger.info({"file": str(file_path), "discovered": written})
+    return written
+
+
+def read_links(file_path: str) -> t.Iterator[str]:
+    """Lazily read unique links from the text file.
+
+    Links are canonicalized, so different spellings of the same URL
+    are read once. Seen links are kept as 64-bit hashes in a compact
+    index rather than as strings.
+
+    Args:
+        file_path (str): path to the file with links, one link per line
+
+    Yields:
+        Iterator[str]: canonical URLs in the order they appear in the file
+    """
+    seen = HashIndex()
+    with open(file_path, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            url = canonicalize_url(line)
+            if seen.add(url_hash(url)):
+                yield url
+
+
+def get_fresh_since(freshness: int) -> t.Optional[datetime]:
+    """Get the time sites parsed after are still fresh.
+
+    Args:
+        freshness (int): freshness TTL in seconds, 0 to disable
+
+    Returns:
+        Optional[datetime]: UTC time, None if freshness is disabled
+    """
+    if freshness <= 0:
+        return None
+    return datetime.utcnow() - timedelta(seconds=freshness)
+
+
+def get_freshness(run: t.Optional[ParseRun] = None) -> int:
+    """Get the freshness TTL of the parse run.
+
+    Args:
+        run (Optional[ParseRun], optional): parse run. Defaults to None.
+
+    Returns:
+        int: run freshness_ttl if set, CRAWL_FRESHNESS_TTL otherwise
+    """
+    if run is not None and run.freshness_ttl is not None:
+        return run.freshness_ttl
+    return app.config["CRAWL_FRESHNESS_TTL"]
 
 
 async def crawl(
     file_path: str,
-    semaphore: asyncio.Semaphore,
-) -> t.List[t.Callable[[t.Any], t.Awaitable[t.Any]]]:
+    skip: t.Optional[t.Callable[[str], bool]] = None,
+    stats: t.Optional[t.Dict[str, t.Any]] = None,
+    fetch_stats: t.Optional[t.List[t.Dict[str, t.Any]]] = None,
+    max_depth: int = 0,
+    freshness: int = 0,
+) -> t.AsyncIterator[t.Union[Fetched, FetchFailure]]:
     """Fetch links from text file with fetch()
-    function and returns a list of asyncio coroutines.
+    function and yield the results as soon as they are ready.
+
+    Links are read lazily and handed over to a fixed number of workers
+    through a bounded per-host scheduler, so the amount of responses
+    kept in memory depends on the concurrency level rather than on the
+    file size, and hosts are requested in turn within their limits.
+    The number of requests in flight is adapted to the observed latency
+    and error rate within CRAWL_CONCURRENCY_MIN..CRAWL_CONCURRENCY.
+    Retryable failures are queued again after a jittered back-off
+    according to CRAWL_RETRY_ATTEMPTS, holding no slot while waiting.
+    Already parsed pages are requested conditionally with the validators
+    stored on the Site records, looked up once per chunk of links in a
+    transaction which is ended before the chunk is queued.
+    The same lookup leaves out links which sites have been parsed
+    less than freshness seconds ago, before they are queued.
+    With ROBOTS_ENABLED links disallowed by their host robots.txt are
+    reported as failures without being queued, and declared crawl
+    delays set the host request interval. Failures aren't logged one by
+    one: they are aggregated and logged as a single summary with
+    sampled examples when the crawl is over.
+
+    With max_depth above zero links of the fetched pages are followed
+    up to that depth through a Frontier, within the scope given by
+    CRAWL_ALLOWED_HOSTS or, with CRAWL_SCOPE 'domain', by the hosts
+    of the links from the file. Pages which links are followed are
+    always downloaded in full and unconditionally, whatever their
+    freshness. On resume, links of the skipped pages aren't followed
+    again.
 
     Args:
         file_path (str): name of the file to crawl
-        semaphore (asyncio.Semaphore): asyncio loop Semaphore instance
+        skip (Optional[Callable[[str], bool]], optional): predicate
+            telling which links shouldn't be fetched. Defaults to None.
+        stats (Optional[Dict[str, Any]], optional): dictionary the final
+            and peak concurrency, the number of retries, of links
+            disallowed by robots.txt, of fresh links and the failures
+            summary are reported to. Defaults to None.
+        fetch_stats (Optional[List[Dict[str, Any]]], optional): list
+            timings of every request (including retries) are appended to
+            as FetchStat attributes. Defaults to None.
+        max_depth (int, optional): number of links to follow from the
+            links of the file. Defaults to 0.
+        freshness (int, optional): number of seconds parsed sites
+            aren't crawled again for, 0 to crawl them all. Defaults to 0.
 
-    Returns:
-        List[Callable[[Any], Awaitable[str]]]: List of coroutines
+    Yields:
+        AsyncIterator[Union[Fetched, FetchFailure]]: fetch() results
     """
+    workers = app.config["CRAWL_CONCURRENCY"]
+    limiter = AdaptiveLimiter(
+        app.config["CRAWL_CONCURRENCY_MIN"],
+        workers,
+        app.config["CRAWL_CONCURRENCY_INITIAL"],
+    )
+    scheduler = HostScheduler(
+        app.config["CRAWL_PER_HOST_LIMIT"],
+        app.config["CRAWL_PER_HOST_RATE"],
+        max_pending=app.config["CRAWL_QUEUE_SIZE"],
+    )
+    retry_policies = {
+        name: RetryPolicy(
+            attempts,
+            app.config["CRAWL_RETRY_BASE_DELAY"],
+            app.config["CRAWL_RETRY_MAX_DELAY"],
+        )
+        for name, attempts in app.config["CRAWL_RETRY_ATTEMPTS"].items()
+    }
+    results = asyncio.Queue(maxsize=workers)
+    validators = {}
+    attempts = Counter()
+    retries = 0
+    disallowed = 0
+    fresh_skipped = 0
+    errors = ErrorAggregator(app.config["CRAWL_ERROR_SAMPLES"])
+    robots = None
+    if app.config["ROBOTS_ENABLED"]:
+        robots = RobotsCache(
+            app.config["ROBOTS_USER_AGENT"],
+            app.config["ROBOTS_TTL"],
+            app.config["ROBOTS_MAX_CRAWL_DELAY"],
+        )
+    loop = asyncio.get_event_loop()
+    frontier = None
+    expanding: t.Dict[str, int] = {}
+    expanded = asyncio.Event()
+    if max_depth:
+        frontier = Frontier(
+            app.config["CRAWL_FRONTIER_MEMORY"],
+            app.config["CRAWL_FRONTIER_SPILL_DIR"],
+        )
+        if app.config["CRAWL_ALLOWED_HOSTS"]:
+            scope = Scope(app.config["CRAWL_ALLOWED_HOSTS"])
+        elif app.config["CRAWL_SCOPE"] == "any":
+            scope = Scope()
+        else:
+            scope = Scope(())
+
+    async def produce_frontier(session: aiohttp.ClientSession) -> None:
+        nonlocal fresh_skipped
+        try:
+            for url in read_links(file_path):
+                scope.add(get_host(url))
+                frontier.push(url, 0)
+            while True:
+                chunk = frontier.pop_many(
+                    app.config["CRAWL_LOOKUP_CHUNK_SIZE"]
+                )
+                if not chunk:
+                    if not expanding:
+                        break
+                    expanded.clear()
+                    await expanded.wait()
+                    continue
+                if skip is not None:
+                    chunk = [item for item in chunk if not skip(item[0])]
+                fresh, stored = Site.lookup(
+                    (url for url, depth in chunk if depth >= max_depth),
+                    get_fresh_since(freshness),
+                )
+                depths = {
+                    url: depth
+                    for url, depth in chunk
+                    if depth < max_depth or url not in fresh
+                }
+                fresh_skipped += len(chunk) - len(depths)
+                allowed = await admit(session, list(depths))
+                # end the transaction of the lookup and robots.txt rules
+                db.session.commit()
+                chunk = [(url, depths[url]) for url in allowed]
+                for url, depth in chunk:
+                    if depth < max_depth:
+                        expanding[url] = depth
+                    elif url in stored:
+                        validators[url] = stored[url]
+                    await scheduler.put(url)
+        finally:
+            await scheduler.close()
+
+    async def expand(
+        url: str, result: t.Union[Fetched, FetchFailure]
+    ) -> None:
+        depth = expanding[url]
+        try:
+            if not isinstance(result, FetchFailure) and result[1]:
+                links = await loop.run_in_executor(
+                    None, extract_links, result[1], url
+                )
+                for link in links:
+                    if link in scope:
+                        frontier.push(link, depth + 1)
+        finally:
+            del expanding[url]
+            expanded.set()
+
+    async def admit(
+        session: aiohttp.ClientSession, urls: t.List[str]
+    ) -> t.List[str]:
+        nonlocal disallowed
+        if robots is None:
+            return urls
+        origins = await robots.load(session, map(get_origin, urls))
+        for origin in origins:
+            delay = robots.crawl_delay(origin)
+            if delay:
+                scheduler.set_delay(get_host(origin), delay)
+        allowed = []
+        for url in urls:
+            if robots.allowed(url):
+                allowed.append(url)
+                continue
+            disallowed += 1
+            await results.put(FetchFailure(url, "RobotsDisallowed"))
+        return allowed
+
+    async def produce(session: aiohttp.ClientSession) -> None:
+        nonlocal fresh_skipped
+        try:
+            links = read_links(file_path)
+            if skip is not None:
+                links = (url for url in links if not skip(url))
+            for chunk in chunked(
+                links, app.config["CRAWL_LOOKUP_CHUNK_SIZE"]
+            ):
+                fresh, stored = Site.lookup(
+                    (site_url(url) for url in chunk),
+                    get_fresh_since(freshness),
+                )
+                if fresh:
+                    fresh_skipped += len(fresh)
+                    chunk = [
+                        url for url in chunk if site_url(url) not in fresh
+                    ]
+                chunk = await admit(session, chunk)
+                # end the transaction of the lookup and robots.txt rules,
+                # the crawl may run apart from the writer of its results
+                db.session.commit()
+                for url in chunk:
+                    if site_url(url) in stored:
+                        validators[url] = stored[site_url(url)]
+                    await scheduler.put(url)
+        finally:
+            await scheduler.close()
+
+    async def work(session: aiohttp.ClientSession) -> None:
+        nonlocal retries
+        while True:
+            wait = time.perf_counter()
+            url = await scheduler.get()
+            if url is None:
+                break
+            start = time.perf_counter()
+            SLOT_WAIT_SECONDS.observe(start - wait, slot="host")
+            # the limiter counts requests in flight only, not the workers
+            # waiting for their host slots or crawl delays
+            await limiter.acquire()
+            wait, start = start, time.perf_counter()
+            SLOT_WAIT_SECONDS.observe(start - wait, slot="limiter")
+            timings = {}
+            IN_FLIGHT.inc()
+            try:
+                result = await fetch(
+                    session,
+                    url,
+                    validators.get(url),
+                    timings,
+                    full_body=url in expanding,
+                )
+            finally:
+                IN_FLIGHT.dec()
+                await scheduler.release(url)
+            record_fetch(result, timings, time.perf_counter() - start)
+            if fetch_stats is not None:
+                fetch_stats.append(create_fetch_stat(url, result, timings))
+            if isinstance(result, FetchFailure) and result.is_congestion:
+                await limiter.release(error=True)
+            else:
+                await limiter.release(time.perf_counter() - start)
+            if isinstance(result, FetchFailure):
+                policy = retry_policies.get(result.retry_class)
+                delay = policy and policy.delay(attempts[url])
+                if delay is not None:
+                    attempts[url] += 1
+                    retries += 1
+                    scheduler.put_later(url, delay)
+                    continue
+            attempts.pop(url, None)
+            validators.pop(url, None)
+            if url in expanding:
+                await expand(url, result)
+            await results.put(result)
+        await results.put(_DONE)
+
+    connector = aiohttp.TCPConnector(
+        ssl=False,
+        limit=workers,
+        limit_per_host=app.config["CRAWL_PER_HOST_LIMIT"],
+        ttl_dns_cache=app.config["CRAWL_DNS_CACHE_TTL"],
+        keepalive_timeout=app.config["CRAWL_KEEPALIVE_TIMEOUT"],
+    )
     async with aiohttp.ClientSession(
-        connector=aiohttp.TCPConnector(ssl=False)
+        connector=connector, trace_configs=[create_trace_config()]
     ) as session:
-        with open(file_path, "r") as file:
-            links = set(url[:-1] for url in file.readlines())
-            tasks = [fetch(session, semaphore, url) for url in links]
-        return await asyncio.gather(*tasks)
+        producer = asyncio.ensure_future(
+            produce_frontier(session)
+            if frontier is not None
+            else produce(session)
+        )
+        tasks = [
+            asyncio.ensure_future(work(session)) for _ in range(workers)
+        ]
+        try:
+            finished = 0
+            while finished < workers:
+                item = await results.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                if isinstance(item, FetchFailure):
+                    errors.add(*item)
+                yield item
+            await producer
+        finally:
+            for task in [producer, *tasks]:
+                task.cancel()
+            await asyncio.gather(producer, *tasks, return_exceptions=True)
+            if errors:
+                app.logger.warning(
+                    {"file": str(file_path), "errors": errors.summary()}
+                )
+            if stats is not None:
+                stats.update(
+                    concurrency=limiter.limit,
+                    peak_concurrency=limiter.peak,
+                    retries=retries,
+                    robots_disallowed=disallowed,
+                    fresh_skipped=fresh_skipped,
+                    errors=errors.summary(),
+                )
+            if frontier is not None:
+                if stats is not None:
+                    stats.update(
+                        discovered=len(frontier.visited),
+                        frontier_spilled=frontier.spilled,
+                    )
+                frontier.close()
+
+
+async def extract(
+    results: t.AsyncIterator[t.Union[Fetched, FetchFailure]],
+    executor: t.Optional[Executor],
+    batch_size: int,
+    title_only: bool = False,
+    max_pending: int = 2,
+) -> t.AsyncIterator[t.Union[Extracted, FetchFailure]]:
+    """Extract page titles from crawl() results.
+
+    Bodies are sent to the executor by batches while the crawl keeps
+    going, so the extraction runs in parallel with fetching. The number
+    of batches in flight is limited to keep memory usage bounded.
+    Without an executor titles are extracted in the current process.
+
+    Args:
+        results (AsyncIterator[Union[Fetched, FetchFailure]]):
+            crawl() results
+        executor (Optional[Executor]): executor to run extraction in
+        batch_size (int): number of pages sent to the executor at once
+        title_only (bool, optional): bodies hold only the beginning
+            of the pages. Defaults to False.
+        max_pending (int, optional): maximum number of batches sent
+            to the executor at once. Defaults to 2.
+
+    Yields:
+        AsyncIterator[Union[Extracted, FetchFailure]]: url, title,
+        request time and response validators, failures are passed as is.
+        Title is None for the pages that haven't been modified.
+    """
+    if executor is None:
+        async for item in results:
+            if isinstance(item, FetchFailure) or item[1] is None:
+                yield item
+                continue
+            url, body, time_, validators = item
+            with EXTRACT_SECONDS.time():
+                title = extract_titles([body], title_only)[0]
+            yield url, title, time_, validators
+        return
+
+    loop = asyncio.get_event_loop()
+
+    async def submit(batch: t.List[Fetched]) -> t.List[Extracted]:
+        urls, bodies, times, validators = zip(*batch)
+        with EXTRACT_SECONDS.time():
+            titles = await loop.run_in_executor(
+                executor, extract_titles, list(bodies), title_only
+            )
+        return list(zip(urls, titles, times, validators))
+
+    pending = set()
+    batch = []
+    async for item in results:
+        if isinstance(item, FetchFailure) or item[1] is None:
+            yield item
+            continue
+        batch.append(item)
+        if len(batch) >= batch_size:
+            pending.add(asyncio.ensure_future(submit(batch)))
+            batch = []
+        done = {future for future in pending if future.done()}
+        if len(pending) >= max_pending:
+            done, _ = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+        for future in done:
+            pending.discard(future)
+            for extracted in future.result():
+                yield extracted
+    if batch:
+        pending.add(asyncio.ensure_future(submit(batch)))
+    for future in asyncio.as_completed(pending):
+        for extracted in await future:
+            yield extracted
+
+
+def iterate_async(
+    iterator: t.AsyncIterator[t.Any], max_pending: int
+) -> t.Iterator[t.Any]:
+    """Iterate over an asynchronous iterator from synchronous code.
+
+    The iterator runs on its own event loop in a background thread,
+    within the current app context, and hands the items over through
+    a bounded queue. So the loop keeps requests going while the caller
+    is busy, e.g. writing the previous items to the database, until
+    max_pending items are waiting to be taken. The iterator is closed
+    once the caller stops iterating. The thread's database session is
+    removed when it exits.
+
+    Args:
+        iterator (AsyncIterator[Any]): asynchronous iterator
+        max_pending (int): number of items waiting for the caller
+
+    Raises:
+        Exception: exception raised by the iterator
+
+    Yields:
+        Iterator[Any]: items of the asynchronous iterator
+    """
+    items = queue.Queue(max_pending)
+    stop = threading.Event()
+    context = app._get_current_object().app_context()
+
+    def put(item: t.Tuple[str, t.Any]) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def pump(loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            async for item in iterator:
+                try:
+                    items.put_nowait(("item", item))
+                except queue.Full:
+                    # wait off the loop, so requests in flight go on
+                    if not await loop.run_in_executor(
+                        None, put, ("item", item)
+                    ):
+                        break
+        finally:
+            await iterator.aclose()
+
+    def run() -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        with context:
+            try:
+                loop.run_until_complete(pump(loop))
+            except BaseException as e:
+                put(("error", e))
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+                db.session.remove()
+                put(("done", None))
+
+    thread = threading.Thread(target=run, name="crawl-loop", daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == "done":
+                break
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def create_extract_pool() -> t.Optional[Executor]:
+    """Create the process pool titles are extracted in.
+
+    Worker processes are spawned rather than forked, the app runs
+    several threads by the time the pool starts its processes.
+    Python 3.6 pools can't be given a start method and keep forking.
+
+    Returns:
+        Optional[Executor]: pool of CRAWL_EXTRACT_WORKERS processes,
+        None when extraction runs in the current process
+    """
+    workers = app.config["CRAWL_EXTRACT_WORKERS"]
+    if not workers:
+        return None
+    options = {}
+    if sys.version_info >= (3, 7):
+        options["mp_context"] = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, **options)
+
+
+def parse_sites(
+    user: User,
+    file_path: str,
+    skip: t.Optional[t.Callable[[str], bool]] = None,
+    stats: t.Optional[t.Dict[str, t.Any]] = None,
+    fetch_stats: t.Optional[t.List[t.Dict[str, t.Any]]] = None,
+    max_depth: int = 0,
+    freshness: int = 0,
+    executor: t.Optional[Executor] = None,
+) -> t.Iterator[t.Union[t.Dict[str, t.Any], FetchFailure]]:
+    """Parse links from the file into Site model attributes and values.
+
+    Sites are yielded as soon as they've been fetched,
+    without waiting for the whole file to be crawled.
+    Without an executor a pool is created for the call and shut down
+    once it's over, callers parsing several files should share one.
+
+    Args:
+        user (User): SQLAlchemy User model instance
+        file_path (str): destination to user uploaded file with links to parse
+        skip (Optional[Callable[[str], bool]], optional): predicate
+            telling which links shouldn't be fetched. Defaults to None.
+        stats (Optional[Dict[str, Any]], optional): dictionary the crawl
+            statistics are reported to. Defaults to None.
+        fetch_stats (Optional[List[Dict[str, Any]]], optional): list
+            request timings are appended to. Defaults to None.
+        max_depth (int, optional): number of links to follow from the
+            links of the file. Defaults to 0.
+        freshness (int, optional): number of seconds parsed sites
+            aren't crawled again for, 0 to crawl them all. Defaults to 0.
+        executor (Optional[Executor], optional): pool titles are
+            extracted in, created by create_extract_pool.
+            Defaults to None.
+
+    Yields:
+        Iterator[Union[Dict[str, Any], FetchFailure]]: dictionary with Site
+        model attributes and values, FetchFailure for the failed links
+    """
+    workers = app.config["CRAWL_EXTRACT_WORKERS"]
+    owned = executor is None
+    if owned:
+        executor = create_extract_pool()
+    results = extract(
+        crawl(file_path, skip, stats, fetch_stats, max_depth, freshness),
+        executor,
+        app.config["CRAWL_EXTRACT_BATCH_SIZE"],
+        app.config["CRAWL_TITLE_ONLY"],
+        max_pending=workers * 2,
+    )
+    try:
+        for item in iterate_async(
+            results, app.config["CRAWL_COMMIT_CHUNK_SIZE"]
+        ):
+            if isinstance(item, FetchFailure):
+                yield item
+                continue
+            yield build_site_dict(user, *item)
+    finally:
+        if owned and executor is not None:
+            executor.shutdown()
 
 
 def create_sites_list(
-    user: User, file_path: str
+    user: User,
+    file_path: str,
+    counters: t.Optional[t.Counter[str]] = None,
 ) -> t.Iterator[t.Dict[str, t.Any]]:
     """Create a list of SQLAlchemy Site model instances.
 
+    Sites are yielded as soon as they've been fetched,
+    without waiting for the whole file to be crawled.
+
     Args:
         user (User): SQLAlchemy User model instance
         file_path (str): destination to user uploaded file with links to parse
+        counters (Optional[Counter[str]], optional): counter of 'parsed'
+            and 'failed' links updated while crawling. Defaults to None.
 
     Returns:
         Dict[str, Any]: dictionary with Site
@@ -195,36 +1059,170 @@ def create_sites_list(
         Iterator[Dict[str, Any]]: generator that results dictionary with Site
         model attributes and values
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    semaphore = asyncio.BoundedSemaphore(500)
-    data = loop.run_until_complete(crawl(file_path, semaphore))
-    exceptions_counter = 0
-    for item in data:
-        if not item:
-            exceptions_counter += 1
+    if counters is None:
+        counters = Counter()
+    for item in parse_sites(user, file_path):
+        if isinstance(item, FetchFailure):
+            counters["failed"] += 1
             continue
-        url, body, time_ = item
-        yield create_site_dict(user, url, body, time_)
-    if exceptions_counter:
-        flash(
-            f"{exceptions_counter} site{'s' if exceptions_counter > 2 else ''}\
-                 ha{'ve' if exceptions_counter > 1 else 's'}n't \
-                     been parsed due the connection errors!",
-            category="warning",
-        )
+        counters["parsed"] += 1
+        yield item
+
+
+def update_failures(
+    user: User,
+    sites: t.List[t.Dict[str, t.Any]],
+    failures: t.List[FetchFailure],
+    run: t.Optional[ParseRun] = None,
+) -> None:
+    """Record failed links in the user's failure ledger and forget
+    the parsed ones. Changes aren't committed.
+
+    Args:
+        user (User): User model instance
+        sites (List[Dict[str, Any]]): parsed sites
+        failures (List[FetchFailure]): failed links
+        run (Optional[ParseRun], optional): run the links have been
+            crawled in. Defaults to None.
+    """
+    CrawlFailure.record(
+        user,
+        (
+            (
+                site_url(failure.url),
+                failure.error,
+                failure.status,
+                failure.retry_class is not None,
+            )
+            for failure in failures
+        ),
+        run,
+    )
+    CrawlFailure.clear(user, (url_hash(site["url"]) for site in sites))
 
 
-def commit_parsed(user: User, file_path: PosixPath) -> None:
+def commit_parsed(
+    user: User,
+    file_path: PosixPath,
+    run: t.Optional[ParseRun] = None,
+    resume: bool = False,
+    max_depth: t.Optional[int] = None,
+    failures_only: bool = False,
+    freshness: t.Optional[int] = None,
+) -> t.Counter[str]:
     """Parse and commit sites to the database.
     It creates list of asynchronously parsed sites
-    that are committed to the database.
+    that are written to the database in bulk, one commit
+    per chunk of CRAWL_COMMIT_CHUNK_SIZE links.
+
+    Within a parse run every commit also checkpoints the completed
+    (parsed or failed) links and the run counters, so the resumed
+    run skips the links that have already been done. Crawl statistics
+    are logged and stored on the run when it's over. Timings of every
+    request are stored as FetchStat records if CRAWL_FETCH_STATS is set,
+    and summarized into run percentiles. With CRAWL_PROCESSES above one
+    links are crawled by that many processes, sharded by host.
+    Failed links are kept in the user's CrawlFailure ledger until
+    they're parsed, so a run may retry only the links of the file
+    which have failed with a retryable error. Links which sites have
+    been parsed within the freshness window aren't crawled again.
+
     Args:
         user (User): User model instance
         file_path (PosixPath): path to the file to parse
+        run (Optional[ParseRun], optional): parse run to checkpoint.
+            Defaults to None.
+        resume (bool, optional): skip links completed by the previous
+            execution of the run. Defaults to False.
+        max_depth (Optional[int], optional): number of links to follow
+            from the links of the file, the run one or CRAWL_MAX_DEPTH
+            if None. Defaults to None.
+        failures_only (bool, optional): parse only the links which have
+            failed with a retryable error, always set for the runs
+            in that mode. Defaults to False.
+        freshness (Optional[int], optional): number of seconds parsed
+            sites aren't crawled again for, the run one
+            or CRAWL_FRESHNESS_TTL if None. Defaults to None.
+
+    Returns:
+        Counter[str]: number of 'parsed' and 'failed' links
     """
-    sites = create_sites_list(user, file_path)
-    for site in sites:
-        app.logger.info(f"Working... {site['url']}")
-        Site.update_or_create(site)
-    db.session.commit()
+    if run is not None and run.failures_only:
+        failures_only = True
+    if max_depth is None and run is not None:
+        max_depth = run.max_depth
+    if max_depth is None:
+        max_depth = app.config["CRAWL_MAX_DEPTH"]
+    if freshness is None:
+        freshness = get_freshness(run)
+    counters = Counter()
+    skip = None
+    done = failed = None
+    if run is not None and resume:
+        counters.update(parsed=run.parsed, failed=run.failed)
+        done = CrawlCheckpoint.get_hashes(run)
+    if failures_only:
+        failed = CrawlFailure.get_hashes(user)
+    if done is not None or failed is not None:
+
+        def skip(url: str) -> bool:
+            hash_ = url_hash(site_url(url))
+            if done is not None and hash_ in done:
+                return True
+            return failed is not None and hash_ not in failed
+
+    stats = {}
+    fetch_stats = [] if app.config["CRAWL_FETCH_STATS"] else None
+    processes = app.config["CRAWL_PROCESSES"]
+    if processes > 1:
+        links = read_links(file_path)
+        if skip is not None:
+            links = (url for url in links if not skip(url))
+        items = parse_sites_sharded(
+            user, links, processes, stats, fetch_stats, max_depth, freshness
+        )
+    else:
+        items = parse_sites(
+            user, file_path, skip, stats, fetch_stats, max_depth, freshness
+        )
+    for chunk in chunked(items, app.config["CRAWL_COMMIT_CHUNK_SIZE"]):
+        sites = [item for item in chunk if isinstance(item, dict)]
+        failures = [item for item in chunk if isinstance(item, FetchFailure)]
+        counters["parsed"] += len(sites)
+        counters["failed"] += len(failures)
+        if sites:
+            Site.bulk_upsert(sites)
+        update_failures(user, sites, failures, run)
+        if fetch_stats:
+            batch = drain(fetch_stats)
+            for stat in batch:
+                stat["run_id"] = run and run.id
+            FetchStat.add_all(batch)
+        if run is not None:
+            completed = [site["url"] for site in sites]
+            completed.extend(site_url(failure.url) for failure in failures)
+            CrawlCheckpoint.add(run, map(url_hash, completed))
+            run.parsed = counters["parsed"]
+            run.failed = counters["failed"]
+        db.session.commit()
+        app.logger.info(f"Working... {len(sites)} sites committed")
+    if fetch_stats:
+        for stat in fetch_stats:
+            stat["run_id"] = run and run.id
+        FetchStat.add_all(fetch_stats)
+        db.session.commit()
+    if run is not None and fetch_stats is not None:
+        stats["timings"] = FetchStat.summary(run)
+    # failures have been logged by crawl()
+    app.logger.info(
+        {
+            "file": str(file_path),
+            **counters,
+            **{key: value for key, value in stats.items() if key != "errors"},
+        }
+    )
+    if run is not None:
+        run.stats = stats
+        run.checkpoints.delete()
+        db.session.commit()
+    return counters
@@ -0,0 +1,206 @@
+import asyncio
+import typing as t
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+from .models import RobotsRule
+
+MAX_ROBOTS_BYTES = 512 * 1024
+
+
+def get_origin(url: str) -> str:
+    """Get the origin robots.txt of the URL applies to.
+
+    Args:
+        url (str): canonical URL
+
+    Returns:
+        str: 'scheme://host[:port]'
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc.rpartition('@')[2]}"
+
+
+def create_parser(status: int, content: str) -> t.Optional[RobotFileParser]:
+    """Parse robots.txt fetched with the status.
+
+    Following RFC 9309 a missing robots.txt (4xx status) allows
+    everything. Access errors (401 and 403) are treated as a complete
+    disallow, the way urllib.robotparser does.
+
+    Args:
+        status (int): robots.txt response status
+        content (str): robots.txt content
+
+    Returns:
+        Optional[RobotFileParser]: parsed rules, None if there are no rules
+        and everything is allowed
+    """
+    parser = RobotFileParser()
+    if status in (401, 403):
+        parser.disallow_all = True
+        return parser
+    if status >= 400 or not content.strip():
+        return None
+    parser.parse(content.splitlines())
+    parser.modified()
+    if not parser.entries and parser.default_entry is None:
+        return None
+    return parser
+
+
+class RobotsCache:
+    """Cache of the hosts robots.txt rules and crawl delays.
+
+    Every origin's robots.txt is fetched once and persisted as
+    a RobotsRule, so it's reused by the following parse runs until
+    it's older than the TTL. Rules are looked up by the origin in
+    a dictionary, parsing happens once per origin. Unavailable
+    robots.txt (server errors, timeouts) allows everything and isn't
+    persisted, so it's requested again by the next run.
+
+    Args:
+        user_agent (str): user agent the rules are matched against
+        ttl (float): number of seconds robots.txt is kept for
+        max_delay (Optional[float], optional): upper bound of the crawl
+            delay in seconds. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        user_agent: str,
+        ttl: float,
+        max_delay: t.Optional[float] = None,
+    ) -> None:
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.max_delay = max_delay
+        self._parsers: t.Dict[str, t.Optional[RobotFileParser]] = {}
+
+    def __contains__(self, origin: str) -> bool:
+        return origin in self._parsers
+
+    def allowed(self, url: str) -> bool:
+        """Whether the URL may be fetched, its origin has to be loaded.
+
+        Args:
+            url (str): canonical URL
+
+        Returns:
+            bool: True if the URL isn't disallowed
+        """
+        parser = self._parsers.get(get_origin(url))
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, origin: str) -> t.Optional[float]:
+        """Get the crawl delay declared in the origin robots.txt.
+
+        Request-rate is taken into account as well.
+
+        Args:
+            origin (str): loaded origin
+
+        Returns:
+            Optional[float]: delay between requests in seconds,
+            None if it isn't declared
+        """
+        parser = self._parsers.get(origin)
+        if parser is None or parser.disallow_all:
+            return None
+        delays = []
+        delay = parser.crawl_delay(self.user_agent)
+        if delay is not None:
+            delays.append(float(delay))
+        rate = parser.request_rate(self.user_agent)
+        if rate is not None and rate.requests:
+            delays.append(rate.seconds / rate.requests)
+        if not delays:
+            return None
+        delay = max(delays)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+    async def load(
+        self, session: aiohttp.ClientSession, origins: t.Iterable[str]
+    ) -> t.List[str]:
+        """Load rules of the origins that haven't been loaded yet.
+
+        Fresh persisted rules are read from the database with a single
+        query, the missing ones are fetched concurrently and persisted.
+        New rules aren't committed.
+
+        Args:
+            session (aiohttp.ClientSession): aiohttp Session
+            origins (Iterable[str]): origins to load
+
+        Returns:
+            List[str]: newly loaded origins
+        """
+        missing = {origin for origin in origins if origin not in self}
+        if not missing:
+            return []
+        since = datetime.utcnow() - timedelta(seconds=self.ttl)
+        stored = RobotsRule.get_fresh(missing, since)
+        for origin, (status, content) in stored.items():
+            self._parsers[origin] = create_parser(status, content)
+        fetched = await asyncio.gather(
+            *(
+                self.fetch(session, origin)
+                for origin in missing
+                if origin not in stored
+            )
+        )
+        rules = []
+        for rule in fetched:
+            if rule is None:
+                continue
+            self._parsers[rule["origin"]] = create_parser(
+                rule["status"], rule["content"]
+            )
+            rules.append(rule)
+        for origin in missing:
+            self._parsers.setdefault(origin, None)
+        RobotsRule.save_all(rules)
+        return list(missing)
+
+    async def fetch(
+        self, session: aiohttp.ClientSession, origin: str
+    ) -> t.Optional[t.Dict[str, t.Any]]:
+        """Fetch robots.txt of the origin.
+
+        Args:
+            session (aiohttp.ClientSession): aiohttp Session
+            origin (str): origin to fetch robots.txt of
+
+        Returns:
+            Optional[Dict[str, Any]]: RobotsRule attributes and values,
+            None if robots.txt is unavailable
+        """
+        try:
+            async with session.get(
+                f"{origin}/robots.txt",
+                timeout=aiohttp.ClientTimeout(total=10),
+            ) as response:
+                if response.status >= 500:
+                    return None
+                data = bytearray()
+                if response.status < 400:
+                    async for chunk in response.content.iter_any():
+                        data.extend(chunk)
+                        if len(data) >= MAX_ROBOTS_BYTES:
+                            break
+                content = data[:MAX_ROBOTS_BYTES].decode(
+                    "utf-8", errors="replace"
+                )
+                return dict(
+                    origin=origin,
+                    status=response.status,
+                    content=content,
+                    fetched_at=datetime.utcnow(),
+                )
+        except Exception:
+            return None
@@ -1,26 +1,32 @@
-# import redis
+import typing as t
+
 from flask import Blueprint
 from flask import current_app as app
 from flask import (
+    Response,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
-    send_from_directory,
+    stream_with_context,
     url_for,
 )
 from flask_login import current_user, login_required, login_user
-
-# from rq import Queue
 from werkzeug.utils import secure_filename
+from project import db
 
 from .forms import FileUploadForm, LoginForm, RegistrationForm
-from .models import Site, User
-from .parser import commit_parsed
+from .jobs import runner
+from .metrics import CONTENT_TYPE, REGISTRY, REPORT_SECONDS
+from .models import ParseRun, Site, User
 from .utils import (
-    create_xml_report,
+    decode_cursor,
+    encode_cursor,
     flash_form_errors,
+    generate_xml_report,
     get_user_uploads_folder,
+    gzip_chunks,
     user_authenticated,
 )
 
@@ -31,39 +37,95 @@ main_blueprint = Blueprint(
 )
 
 
-# r = redis.Redis(host="redis", port=6379, decode_responses=True)
-# q = Queue(connection=r)
+def list_sites(user: t.Optional[User], template: str, title: str):
+    """Render a page of the newest sites.
 
+    Pages are chained by the 'after' query argument holding the cursor
+    of the last site of the previous page, 'limit' one sets the page
+    size up to SITES_PAGE_SIZE_MAX, 'format=json' returns the page
+    as JSON with the cursor of the next page.
 
-@main_blueprint.route("/")
-@login_required
-def index():
-    """Index application route.
-
-    It includes 'sites' context variable which consists Site DB records.
+    Args:
+        user (Optional[User]): User the sites are parsed by,
+            all the sites if None
+        template (str): template of the HTML page
+        title (str): title of the HTML page
 
     Returns:
-        Template with given context
+        Template with given context or JSON
     """
-    sites = Site.query.all()
+    as_json = request.args.get("format") == "json"
+    limit = request.args.get("limit", app.config["SITES_PAGE_SIZE"], type=int)
+    limit = min(max(limit, 1), app.config["SITES_PAGE_SIZE_MAX"])
+    after = request.args.get("after")
+    try:
+        after = decode_cursor(after) if after else None
+    except ValueError:
+        if as_json:
+            return jsonify({"error": "Invalid 'after' cursor"}), 400
+        flash("Invalid page, showing the first one", category="danger")
+        after = None
+    rows = Site.get_page(user, after, limit + 1)
+    sites = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(sites[-1].created_at, sites[-1].id)
+    if as_json:
+        return (
+            jsonify(
+                {
+                    "sites": [
+                        dict(
+                            id=site.id,
+                            url=site.url,
+                            title=site.title,
+                            user=site.username,
+                            scrapping_time=site.scrapping_time,
+                            created_at=site.created_at.isoformat(),
+                        )
+                        for site in sites
+                    ],
+                    "next": next_cursor,
+                }
+            ),
+            200,
+        )
     return (
         render_template(
-            "index.html",
-            title="Home Page",
+            template,
+            title=title,
             sites=sites or None,
             user=current_user,
+            next_cursor=next_cursor,
+            limit=limit,
+            is_first_page=after is None,
         ),
         200,
     )
 
 
+@main_blueprint.route("/")
+@login_required
+def index():
+    """Index application route.
+
+    It includes 'sites' context variable which consists a page
+    of the newest Site DB records, see list_sites().
+
+    Returns:
+        Template with given context
+    """
+    return list_sites(None, "index.html", "Home Page")
+
+
 @main_blueprint.route("/<user_name>")
 @login_required
 def links_user_specific(user_name: str):
     """Sites filtered by current user.
 
-    It includes 'sites' context variable which consists Site DB
-    records filtered by current user.
+    It includes 'sites' context variable which consists a page
+    of the newest Site DB records filtered by current user,
+    see list_sites().
 
     Args:
         user_name (str): current user username
@@ -71,16 +133,7 @@ def links_user_specific(user_name: str):
     Returns:
         Template with given context
     """
-    sites = Site.query.filter_by(user=current_user).all()
-    return (
-        render_template(
-            "links_list.html",
-            title="Parsed Links",
-            sites=sites or None,
-            user=current_user,
-        ),
-        200,
-    )
+    return list_sites(current_user, "links_list.html", "Parsed Links")
 
 
 @main_blueprint.route("/download")
@@ -88,26 +141,35 @@ def links_user_specific(user_name: str):
 def download():
     """Download XML report route.
 
-    Generates an XML report on list of parsed sites
-    and creates an XML report file as an attachment.
+    Streams an XML report on the parsed sites as an attachment
+    while the sites are read from the database, so the first bytes
+    are sent right away and the memory doesn't grow with the number
+    of sites. Optional 'gzip' query argument compresses the report.
 
     Returns:
-        Redirect to 'index' route, XML report file.
+        Redirect to 'index' route if there are no sites, XML report.
     """
-    sites = Site.query.all()
-    try:
-        report = create_xml_report(sites)
-    except ValueError as e:
-        app.logger.error({"error": str(e)})
-        flash(str(e), category="danger")
-        return redirect(url_for("main_app.download")), 404
-    return (
-        send_from_directory(
-            app.config["FILES_DIR"],
-            report,
-            as_attachment=True,
-        ),
-        200,
+    if db.session.query(Site.id).first() is None:
+        error = "Empty urls list"
+        app.logger.error({"error": error})
+        flash(error, category="danger")
+        return redirect(url_for("main_app.index")), 404
+    compress = bool(request.args.get("gzip", type=int))
+
+    def generate() -> t.Iterator[t.Union[str, bytes]]:
+        with REPORT_SECONDS.time():
+            chunks = generate_xml_report(
+                Site.iter_all(app.config["REPORT_CHUNK_SIZE"])
+            )
+            yield from gzip_chunks(chunks) if compress else chunks
+
+    file_name = "sites.xml.gz" if compress else "sites.xml"
+    return Response(
+        stream_with_context(generate()),
+        content_type="application/gzip" if compress else "application/xml",
+        headers={
+            "Content-Disposition": f"attachment; filename={file_name}"
+        },
     )
 
 
@@ -181,8 +243,13 @@ def parse_links(file_name: str):
 
     This route takes a file name as a parameter and searches for that
     file in the current user uploads folder.
-    After the file is being processed, created file instances
-    are committed to the database.
+    The file is parsed by the background job runner, the route only
+    enqueues a parse run and redirects to the runs list. Optional
+    'depth' query argument sets the number of links to follow from
+    the links of the file, 'failures' one makes the run parse only
+    the links of the file which have failed with a retryable error,
+    'fresh' one sets the number of seconds parsed sites aren't crawled
+    again for.
     """
     file_path = get_user_uploads_folder(current_user) / file_name
     if not file_path.exists():
@@ -191,10 +258,97 @@ def parse_links(file_name: str):
             category="danger",
         )
         return redirect(url_for("main_app.upload_file"))
-    user = User.query.filter_by(id=current_user.id).first()
-    commit_parsed(user, file_path)
-    flash("Sites have been added successfully!", category="success")
-    return redirect(url_for("main_app.index"))
+    depth = request.args.get("depth", type=int)
+    failures_only = bool(request.args.get("failures", type=int))
+    freshness = request.args.get("fresh", type=int)
+    run = ParseRun(
+        user_id=current_user.id,
+        file_name=file_name,
+        file_path=str(file_path),
+        max_depth=None if depth is None else max(depth, 0),
+        freshness_ttl=None if freshness is None else max(freshness, 0),
+        distributed=app.config["CRAWL_WORK_TABLE"],
+        failures_only=failures_only,
+    )
+    run.commit_to_db()
+    runner.enqueue(run)
+    if failures_only:
+        flash(
+            f"Parsing of the failed links of {file_name} has been started",
+            category="success",
+        )
+    else:
+        flash(f"Parsing of {file_name} has been started", category="success")
+    return redirect(url_for("main_app.list_user_runs"))
+
+
+@main_blueprint.route("/runs")
+@login_required
+def list_user_runs():
+    """List of parse runs started by the user route."""
+    runs = ParseRun.get_by_user(current_user)
+    resumable = {run.id for run in runs if runner.is_orphaned(run)}
+    return (
+        render_template(
+            "runs.html",
+            title="Parse Runs",
+            runs=runs,
+            resumable=resumable,
+        ),
+        200,
+    )
+
+
+@main_blueprint.route("/runs/<int:run_id>/resume")
+@login_required
+def resume_run(run_id: int):
+    """Resume interrupted parse run route.
+
+    The run continues from its last checkpoint, links that have
+    already been parsed are skipped. Of the concurrent requests only
+    one resumes the run.
+
+    Args:
+        run_id (int): ParseRun id
+    """
+    run = ParseRun.query.filter_by(
+        id=run_id, user_id=current_user.id
+    ).first()
+    if (
+        run is None
+        or not runner.is_orphaned(run)
+        or not runner.claim(run)
+    ):
+        flash(f"Run {run_id} can't be resumed", category="danger")
+        return redirect(url_for("main_app.list_user_runs"))
+    runner.enqueue(run, resume=True)
+    flash(f"Run {run_id} has been resumed", category="success")
+    return redirect(url_for("main_app.list_user_runs"))
+
+
+@main_blueprint.route("/runs/<int:run_id>")
+@login_required
+def run_status(run_id: int):
+    """Parse run status route.
+
+    Args:
+        run_id (int): ParseRun id
+
+    Returns:
+        JSON with the run status and counters
+    """
+    run = ParseRun.query.filter_by(
+        id=run_id, user_id=current_user.id
+    ).first()
+    if run is None:
+        return jsonify({"error": f"Run {run_id} doesn't exist"}), 404
+    return jsonify(run.to_dict()), 200
+
+
+@main_blueprint.route("/metrics")
+def metrics_view():
+    """Crawler and web app metrics in Prometheus text format route."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 
 @main_blueprint.route("/login", methods=["GET"])
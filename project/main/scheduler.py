@@ -0,0 +1,351 @@
+import asyncio
+import random
+import time
+import typing as t
+from collections import deque
+from urllib.parse import urlsplit
+
+
+def get_host(url: str) -> str:
+    """Get the host name of the URL.
+
+    Args:
+        url (str): URL string
+
+    Returns:
+        str: lowercased host name, the URL itself if it has no host
+    """
+    return (urlsplit(url).hostname or url).lower()
+
+
+class HostScheduler:
+    """Politeness scheduler handing out URLs host by host.
+
+    URLs are grouped by host and handed out in round-robin order,
+    so a single host with thousands of URLs can't take all the crawl
+    slots. Every host has a limit of concurrent requests and, optionally,
+    a minimal interval between requests.
+
+    Args:
+        per_host_limit (int): maximum number of concurrent requests per host
+        per_host_rate (Optional[float], optional): maximum number of requests
+            per second per host, unlimited if None. Defaults to None.
+        max_pending (int, optional): maximum number of queued URLs,
+            put() waits until there is room for a new one. Defaults to 1000.
+    """
+
+    def __init__(
+        self,
+        per_host_limit: int,
+        per_host_rate: t.Optional[float] = None,
+        max_pending: int = 1000,
+    ) -> None:
+        self.per_host_limit = per_host_limit
+        self.per_host_rate = per_host_rate
+        self.max_pending = max_pending
+        self._queues: t.Dict[str, t.Deque[str]] = {}
+        self._hosts: t.Deque[str] = deque()
+        self._active: t.Dict[str, int] = {}
+        self._next_request: t.Dict[str, float] = {}
+        self._delays: t.Dict[str, float] = {}
+        self._pending = 0
+        self._delayed = 0
+        self._closed = False
+        lock = asyncio.Lock()
+        self._ready = asyncio.Condition(lock)
+        self._space = asyncio.Condition(lock)
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def interval(self, host: str) -> float:
+        """Minimal interval between two requests to the host in seconds."""
+        interval = 1 / self.per_host_rate if self.per_host_rate else 0
+        return max(interval, self._delays.get(host, 0))
+
+    def set_delay(self, host: str, delay: float) -> None:
+        """Set the minimal interval between requests to the host,
+        e.g. the crawl delay declared by the host itself.
+
+        Args:
+            host (str): lowercased host name
+            delay (float): interval in seconds
+        """
+        self._delays[host] = delay
+
+    async def put(self, url: str) -> None:
+        """Queue the URL, wait until there is room for it if needed.
+
+        Args:
+            url (str): URL to queue
+        """
+        async with self._space:
+            while self._pending >= self.max_pending:
+                await self._space.wait()
+            self._push(url)
+            self._ready.notify()
+
+    def put_later(self, url: str, delay: float) -> None:
+        """Queue the URL again after the delay.
+
+        The URL doesn't take any slot while waiting and is put
+        in front of its host queue once the delay has passed.
+        The scheduler isn't exhausted until all the delayed URLs
+        have been handed out.
+
+        Args:
+            url (str): URL to queue
+            delay (float): delay in seconds
+        """
+        self._delayed += 1
+        asyncio.get_event_loop().call_later(delay, self._requeue_soon, url)
+
+    def _requeue_soon(self, url: str) -> None:
+        asyncio.ensure_future(self._requeue(url))
+
+    async def _requeue(self, url: str) -> None:
+        async with self._ready:
+            self._delayed -= 1
+            self._push(url, first=True)
+            self._ready.notify()
+
+    def _push(self, url: str, first: bool = False) -> None:
+        host = get_host(url)
+        queue = self._queues.get(host)
+        if queue is None:
+            queue = self._queues[host] = deque()
+            self._hosts.append(host)
+        if first:
+            queue.appendleft(url)
+        else:
+            queue.append(url)
+        self._pending += 1
+
+    async def close(self) -> None:
+        """Mark that no more URLs will be queued."""
+        async with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+
+    async def get(self) -> t.Optional[str]:
+        """Get the next URL that may be requested right now.
+
+        Waits until some host has a free slot and its request
+        interval has passed. The host slot is taken until
+        release() is called for the returned URL.
+
+        Returns:
+            Optional[str]: URL to request, None if the scheduler is closed
+            and all the URLs have been handed out
+        """
+        async with self._ready:
+            while True:
+                url, delay = self._pop()
+                if url is not None:
+                    self._space.notify()
+                    return url
+                if self._closed and not self._pending and not self._delayed:
+                    self._ready.notify_all()
+                    return None
+                try:
+                    await asyncio.wait_for(self._ready.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, url: str) -> None:
+        """Free the host slot taken by get().
+
+        Args:
+            url (str): URL returned by get()
+        """
+        host = get_host(url)
+        async with self._ready:
+            self._active[host] -= 1
+            if not self._active[host] and host not in self._queues:
+                del self._active[host]
+                if self._next_request.get(host, 0) <= time.monotonic():
+                    self._next_request.pop(host, None)
+            self._ready.notify()
+
+    def _pop(self) -> t.Tuple[t.Optional[str], t.Optional[float]]:
+        """Pop the URL of the next host in rotation that may be requested.
+
+        Returns:
+            Tuple[Optional[str], Optional[float]]: URL (None if there is
+            no such host) and the time to wait until the nearest host
+            becomes available due to its request interval
+        """
+        now = time.monotonic()
+        delay = None
+        for _ in range(len(self._hosts)):
+            host = self._hosts[0]
+            self._hosts.rotate(-1)
+            if self._active.get(host, 0) >= self.per_host_limit:
+                continue
+            wait = self._next_request.get(host, 0) - now
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            queue = self._queues[host]
+            url = queue.popleft()
+            if not queue:
+                del self._queues[host]
+                self._hosts.pop()
+            self._pending -= 1
+            self._active[host] = self._active.get(host, 0) + 1
+            interval = self.interval(host)
+            if interval:
+                self._next_request[host] = now + interval
+            return url, None
+        return None, delay
+
+
+class RetryPolicy:
+    """Exponential back-off with full jitter.
+
+    Args:
+        attempts (int): maximum number of retries
+        base_delay (float): delay before the first retry in seconds
+        max_delay (float): upper bound of the delay in seconds
+    """
+
+    def __init__(
+        self, attempts: int, base_delay: float, max_delay: float
+    ) -> None:
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> t.Optional[float]:
+        """Get the delay before the retry.
+
+        Args:
+            attempt (int): number of retries already made
+
+        Returns:
+            Optional[float]: delay in seconds, None if no retries are left
+        """
+        if attempt >= self.attempts:
+            return None
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt)
+        )
+
+
+class AdaptiveLimiter:
+    """AIMD limiter of the number of requests in flight.
+
+    Outcomes of the requests are collected into a rolling window. Once
+    per window the limit is cut multiplicatively if too many requests
+    have timed out or failed to connect, or if the average latency has
+    grown well above the baseline. Otherwise, if the window is fully
+    used, the limit is raised additively. The baseline is the best
+    average latency seen so far, slowly drifting towards the current one
+    so that a list of slower hosts doesn't keep the limit at its minimum.
+
+    Args:
+        min_limit (int): lower bound of the limit
+        max_limit (int): upper bound of the limit
+        initial (Optional[int], optional): initial limit, defaults to
+            min_limit. Defaults to None.
+        sample_size (int, optional): number of outcomes the decision
+            is made on. Defaults to 50.
+        error_threshold (float, optional): error rate the limit is
+            decreased at. Defaults to 0.1.
+        latency_factor (float, optional): latency growth relative to the
+            best one the limit is decreased at. Defaults to 2.0.
+        increase (int, optional): additive increase step. Defaults to 2.
+        decrease (float, optional): multiplicative decrease factor.
+            Defaults to 0.7.
+    """
+
+    DRIFT = 1.1
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        initial: t.Optional[int] = None,
+        sample_size: int = 50,
+        error_threshold: float = 0.1,
+        latency_factor: float = 2.0,
+        increase: int = 2,
+        decrease: float = 0.7,
+    ) -> None:
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = min(
+            max(initial or self.min_limit, self.min_limit), self.max_limit
+        )
+        self.peak = self.limit
+        self.sample_size = sample_size
+        self.error_threshold = error_threshold
+        self.latency_factor = latency_factor
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._errors: t.Deque[bool] = deque(maxlen=sample_size)
+        self._latencies: t.Deque[float] = deque(maxlen=sample_size)
+        self._baseline: t.Optional[float] = None
+        self._saturated = 0
+        self._recorded = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """Wait until the number of requests in flight is under the limit."""
+        async with self._changed:
+            while self.in_flight >= self.limit:
+                await self._changed.wait()
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._saturated += 1
+
+    async def release(
+        self, latency: t.Optional[float] = None, error: bool = False
+    ) -> None:
+        """Free the slot taken by acquire() and record request outcome.
+
+        Nothing is recorded if neither latency nor error is passed.
+
+        Args:
+            latency (Optional[float], optional): request duration in
+                seconds. Defaults to None.
+            error (bool, optional): whether the request has timed out
+                or failed to connect. Defaults to False.
+        """
+        async with self._changed:
+            self.in_flight -= 1
+            limit = self.limit
+            if latency is not None or error:
+                self._record(latency, error)
+            if self.limit > limit:
+                self._changed.notify_all()
+            else:
+                self._changed.notify()
+
+    def _record(self, latency: t.Optional[float], error: bool) -> None:
+        self._errors.append(error)
+        if latency is not None and not error:
+            self._latencies.append(latency)
+        self._recorded += 1
+        if self._recorded < self.sample_size:
+            return
+        error_rate = sum(self._errors) / len(self._errors)
+        latency = None
+        if self._latencies:
+            latency = sum(self._latencies) / len(self._latencies)
+            if self._baseline is None:
+                self._baseline = latency
+            self._baseline = min(latency, self._baseline * self.DRIFT)
+        if error_rate > self.error_threshold or (
+            latency is not None
+            and latency > self._baseline * self.latency_factor
+        ):
+            self.limit = max(
+                int(self.limit * self.decrease), self.min_limit
+            )
+        elif self._saturated:
+            self.limit = min(self.limit + self.increase, self.max_limit)
+            self.peak = max(self.peak, self.limit)
+        self._recorded = 0
+        self._saturated = 0
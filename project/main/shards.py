@@ -0,0 +1,244 @@
+import multiprocessing
+import queue
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+from flask import current_app as app
+
+from .failures import ErrorAggregator
+from .metrics import REGISTRY
+from .models import User
+from .scheduler import get_host
+from .urls import url_hash
+from .utils import drain
+
+ADDITIVE_STATS = (
+    "concurrency",
+    "peak_concurrency",
+    "retries",
+    "robots_disallowed",
+    "fresh_skipped",
+    "discovered",
+    "frontier_spilled",
+)
+
+
+def get_shard(url: str, shards: int) -> int:
+    """Get the shard the URL belongs to by its host hash.
+
+    Args:
+        url (str): canonical URL
+        shards (int): number of shards
+
+    Returns:
+        int: shard index
+    """
+    return url_hash(get_host(url)) % shards
+
+
+def partition_links(
+    links: t.Iterable[str], shards: int, directory: Path
+) -> t.List[Path]:
+    """Split links into per-shard files, all links of a host go together.
+
+    Args:
+        links (Iterable[str]): canonical URLs
+        shards (int): number of shards
+        directory (Path): directory to create shard files in
+
+    Returns:
+        List[Path]: paths of the non-empty shard files
+    """
+    paths = [directory / f"shard-{index}.txt" for index in range(shards)]
+    files = [open(path, "w") for path in paths]
+    counts = [0] * shards
+    try:
+        for url in links:
+            shard = get_shard(url, shards)
+            files[shard].write(f"{url}\n")
+            counts[shard] += 1
+    finally:
+        for file in files:
+            file.close()
+    return [path for path, count in zip(paths, counts) if count]
+
+
+def crawl_shard(
+    config: str,
+    settings: t.Dict[str, t.Any],
+    user_id: int,
+    file_path: str,
+    max_depth: int,
+    freshness: int,
+    results: multiprocessing.Queue,
+) -> None:
+    """Crawl the shard file in the worker process.
+
+    The process runs its own app, event loop and connection pool.
+    Parsed sites, failures and request timings are sent to the parent
+    process by batches, sites without the user attribute, the process
+    metrics are sent along with the final statistics. Nothing but
+    the robots.txt cache is written to the database by the shard:
+    the transaction loading the user is ended right away and the crawl
+    thread ends its own after every chunk of links it looks up.
+
+    Args:
+        config (str): config_map key of the parent app
+        settings (Dict[str, Any]): crawl settings of the parent app
+        user_id (int): id of the user the sites are parsed for
+        file_path (str): shard file path
+        max_depth (int): number of links to follow
+        freshness (int): number of seconds parsed sites aren't crawled
+            again for
+        results (multiprocessing.Queue): queue to send results to
+    """
+    from project import create_app, db, stop_logger
+
+    from .parser import parse_sites
+
+    shard_app = create_app(config)
+    shard_app.config.update(settings, CRAWL_EXTRACT_WORKERS=0)
+    with shard_app.app_context():
+        try:
+            user = User.query.get(user_id)
+            db.session.commit()
+            stats = {}
+            fetch_stats = [] if settings["CRAWL_FETCH_STATS"] else None
+            batch = []
+            sent = time.monotonic()
+            items = parse_sites(
+                user,
+                file_path,
+                None,
+                stats,
+                fetch_stats,
+                max_depth,
+                freshness,
+            )
+            for item in items:
+                if isinstance(item, dict):
+                    item.pop("user")
+                batch.append(item)
+                if (
+                    len(batch) >= settings["CRAWL_SHARD_BATCH_SIZE"]
+                    or time.monotonic() - sent >= 1
+                ):
+                    results.put(("items", batch, drain(fetch_stats or [])))
+                    batch = []
+                    sent = time.monotonic()
+            results.put(("items", batch, drain(fetch_stats or [])))
+            results.put(
+                ("done", file_path, {**stats, "metrics": REGISTRY.dump()})
+            )
+        except Exception as e:
+            results.put(("error", file_path, f"{e.__class__.__name__}: {e}"))
+        finally:
+            db.session.remove()
+            stop_logger(shard_app)
+
+
+def parse_sites_sharded(
+    user: User,
+    links: t.Iterable[str],
+    processes: int,
+    stats: t.Optional[t.Dict[str, t.Any]] = None,
+    fetch_stats: t.Optional[t.List[t.Dict[str, t.Any]]] = None,
+    max_depth: int = 0,
+    freshness: int = 0,
+) -> t.Iterator[t.Any]:
+    """Crawl links in several worker processes.
+
+    Links are partitioned by host hash, so every host is crawled by
+    a single process and per-host limits, robots.txt rules and crawl
+    delays hold across processes. Results are funnelled back to the
+    calling process, which stays the only writer of crawl results.
+    With max_depth every process follows the links it has found
+    itself, within its own scope.
+
+    Args:
+        user (User): SQLAlchemy User model instance
+        links (Iterable[str]): canonical URLs to crawl
+        processes (int): number of worker processes
+        stats (Optional[Dict[str, Any]], optional): dictionary the crawl
+            statistics of all the processes are summed up to.
+            Defaults to None.
+        fetch_stats (Optional[List[Dict[str, Any]]], optional): list
+            request timings are appended to. Defaults to None.
+        max_depth (int, optional): number of links to follow from the
+            links of the file. Defaults to 0.
+        freshness (int, optional): number of seconds parsed sites
+            aren't crawled again for, 0 to crawl them all. Defaults to 0.
+
+    Raises:
+        RuntimeError: worker process has failed
+
+    Yields:
+        Iterator[Union[Dict[str, Any], FetchFailure]]: dictionary with Site
+        model attributes and values, FetchFailure for the failed links
+    """
+    settings = {
+        key: value
+        for key, value in app.config.items()
+        if key.startswith(("CRAWL_", "ROBOTS_"))
+        or key == "SQLALCHEMY_DATABASE_URI"
+    }
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue(maxsize=processes * 4)
+    workers = []
+    errors = ErrorAggregator(app.config["CRAWL_ERROR_SAMPLES"])
+    with tempfile.TemporaryDirectory(prefix="shards-") as directory:
+        paths = partition_links(links, processes, Path(directory))
+        try:
+            for path in paths:
+                worker = context.Process(
+                    target=crawl_shard,
+                    args=(
+                        app.config["CONFIG_NAME"],
+                        settings,
+                        user.id,
+                        str(path),
+                        max_depth,
+                        freshness,
+                        results,
+                    ),
+                    daemon=True,
+                )
+                worker.start()
+                workers.append(worker)
+            running = len(workers)
+            while running:
+                try:
+                    message = results.get(timeout=1)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        raise RuntimeError("Crawl shard has exited")
+                    continue
+                kind, payload, extra = message
+                if kind == "error":
+                    raise RuntimeError(f"Crawl shard has failed: {extra}")
+                if kind == "done":
+                    running -= 1
+                    REGISTRY.load(extra.pop("metrics"))
+                    errors.merge(extra.pop("errors"))
+                    if stats is not None:
+                        for key in ADDITIVE_STATS:
+                            if key in extra:
+                                stats[key] = stats.get(key, 0) + extra[key]
+                    continue
+                if fetch_stats is not None:
+                    fetch_stats.extend(extra)
+                for item in payload:
+                    if isinstance(item, dict):
+                        item["user"] = user
+                    yield item
+            if stats is not None:
+                stats["processes"] = len(workers)
+                stats["errors"] = errors.summary()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+            results.close()
@@ -0,0 +1,97 @@
+import math
+import time
+import typing as t
+from types import SimpleNamespace
+
+import aiohttp
+
+PHASES = ("dns", "connect", "ttfb", "transfer")
+PERCENTILES = (50, 95, 99)
+
+
+def create_trace_config() -> aiohttp.TraceConfig:
+    """Create aiohttp trace config measuring request phases.
+
+    Timings are written in seconds to the dictionary passed to the
+    request as trace_request_ctx: 'dns' for host resolution, 'connect'
+    for establishing the connection (TCP and TLS, aiohttp doesn't signal
+    the handshake separately) and 'ttfb' for the time from the request
+    start until response headers arrive. Phases that haven't happened,
+    e.g. DNS for a cached host or connect for a reused connection,
+    are left out.
+
+    Returns:
+        aiohttp.TraceConfig: trace config to pass to the session
+    """
+
+    def context(ctx: SimpleNamespace) -> t.Dict[str, float]:
+        if ctx.trace_request_ctx is None:
+            ctx.trace_request_ctx = {}
+        return ctx.trace_request_ctx
+
+    async def on_request_start(session, ctx, params) -> None:
+        context(ctx)["_start"] = time.perf_counter()
+
+    async def on_dns_resolvehost_start(session, ctx, params) -> None:
+        context(ctx)["_dns"] = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, ctx, params) -> None:
+        timings = context(ctx)
+        timings["dns"] = time.perf_counter() - timings.pop("_dns")
+
+    async def on_connection_create_start(session, ctx, params) -> None:
+        context(ctx)["_connect"] = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params) -> None:
+        timings = context(ctx)
+        elapsed = time.perf_counter() - timings.pop("_connect")
+        timings["connect"] = max(elapsed - timings.get("dns", 0), 0)
+
+    async def on_request_end(session, ctx, params) -> None:
+        timings = context(ctx)
+        timings["ttfb"] = time.perf_counter() - timings.pop("_start")
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(
+        on_connection_create_start
+    )
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def percentile(values: t.Sequence[float], q: float) -> t.Optional[float]:
+    """Get the nearest-rank percentile of sorted values.
+
+    Args:
+        values (Sequence[float]): values sorted in ascending order
+        q (float): percentile, from 0 to 100
+
+    Returns:
+        Optional[float]: percentile value, None if there are no values
+    """
+    if not values:
+        return None
+    rank = max(math.ceil(q / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(
+    values: t.Iterable[t.Optional[float]],
+) -> t.Optional[t.Dict[str, float]]:
+    """Get percentile summary of the values.
+
+    Args:
+        values (Iterable[Optional[float]]): values, None ones are ignored
+
+    Returns:
+        Optional[Dict[str, float]]: 'p50', 'p95' and 'p99' values,
+        None if there are no values
+    """
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    return {f"p{q}": percentile(values, q) for q in PERCENTILES}
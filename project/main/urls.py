@@ -0,0 +1,60 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """Get the canonical form of the URL.
+
+    Scheme and host are lowercased, default ports, fragments and empty
+    query segments are dropped, query parameters are sorted by name and
+    an empty path becomes '/'. URLs without scheme or host are taken as
+    'http' ones. Path case, trailing slashes other than the root one and
+    the order of values of a repeated parameter are kept, since servers
+    may tell such URLs apart.
+
+    Args:
+        url (str): URL string
+
+    Returns:
+        str: canonical URL, the stripped URL itself if it can't be parsed
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        if not parts.scheme or not parts.netloc:
+            url = f"http://{url.lstrip('/')}"
+            parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    userinfo = parts.netloc.rpartition("@")[0]
+    if userinfo:
+        host = f"{userinfo}@{host}"
+    # sorting is stable, values of a repeated key keep their order
+    params = sorted(
+        (param for param in parts.query.split("&") if param),
+        key=lambda param: param.partition("=")[0],
+    )
+    query = "&".join(params)
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def url_hash(url: str) -> int:
+    """Get a compact 64-bit hash of the URL.
+
+    Args:
+        url (str): URL string
+
+    Returns:
+        int: signed 64-bit integer fitting BigInteger columns
+    """
+    digest = hashlib.blake2b(url.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
@@ -1,69 +1,141 @@
 import random
+import re
 import typing as t
-import uuid
-import xml.etree.ElementTree as ET
+import zlib
 from datetime import datetime
 from functools import wraps
+from itertools import islice
 from pathlib import Path, PosixPath
 from threading import Thread
 from typing import List
-from xml.dom import minidom
+from xml.sax.saxutils import escape
 
-from bs4 import BeautifulSoup
 from faker import Faker
 from flask import current_app as app
 from flask import flash, redirect, url_for
 from flask_login import current_user
 
+from .extract import extract_title
 from .models import Site, User
+from .urls import canonicalize_url
 
 fake = Faker()
 
+# characters XML 1.0 doesn't allow even when escaped
+XML_INVALID = re.compile(
+    "[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]"
+)
 
-def create_xml_report(urls: List[Site]) -> str:
-    """Create an XML report file.
 
-    Creates an XML report file with info
-    on a list of Site database model instances
+def xml_text(value: str) -> str:
+    """Escape the text for an XML element, dropping invalid characters.
 
     Args:
-        urls (List[Site]): List of Site database model instances
+        value (str): text scraped from a page or entered by a user
 
     Returns:
-        str: Created XML report file name
+        str: text safe to put between the element tags
     """
-    if not urls:
-        raise ValueError("Empty urls list")
-    root = ET.Element("Catalog")
-
-    for url in urls:
-        site = ET.Element("site")
-        root.append(site)
-
-        title = ET.SubElement(site, "title")
-        url_str = ET.SubElement(site, "url")
-        user = ET.SubElement(site, "user")
-        scrapping_time = ET.SubElement(site, "scrapping_time")
-        date = ET.SubElement(site, "date")
-
-        title.text = url.title
-        url_str.text = url.url
-        user.text = url.user.username
-        scrapping_time.text = str(url.scrapping_time)
-        date.text = url.created_at.strftime("%B %d %Y")
-
-    tree = minidom.parseString(ET.tostring(root)).toprettyxml(indent=" " * 4)
-    save_path = Path(app.config["FILES_DIR"])
-    if not save_path.exists():
-        save_path.mkdir(parents=True, exist_ok=True)
-    file_name = f"{uuid.uuid4()}.xml"
-    with open(f"{save_path}/{file_name}", "w") as file:
-        file.write(tree)
-    return file_name
+    return escape(XML_INVALID.sub("", value))
+
+
+def generate_xml_report(
+    sites: t.Iterable[Site], buffer_size: int = 64 * 1024
+) -> t.Iterator[str]:
+    """Generate an XML report on the sites piece by piece.
+
+    Every <site> element is written as soon as its site comes in,
+    pieces are yielded once they hold about buffer_size characters,
+    so the memory doesn't depend on the number of sites.
+
+    Args:
+        sites (Iterable[Site]): Site database model instances
+        buffer_size (int, optional): number of characters yielded
+            at once. Defaults to 64 * 1024.
+
+    Yields:
+        Iterator[str]: pieces of the XML document
+    """
+    buffer = ['<?xml version="1.0" ?>\n<Catalog>\n']
+    size = 0
+    for site in sites:
+        piece = (
+            "    <site>\n"
+            f"        <title>{xml_text(site.title)}</title>\n"
+            f"        <url>{xml_text(site.url)}</url>\n"
+            f"        <user>{xml_text(site.user.username)}</user>\n"
+            f"        <scrapping_time>{site.scrapping_time}</scrapping_time>\n"
+            f"        <date>{site.created_at.strftime('%B %d %Y')}</date>\n"
+            "    </site>\n"
+        )
+        buffer.append(piece)
+        size += len(piece)
+        if size >= buffer_size:
+            yield "".join(buffer)
+            buffer.clear()
+            size = 0
+    buffer.append("</Catalog>\n")
+    yield "".join(buffer)
+
+
+def gzip_chunks(
+    chunks: t.Iterable[str], level: int = 6
+) -> t.Iterator[bytes]:
+    """Compress text chunks into a gzip stream as they come in.
+
+    Args:
+        chunks (Iterable[str]): text chunks
+        level (int, optional): compression level. Defaults to 6.
+
+    Yields:
+        Iterator[bytes]: gzip stream chunks, empty ones are skipped
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+CURSOR_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def encode_cursor(created_at: datetime, id_: int) -> str:
+    """Encode the keyset pagination key of the site.
+
+    Args:
+        created_at (datetime): Site created_at in UTC
+        id_ (int): Site id
+
+    Returns:
+        str: cursor to pass in the next page URL
+    """
+    return f"{created_at.strftime(CURSOR_FORMAT)}_{id_}"
+
+
+def decode_cursor(cursor: str) -> t.Tuple[datetime, int]:
+    """Decode encode_cursor() result.
+
+    Args:
+        cursor (str): cursor of the page
+
+    Raises:
+        ValueError: invalid cursor
+
+    Returns:
+        Tuple[datetime, int]: Site created_at and id
+    """
+    created_at, _, id_ = cursor.partition("_")
+    return datetime.strptime(created_at, CURSOR_FORMAT), int(id_)
 
 
 def create_site_dict(
-    user: User, url: str, data: str, time_: float
+    user: User,
+    url: str,
+    data: str,
+    time_: float,
+    title_only: bool = False,
 ) -> t.Dict[str, t.Any]:
     """Create a dictionary of Site model attributes and values
     with passed arguments.
@@ -73,23 +145,102 @@ def create_site_dict(
         url (str): URL string
         data (str): URL page body
         time_ (float): Time in took to make a request
+        title_only (bool, optional): data holds only the beginning
+            of the page, extract title with the lightweight parser.
+            Defaults to False.
+
+    Returns:
+        Dict[str, Any]: dictionary with Site
+        model attributes and values
+    """
+    return build_site_dict(
+        user, url, extract_title(data, title_only), time_
+    )
+
+
+def build_site_dict(
+    user: User,
+    url: str,
+    title: t.Optional[str],
+    time_: float,
+    validators: t.Optional[t.Dict[str, t.Any]] = None,
+) -> t.Dict[str, t.Any]:
+    """Create a dictionary of Site model attributes and values
+    for the page which title has already been extracted.
+
+    Args:
+        user (User): SQLAlchemy User model instance
+        url (str): URL string
+        title (Optional[str]): page title, None if the page
+            hasn't been modified since the last parse
+        time_ (float): Time in took to make a request
+        validators (Optional[Dict[str, Any]], optional): etag,
+            last_modified and content_length of the response.
+            Defaults to None.
 
     Returns:
         Dict[str, Any]: dictionary with Site
         model attributes and values
     """
-    soup = BeautifulSoup(data, "lxml")
-    try:
-        title = soup.select_one("title").text.strip()
-    except AttributeError:
-        title = "Unknown title"
-    return dict(
+    site = dict(
         user=user,
-        url=url[:-1],
-        title=title,
+        url=site_url(url),
         scrapping_time=int(time_ * 1000),
         created_at=datetime.utcnow(),
+        **(validators or {}),
     )
+    if title is not None:
+        site["title"] = title
+    return site
+
+
+def site_url(url: str) -> str:
+    """Get the value stored in Site.url for the crawled URL.
+
+    Args:
+        url (str): crawled URL string
+
+    Returns:
+        str: Site url, canonical form of the URL
+    """
+    return canonicalize_url(url)
+
+
+def chunked(
+    iterable: t.Iterable[t.Any], size: int
+) -> t.Iterator[t.List[t.Any]]:
+    """Split iterable into lists of the given size.
+
+    Args:
+        iterable (Iterable[Any]): iterable to split
+        size (int): chunk size, the last chunk may be shorter
+
+    Yields:
+        Iterator[List[Any]]: chunks of the iterable
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def drain(items: t.List[t.Any]) -> t.List[t.Any]:
+    """Take the items out of the list another thread may append to.
+
+    Items appended while draining stay in the list.
+
+    Args:
+        items (List[Any]): list to drain
+
+    Returns:
+        List[Any]: items taken out
+    """
+    count = len(items)
+    taken = items[:count]
+    del items[:count]
+    return taken
 
 
 def create_fake_user(instances: int = 1) -> List[User]:
@@ -0,0 +1,192 @@
+import os
+import socket
+import tempfile
+import time
+import typing as t
+from collections import Counter
+from concurrent.futures import Executor
+from datetime import datetime
+from pathlib import Path, PosixPath
+
+from flask import current_app as app
+from project import db
+
+from .models import CrawlFailure, CrawlTask, FetchStat, ParseRun, Site
+from .parser import (
+    FetchFailure,
+    create_extract_pool,
+    get_fresh_since,
+    get_freshness,
+    parse_sites,
+    read_links,
+    update_failures,
+)
+from .urls import url_hash
+from .utils import chunked, site_url
+
+
+def enqueue_tasks(run: ParseRun, file_path: PosixPath) -> int:
+    """Queue links of the run file into the crawl_tasks work table.
+
+    Links are inserted by chunks, one commit per chunk, links that
+    have already been queued for the run are skipped, so an
+    interrupted run may simply be queued again. Runs retrying failures
+    only queue the links in the user's failure ledger. Links which sites
+    have been parsed within the run freshness window are left out,
+    looked up once per chunk.
+
+    Args:
+        run (ParseRun): distributed ParseRun instance
+        file_path (PosixPath): path to the file with links
+
+    Returns:
+        int: number of links queued
+    """
+    queued = 0
+    freshness = get_freshness(run)
+    links = read_links(file_path)
+    if run.failures_only:
+        failed = CrawlFailure.get_hashes(run.user)
+        links = (url for url in links if url_hash(url) in failed)
+    for chunk in chunked(links, app.config["CRAWL_COMMIT_CHUNK_SIZE"]):
+        if freshness:
+            fresh, _ = Site.lookup(
+                (site_url(url) for url in chunk), get_fresh_since(freshness)
+            )
+            chunk = [url for url in chunk if site_url(url) not in fresh]
+        CrawlTask.enqueue(run, chunk)
+        db.session.commit()
+        queued += len(chunk)
+    return queued
+
+
+def finish_run(run: ParseRun) -> None:
+    """Update the run counters from its tasks and finish the run
+    once all the tasks have been completed. Runs which links are still
+    being queued (their stats aren't set yet) aren't finished.
+    Changes aren't committed.
+
+    Args:
+        run (ParseRun): distributed ParseRun instance
+    """
+    counts = CrawlTask.count_by_status(run.id)
+    run.parsed = counts[CrawlTask.DONE]
+    run.failed = counts[CrawlTask.FAILED]
+    if (
+        run.status == ParseRun.RUNNING
+        and run.stats is not None
+        and not (
+            counts[CrawlTask.PENDING] or counts[CrawlTask.CLAIMED]
+        )
+    ):
+        run.status = ParseRun.FINISHED
+        run.finished_at = datetime.utcnow()
+
+
+def crawl_tasks(
+    tasks: t.List[CrawlTask], executor: t.Optional[Executor] = None
+) -> t.Counter[str]:
+    """Crawl the claimed tasks and write the results back.
+
+    Tasks are crawled run by run, sites, failures, task statuses,
+    request timings and run counters are committed at once for every run.
+
+    Args:
+        tasks (List[CrawlTask]): tasks claimed by the worker
+        executor (Optional[Executor], optional): pool titles are
+            extracted in, one is created per run group if None.
+            Defaults to None.
+
+    Returns:
+        Counter[str]: number of 'parsed' and 'failed' links
+    """
+    counters = Counter()
+    runs: t.Dict[int, t.List[CrawlTask]] = {}
+    for task in tasks:
+        runs.setdefault(task.run_id, []).append(task)
+    for group in runs.values():
+        run = group[0].run
+        fetch_stats = [] if app.config["CRAWL_FETCH_STATS"] else None
+        sites = []
+        failures = []
+        with tempfile.TemporaryDirectory(prefix="tasks-") as directory:
+            file_path = Path(directory) / "tasks.txt"
+            file_path.write_text("".join(f"{task.url}\n" for task in group))
+            # fresh links have been left out when queued
+            for item in parse_sites(
+                run.user,
+                file_path,
+                fetch_stats=fetch_stats,
+                freshness=0,
+                executor=executor,
+            ):
+                if isinstance(item, FetchFailure):
+                    failures.append(item)
+                else:
+                    sites.append(item)
+        if sites:
+            Site.bulk_upsert(sites)
+        update_failures(run.user, sites, failures, run)
+        CrawlTask.complete(
+            group, {failure.url: failure.error for failure in failures}
+        )
+        if fetch_stats:
+            for stat in fetch_stats:
+                stat["run_id"] = run.id
+            FetchStat.add_all(fetch_stats)
+        finish_run(run)
+        db.session.commit()
+        counters.update(parsed=len(sites), failed=len(failures))
+    return counters
+
+
+def work_tasks(
+    worker: t.Optional[str] = None, until_empty: bool = False
+) -> t.Counter[str]:
+    """Claim and crawl batches of tasks from the work table.
+
+    Any number of workers on any number of machines sharing the database
+    may run at once. A batch is held for CRAWL_TASK_LEASE seconds,
+    batches of the workers that have died are claimed again after that,
+    up to CRAWL_TASK_MAX_ATTEMPTS times. While there's nothing to claim
+    the worker finishes the runs which tasks are over and polls the
+    table every CRAWL_TASK_POLL_INTERVAL seconds. Titles of all the
+    batches are extracted in one process pool kept by the worker.
+
+    Args:
+        worker (Optional[str], optional): worker name, host name and
+            process id if None. Defaults to None.
+        until_empty (bool, optional): return once there are no tasks
+            to claim instead of polling. Defaults to False.
+
+    Returns:
+        Counter[str]: number of 'parsed' and 'failed' links
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    counters = Counter()
+    executor = create_extract_pool()
+    try:
+        while True:
+            tasks = CrawlTask.claim(
+                worker,
+                app.config["CRAWL_TASK_BATCH_SIZE"],
+                app.config["CRAWL_TASK_LEASE"],
+                app.config["CRAWL_TASK_MAX_ATTEMPTS"],
+            )
+            if tasks:
+                counters.update(crawl_tasks(tasks, executor))
+                app.logger.info(
+                    {"worker": worker, "tasks": len(tasks), **counters}
+                )
+                continue
+            for run in ParseRun.query.filter_by(
+                distributed=True, status=ParseRun.RUNNING
+            ):
+                finish_run(run)
+            db.session.commit()
+            if until_empty:
+                return counters
+            time.sleep(app.config["CRAWL_TASK_POLL_INTERVAL"])
+    finally:
+        if executor is not None:
+            executor.shutdown()
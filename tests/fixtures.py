@@ -1,8 +1,14 @@
+import asyncio
 import random
+import socket
+import threading
+from collections import Counter
 
 import pytest
+from aiohttp import web
 from faker import Faker
 from flask_login import login_user
+from sqlalchemy import event
 from project import db
 from project.main.models import Site, User
 from project.main.utils import create_fake_user
@@ -74,3 +80,105 @@ def test_sites_list(app, test_user):
     ]
     db.session.add_all(sites)
     yield sites
+
+
+@pytest.fixture
+def query_counter(test_database):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", count)
+
+
+@pytest.fixture(scope="module")
+def test_http_server():
+    async def page(request):
+        number = request.match_info["number"]
+        return web.Response(
+            text=(
+                f"<html><head><title>Page {number}</title></head>"
+                f"<body>{'<p>content</p>' * 10000}</body></html>"
+            ),
+            content_type="text/html",
+        )
+
+    async def cached(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(
+            text="<html><head><title>Cached</title></head></html>",
+            content_type="text/html",
+            headers={
+                "ETag": '"v1"',
+                "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+            },
+        )
+
+    async def links(request):
+        number = int(request.match_info["number"])
+        anchors = "".join(
+            f'<a href="../../page/{page}/#top">Page {page}</a>'
+            for page in range(number, number + 3)
+        )
+        return web.Response(
+            text=(
+                "<html><body>"
+                f'{anchors}<a href="mailto:me@test.com">Mail</a>'
+                f'<a href="HTTP://EXAMPLE.com/Path">Other</a>'
+                "</body></html>"
+            ),
+            content_type="text/html",
+        )
+
+    async def error(request):
+        raise web.HTTPInternalServerError()
+
+    hits = Counter()
+
+    async def flaky(request):
+        key = request.match_info["key"]
+        hits[key] += 1
+        if hits[key] <= int(request.match_info["failures"]):
+            raise web.HTTPServiceUnavailable()
+        return await page(request)
+
+    async def missing(request):
+        hits[request.match_info["key"]] += 1
+        raise web.HTTPNotFound()
+
+    async def robots(request):
+        hits["robots"] += 1
+        return web.Response(text="User-agent: *\nDisallow: /private/\n")
+
+    async def hits_count(request):
+        return web.Response(text=str(hits[request.match_info["key"]]))
+
+    app = web.Application()
+    app.router.add_get("/page/{number}", page)
+    app.router.add_get("/page/{number}/", page)
+    app.router.add_get("/links/{number}/", links)
+    app.router.add_get("/robots.txt", robots)
+    app.router.add_get("/cached/", cached)
+    app.router.add_get("/error", error)
+    app.router.add_get("/flaky/{key}/{failures}/{number}/", flaky)
+    app.router.add_get("/missing/{key}/", missing)
+    app.router.add_get("/hits/{key}", hits_count)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{port}"
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
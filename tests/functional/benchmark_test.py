@@ -0,0 +1,31 @@
+from benchmarks.harness import PHASES, run_benchmark
+from benchmarks.server import ServerSettings
+
+
+def test_run_benchmark():
+    settings = ServerSettings(
+        sites=40,
+        hosts=2,
+        latency=0.001,
+        page_size=4096,
+        error_rate=0.1,
+        timeout_rate=0.05,
+        timeout=2,
+        redirect_rate=0.2,
+    )
+    report = run_benchmark(
+        settings,
+        overrides={
+            "CRAWL_TIMEOUT": 0.5,
+            "CRAWL_RETRY_BASE_DELAY": 0.01,
+            "CRAWL_EXTRACT_WORKERS": 0,
+        },
+    )
+    assert list(report["phases"]) == list(PHASES)
+    for metrics in report["phases"].values():
+        assert metrics["urls"] == 40
+        assert 0 < metrics["failed"] < 40
+        assert metrics["urls_per_second"] > 0
+        assert metrics["latency_p95_ms"] > 0
+        assert metrics["peak_rss_mb"] > 0
+    assert report["phases"]["commit_parsed"]["db_write_seconds"] > 0
@@ -24,3 +24,21 @@ def test_production_config(app):
     assert not app.config["DEBUG"]
     assert not app.config["TESTING"]
     assert app.config["SQLALCHEMY_DATABASE_URI"] == create_db_url()
+
+
+def test_logger_writes_in_background():
+    from logging.handlers import QueueHandler
+
+    from project import create_app, stop_logger
+
+    app = create_app(config="test")
+    assert any(
+        isinstance(handler, QueueHandler) for handler in app.logger.handlers
+    )
+    listener = app.extensions["log_listener"]
+    app.logger.error("Logged in background")
+    stop_logger(app)
+    assert "log_listener" not in app.extensions
+    assert listener._thread is None
+    log = (BASE_DIR / "logs.txt").read_text()
+    assert "ERROR - Logged in background" in log
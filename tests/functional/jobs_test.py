@@ -0,0 +1,255 @@
+from datetime import datetime, timedelta
+
+from project import db
+from project.main.jobs import runner
+from project.main.metrics import FETCHES
+from project.main.models import (
+    CrawlCheckpoint,
+    CrawlFailure,
+    CrawlTask,
+    ParseRun,
+    Site,
+)
+from project.main.urls import url_hash
+from project.main.worktable import crawl_tasks, enqueue_tasks, work_tasks
+
+
+def create_run(app, user, file_name, content, distributed=False):
+    file_path = app.config["UPLOADS"] / file_name
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(content)
+    run = ParseRun(
+        user_id=user.id,
+        file_name=file_name,
+        file_path=str(file_path),
+        distributed=distributed,
+    )
+    run.commit_to_db()
+    return run
+
+
+def test_runner_executes_run(app, test_database, test_user, test_http_server):
+    fetches = FETCHES.collect()
+    urls = [f"{test_http_server}/page/{number}/" for number in range(5)]
+    run = create_run(
+        app, test_user, "run.txt", "\n".join([*urls, "http://127.0.0.1:1/"])
+    )
+    assert run.status == ParseRun.QUEUED
+    runner.enqueue(run).result()
+    db.session.refresh(run)
+    assert run.status == ParseRun.FINISHED
+    assert run.parsed == 5
+    assert run.failed == 1
+    assert run.started_at <= run.finished_at
+    assert run.stats["peak_concurrency"] >= run.stats["concurrency"]
+    assert run.fetch_stats.count() == 6 + run.stats["retries"]
+    assert run.fetch_stats.filter_by(error="ClientConnectorError").count()
+    assert run.stats["errors"]["errors"] == {"ClientConnectorError": 1}
+    assert run.stats["errors"]["hosts"] == {"127.0.0.1": 1}
+    timings = run.stats["timings"]
+    assert timings["ttfb"]["p50"] <= timings["ttfb"]["p99"]
+    assert timings["bytes"]["p50"] > 0
+    ok = FETCHES.collect()[("ok", "2xx")]
+    assert ok == fetches.get(("ok", "2xx"), 0) + 5
+    (app.config["UPLOADS"] / "run.txt").unlink()
+
+
+def test_runner_records_failure(app, test_database, test_user):
+    run = create_run(app, test_user, "missing.txt", "")
+    (app.config["UPLOADS"] / "missing.txt").unlink()
+    runner.enqueue(run).result()
+    db.session.refresh(run)
+    assert run.status == ParseRun.FAILED
+    assert "FileNotFoundError" in run.error
+    assert run.to_dict()["status"] == ParseRun.FAILED
+
+
+def test_runner_resumes_from_checkpoint(
+    app, test_database, test_user, test_http_server
+):
+    urls = [f"{test_http_server}/page/{number}/" for number in range(10, 15)]
+    run = create_run(app, test_user, "resume.txt", "\n".join(urls))
+    CrawlCheckpoint.add(run, [url_hash(url) for url in urls[:3]])
+    run.status = ParseRun.RUNNING
+    run.parsed = 3
+    run.commit_to_db()
+    assert not runner.is_orphaned(run)
+    run.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+    run.commit_to_db()
+    assert runner.is_orphaned(run)
+
+    assert runner.claim(run)
+    assert not runner.claim(run)
+    db.session.refresh(run)
+    assert run.status == ParseRun.QUEUED
+    assert not runner.is_orphaned(run)
+    runner.enqueue(run, resume=True).result()
+    db.session.refresh(run)
+    assert run.status == ParseRun.FINISHED
+    assert run.parsed == 5
+    assert not runner.is_orphaned(run)
+    assert run.checkpoints.count() == 0
+    parsed = {site.url for site in Site.query.all()}
+    assert not parsed & set(urls[:3])
+    assert set(urls[3:]) <= parsed
+    (app.config["UPLOADS"] / "resume.txt").unlink()
+
+
+def test_parse_run_heartbeat(app, test_database, test_user):
+    run = create_run(app, test_user, "heartbeat.txt", "")
+    run.status = ParseRun.RUNNING
+    run.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+    run.commit_to_db()
+    assert runner.is_orphaned(run)
+    ParseRun.beat([run.id])
+    db.session.commit()
+    db.session.refresh(run)
+    assert not runner.is_orphaned(run)
+    assert not runner.claim(run)
+    (app.config["UPLOADS"] / "heartbeat.txt").unlink()
+
+
+def test_runner_crawls_in_shards(
+    app, test_database, test_user, test_http_server, monkeypatch
+):
+    monkeypatch.setitem(app.config, "CRAWL_PROCESSES", 2)
+    urls = [f"{test_http_server}/page/{number}/" for number in range(20, 26)]
+    run = create_run(
+        app, test_user, "shards.txt", "\n".join([*urls, "http://127.0.0.2:1/"])
+    )
+    runner.enqueue(run).result()
+    db.session.refresh(run)
+    assert run.status == ParseRun.FINISHED, run.error
+    assert run.parsed == 6
+    assert run.failed == 1
+    assert run.stats["processes"] == 2
+    assert run.stats["errors"]["hosts"] == {"127.0.0.2": 1}
+    assert run.fetch_stats.count() == 7 + run.stats["retries"]
+    assert {site.url for site in Site.query.all()} >= set(urls)
+    assert FETCHES.collect()[("ok", "2xx")] >= 6
+    (app.config["UPLOADS"] / "shards.txt").unlink()
+
+
+def test_runner_queues_distributed_run(
+    app, test_database, test_user, test_http_server, monkeypatch
+):
+    monkeypatch.setitem(app.config, "CRAWL_TASK_BATCH_SIZE", 4)
+    urls = [f"{test_http_server}/page/{number}/" for number in range(30, 36)]
+    run = create_run(
+        app,
+        test_user,
+        "tasks.txt",
+        "\n".join([*urls, urls[0], "http://127.0.0.1:1/"]),
+        distributed=True,
+    )
+    runner.enqueue(run).result()
+    db.session.refresh(run)
+    assert run.status == ParseRun.RUNNING, run.error
+    assert run.stats == {"tasks": 7}
+    assert run.tasks.count() == 7
+    assert not runner.is_orphaned(run)
+
+    counters = work_tasks("worker", until_empty=True)
+    assert counters == {"parsed": 6, "failed": 1}
+    db.session.refresh(run)
+    assert run.status == ParseRun.FINISHED
+    assert run.parsed == 6
+    assert run.failed == 1
+    assert run.fetch_stats.count() >= 7
+    assert {site.url for site in Site.query.all()} >= set(urls)
+    assert work_tasks("worker", until_empty=True) == {}
+    (app.config["UPLOADS"] / "tasks.txt").unlink()
+
+
+def test_distributed_run_finishes_once_queued(
+    app, test_database, test_user, test_http_server
+):
+    urls = [f"{test_http_server}/page/{number}/" for number in range(60, 64)]
+    run = create_run(app, test_user, "chunks.txt", "", distributed=True)
+    run.status = ParseRun.RUNNING
+    run.commit_to_db()
+    file_path = app.config["UPLOADS"] / "chunks.txt"
+    for chunk in (urls[:2], urls[2:]):
+        file_path.write_text("\n".join(chunk))
+        enqueue_tasks(run, file_path)
+        tasks = CrawlTask.claim("worker", 10, 60, 3)
+        assert len(tasks) == 2
+        crawl_tasks(tasks)
+        db.session.refresh(run)
+        assert run.status == ParseRun.RUNNING
+    run.stats = {"tasks": len(urls)}
+    run.commit_to_db()
+    work_tasks("worker", until_empty=True)
+    db.session.refresh(run)
+    assert run.status == ParseRun.FINISHED
+    assert run.parsed == len(urls)
+    assert not run.tasks.filter_by(status=CrawlTask.PENDING).count()
+    file_path.unlink()
+
+
+def test_runner_retries_failures_only(
+    app, test_database, test_user, test_http_server, monkeypatch
+):
+    import requests
+
+    monkeypatch.setitem(app.config, "CRAWL_RETRY_ATTEMPTS", {})
+    urls = [
+        f"{test_http_server}/page/40/",
+        f"{test_http_server}/flaky/ledger-flaky/1/41/",
+        f"{test_http_server}/missing/ledger-missing/",
+    ]
+    run = create_run(app, test_user, "ledger.txt", "\n".join(urls))
+    runner.enqueue(run).result()
+    db.session.refresh(run)
+    assert (run.parsed, run.failed) == (1, 2)
+    failures = {
+        failure.url: failure
+        for failure in CrawlFailure.query.filter_by(user_id=test_user.id)
+    }
+    assert failures[urls[1]].status == 503
+    assert failures[urls[1]].retryable
+    assert failures[urls[1]].run_id == run.id
+    assert failures[urls[2]].error == "ClientResponseError"
+    assert not failures[urls[2]].retryable
+    assert failures[urls[2]].attempts == 1
+
+    retry = create_run(app, test_user, "ledger.txt", "\n".join(urls))
+    retry.failures_only = True
+    retry.commit_to_db()
+    runner.enqueue(retry).result()
+    db.session.refresh(retry)
+    assert retry.status == ParseRun.FINISHED, retry.error
+    assert (retry.parsed, retry.failed) == (1, 0)
+    assert retry.to_dict()["failures_only"]
+    assert retry.fetch_stats.count() == 1
+    assert requests.get(f"{test_http_server}/hits/ledger-missing").text == "1"
+    failed = {
+        failure.url
+        for failure in CrawlFailure.query.filter_by(user_id=test_user.id)
+    }
+    assert urls[2] in failed
+    assert urls[1] not in failed
+    (app.config["UPLOADS"] / "ledger.txt").unlink()
+
+
+def test_runner_skips_fresh_sites(
+    app, test_database, test_user, test_http_server
+):
+    urls = [f"{test_http_server}/page/{number}/" for number in range(50, 54)]
+    run = create_run(app, test_user, "fresh.txt", "\n".join(urls[:3]))
+    runner.enqueue(run).result()
+    db.session.refresh(run)
+    assert run.parsed == 3
+    assert run.stats["fresh_skipped"] == 0
+
+    rerun = create_run(app, test_user, "fresh.txt", "\n".join(urls))
+    rerun.freshness_ttl = 3600
+    rerun.commit_to_db()
+    runner.enqueue(rerun).result()
+    db.session.refresh(rerun)
+    assert rerun.status == ParseRun.FINISHED, rerun.error
+    assert (rerun.parsed, rerun.failed) == (1, 0)
+    assert rerun.stats["fresh_skipped"] == 3
+    assert rerun.fetch_stats.count() == 1
+    assert rerun.to_dict()["freshness_ttl"] == 3600
+    (app.config["UPLOADS"] / "fresh.txt").unlink()
@@ -9,3 +9,281 @@ def test_commit_parsed(app, client, test_database, test_user, test_all_sites):
     # file = path.read_text().split("\n")[:-1]
     # for site in Site.query.all():
     #     assert site.url in file
+
+
+def test_read_links(tmp_path):
+    from project.main.parser import read_links
+
+    file_path = tmp_path / "links.txt"
+    file_path.write_text(
+        "http://a.com\n\nhttp://b.com/x/\nHTTP://A.com:80/#top\n"
+        " http://a.com/ \nb.com/x/?b=2&a=1\nhttp://b.com/x/?a=1&b=2"
+    )
+    assert list(read_links(file_path)) == [
+        "http://a.com/",
+        "http://b.com/x/",
+        "http://b.com/x/?a=1&b=2",
+    ]
+
+
+def test_create_sites_list_streams_results(
+    app, test_user, test_http_server, tmp_path
+):
+    from project.main.parser import create_sites_list
+
+    file_path = tmp_path / "links.txt"
+    urls = [f"{test_http_server}/page/{number}/" for number in range(50)]
+    file_path.write_text("\n".join(urls))
+    sites = create_sites_list(test_user, file_path)
+    first = next(sites)
+    assert first["title"].startswith("Page")
+    rest = list(sites)
+    assert len(rest) == 49
+    assert {site["url"] for site in [first, *rest]} == set(urls)
+
+
+def test_read_head_stops_after_title(app, test_http_server):
+    import asyncio
+
+    import aiohttp
+    from project.main.parser import RequestConfig, read_head
+
+    async def read():
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{test_http_server}/page/1") as response:
+                return await read_head(response, limit=1 << 20)
+
+    data = asyncio.new_event_loop().run_until_complete(read())
+    assert data.startswith(b"<html><head><title>Page 1</title>")
+    assert len(data) <= RequestConfig.CHUNK_SIZE
+
+
+def test_extract_in_process_pool():
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+
+    from project.main.parser import FetchFailure, extract
+
+    async def results():
+        for number in range(10):
+            body = f"<title>{number}</title>".encode()
+            yield f"url{number}", body, 0.1, {}
+        yield "not-modified", None, 0.1, {}
+        yield FetchFailure("failed", "TimeoutError")
+
+    async def collect(executor):
+        return [
+            item
+            async for item in extract(results(), executor, batch_size=3)
+        ]
+
+    loop = asyncio.new_event_loop()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        pooled = loop.run_until_complete(collect(executor))
+    inline = loop.run_until_complete(collect(None))
+    loop.close()
+    assert sorted(pooled) == sorted(inline)
+    assert FetchFailure("failed", "TimeoutError") in pooled
+    assert ("url7", "7", 0.1, {}) in pooled
+    assert ("not-modified", None, 0.1, {}) in pooled
+
+
+def test_create_extract_pool_spawns_processes(app, monkeypatch):
+    from project.main.parser import create_extract_pool
+
+    monkeypatch.setitem(app.config, "CRAWL_EXTRACT_WORKERS", 0)
+    assert create_extract_pool() is None
+    monkeypatch.setitem(app.config, "CRAWL_EXTRACT_WORKERS", 1)
+    executor = create_extract_pool()
+    try:
+        assert executor._mp_context.get_start_method() == "spawn"
+    finally:
+        executor.shutdown()
+
+
+def test_conditional_refetch(app, test_database, test_user, test_http_server):
+    from project.main.parser import commit_parsed, create_sites_list
+
+    url = f"{test_http_server}/cached/"
+    file_path = app.config["UPLOADS"] / "cached.txt"
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(url)
+    commit_parsed(test_user, file_path)
+    site = Site.query.filter_by(url=url).one()
+    assert site.title == "Cached"
+    assert site.etag == '"v1"'
+    assert site.last_modified == "Wed, 21 Oct 2015 07:28:00 GMT"
+    created_at = site.created_at
+
+    [data] = list(create_sites_list(test_user, file_path))
+    assert "title" not in data
+    commit_parsed(test_user, file_path)
+    site = Site.query.filter_by(url=url).one()
+    assert site.title == "Cached"
+    assert site.created_at > created_at
+    file_path.unlink()
+
+
+def test_retry_server_errors_only(
+    app, test_user, test_http_server, tmp_path, monkeypatch
+):
+    from collections import Counter
+
+    import requests
+    from project.main.parser import create_sites_list
+
+    monkeypatch.setitem(app.config, "CRAWL_RETRY_BASE_DELAY", 0.01)
+    file_path = tmp_path / "links.txt"
+    file_path.write_text(
+        "\n".join(
+            [
+                f"{test_http_server}/flaky/retry/2/1/",
+                f"{test_http_server}/flaky/exhaust/10/2/",
+                f"{test_http_server}/missing/missing/",
+            ]
+        )
+    )
+    counters = Counter()
+    sites = list(create_sites_list(test_user, file_path, counters))
+    assert [site["title"] for site in sites] == ["Page 1"]
+    assert counters == Counter(parsed=1, failed=2)
+
+    def hits(key):
+        return int(requests.get(f"{test_http_server}/hits/{key}").text)
+
+    assert hits("retry") == 3
+    assert hits("exhaust") == 1 + app.config["CRAWL_RETRY_ATTEMPTS"]["server"]
+    assert hits("missing") == 1
+
+
+def test_parse_links_discovers_new_links(app, test_http_server, tmp_path):
+    from project.main.parser import parse_links
+
+    file_path = tmp_path / "links.txt"
+    file_path.write_text(f"{test_http_server}/page/0/\n")
+    seeds = [f"{test_http_server}/links/{number}/" for number in (0, 1)]
+    urls = [*seeds, f"{test_http_server}/error"]
+    written = parse_links(urls, "a", file_path)
+    links = file_path.read_text().splitlines()
+    assert written == 4
+    assert links[0] == f"{test_http_server}/page/0/"
+    assert sorted(links[1:]) == sorted(
+        [
+            *(f"{test_http_server}/page/{number}/" for number in (1, 2, 3)),
+            "http://example.com/Path",
+        ]
+    )
+    assert parse_links(seeds, "a", file_path) == 0
+
+
+def test_crawl_follows_links_in_scope(app, test_user, test_http_server):
+    from project.main.parser import parse_sites
+
+    file_path = app.config["UPLOADS"] / "depth.txt"
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(f"{test_http_server}/links/0/")
+    stats = {}
+    sites = list(parse_sites(test_user, file_path, stats=stats, max_depth=1))
+    assert sorted(site["url"] for site in sites) == [
+        f"{test_http_server}/links/0/",
+        *(f"{test_http_server}/page/{number}/" for number in range(3)),
+    ]
+    assert stats["discovered"] == 4
+    file_path.unlink()
+
+
+def test_crawl_respects_robots_txt(app, test_user, test_http_server):
+    import requests
+    from project import db
+    from project.main.models import RobotsRule
+    from project.main.parser import FetchFailure, parse_sites
+
+    def hits(key):
+        return int(requests.get(f"{test_http_server}/hits/{key}").text)
+
+    RobotsRule.query.delete()
+    # the crawl writes the rules from its own thread
+    db.session.commit()
+    file_path = app.config["UPLOADS"] / "robots.txt"
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text(
+        f"{test_http_server}/page/1/\n{test_http_server}/private/1/"
+    )
+    robots_hits = hits("robots")
+    for _ in range(2):
+        stats = {}
+        items = list(parse_sites(test_user, file_path, stats=stats))
+        [failure] = [item for item in items if isinstance(item, FetchFailure)]
+        assert failure == FetchFailure(
+            f"{test_http_server}/private/1/", "RobotsDisallowed"
+        )
+        assert len(items) == 2
+        assert stats["robots_disallowed"] == 1
+    assert hits("robots") == robots_hits + 1
+    assert RobotsRule.query.get(test_http_server).status == 200
+    file_path.unlink()
+
+
+def test_crawl_concurrency_bounded_by_host_limit(
+    app, test_database, test_http_server, monkeypatch, tmp_path
+):
+    import asyncio
+
+    from project.main.parser import crawl
+
+    for key, value in (
+        ("CRAWL_PER_HOST_LIMIT", 2),
+        ("CRAWL_CONCURRENCY", 50),
+        ("CRAWL_CONCURRENCY_MIN", 1),
+        ("CRAWL_CONCURRENCY_INITIAL", 4),
+        ("ROBOTS_ENABLED", False),
+    ):
+        monkeypatch.setitem(app.config, key, value)
+    file_path = tmp_path / "bounded.txt"
+    file_path.write_text(
+        "\n".join(
+            f"{test_http_server}/missing/bounded-{number}/"
+            for number in range(150)
+        )
+    )
+    stats = {}
+
+    async def consume():
+        return [item async for item in crawl(str(file_path), stats=stats)]
+
+    assert len(asyncio.new_event_loop().run_until_complete(consume())) == 150
+    # at most two requests are in flight, the window of four is never full
+    assert stats["peak_concurrency"] == 4
+    assert stats["concurrency"] <= 4
+
+
+def test_iterate_async_runs_loop_while_caller_is_busy(app):
+    import asyncio
+    import time
+
+    import pytest
+    from project.main.parser import iterate_async
+
+    produced = []
+
+    async def numbers(count):
+        for number in range(count):
+            await asyncio.sleep(0.01)
+            produced.append(number)
+            yield number
+        raise ValueError("over")
+
+    items = iterate_async(numbers(5), max_pending=10)
+    assert next(items) == 0
+    # the rest is produced while the caller is busy
+    time.sleep(0.3)
+    assert produced == [0, 1, 2, 3, 4]
+    assert [next(items) for _ in range(4)] == [1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        next(items)
+
+    produced.clear()
+    items = iterate_async(numbers(1000), max_pending=2)
+    assert next(items) == 0
+    items.close()
+    assert len(produced) < 10
@@ -1,3 +1,6 @@
+import gzip
+
+from project import db
 from project.main.models import User
 
 
@@ -94,3 +97,56 @@ class TestLogin:
 #     def test_logout_route(self, app, client, logged_in_user):
 #         response = client.get("/logout")
 #         print(response.data)
+
+
+def test_metrics_route(app, client):
+    client.get("/register")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    assert b"# TYPE crawler_fetches_total counter" in response.data
+    assert (
+        b"http_request_duration_seconds_count"
+        b'{endpoint="main_app.register_view",method="GET",status="200"}'
+    ) in response.data
+
+
+def test_index_route_json(
+    app, client, test_database, test_sites_list, monkeypatch
+):
+    monkeypatch.setitem(app.config, "LOGIN_DISABLED", True)
+    # the failed registration above leaves the session rolled back
+    db.session.rollback()
+    db.session.add_all(test_sites_list)
+    response = client.get("/?format=json&limit=2")
+    assert response.status_code == 200
+    first = response.get_json()
+    assert len(first["sites"]) == 2
+    assert {"url", "title", "user", "created_at"} <= set(first["sites"][0])
+    urls = [site["url"] for site in first["sites"]]
+    while first["next"]:
+        first = client.get(
+            f"/?format=json&limit=2&after={first['next']}"
+        ).get_json()
+        urls.extend(site["url"] for site in first["sites"])
+    assert len(urls) == len(set(urls)) == len(test_sites_list)
+    response = client.get("/?format=json&after=invalid")
+    assert response.status_code == 400
+    response = client.get("/?limit=2")
+    assert response.status_code == 200
+    assert b"Older" in response.data
+
+
+def test_download_route(
+    app, client, test_database, test_sites_list, monkeypatch
+):
+    monkeypatch.setitem(app.config, "LOGIN_DISABLED", True)
+    response = client.get("/download")
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert "sites.xml" in response.headers["Content-Disposition"]
+    data = response.get_data(as_text=True)
+    assert data.count("<site>") == len(test_sites_list)
+    response = client.get("/download?gzip=1")
+    assert response.content_type == "application/gzip"
+    assert gzip.decompress(response.get_data()).decode() == data
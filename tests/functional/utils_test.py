@@ -1,32 +1,55 @@
+import gzip
 import random
 import shutil
+import xml.etree.ElementTree as ET
+from datetime import datetime
 
+import pytest
 import requests
 from faker import Faker
+from project import db
 from project.main.models import Site, User
 from project.main.utils import (
     create_fake_site,
     create_fake_user,
     create_site_dict,
-    create_xml_report,
+    decode_cursor,
+    encode_cursor,
+    generate_xml_report,
     get_user_uploads_folder,
+    gzip_chunks,
 )
 
 fake = Faker()
 
 
-def test_create_xml_report(app, test_sites_list):
-    report = create_xml_report(test_sites_list)
-    with open(app.config["FILES_DIR"] / report, "r") as file:
-        data = file.read()
-        assert "Catalog" in data
-        assert all(site.url in data for site in test_sites_list)
-        assert all(site.user.username in data for site in test_sites_list)
-        assert all(site.title in data for site in test_sites_list)
-        assert all(
-            str(site.scrapping_time) in data for site in test_sites_list
-        )
-    shutil.rmtree(app.config["FILES_DIR"])
+def test_generate_xml_report(app, test_sites_list):
+    chunks = list(generate_xml_report(test_sites_list, buffer_size=100))
+    assert len(chunks) > 1
+    data = "".join(chunks)
+    root = ET.fromstring(data)
+    assert root.tag == "Catalog"
+    assert len(root.findall("site")) == len(test_sites_list)
+    assert all(site.url in data for site in test_sites_list)
+    assert all(site.user.username in data for site in test_sites_list)
+    assert all(site.title in data for site in test_sites_list)
+    assert all(
+        str(site.scrapping_time) in data for site in test_sites_list
+    )
+    compressed = b"".join(gzip_chunks(chunks))
+    assert gzip.decompress(compressed).decode() == data
+
+
+def test_generate_xml_report_drops_invalid_characters(app, test_sites_list):
+    site = test_sites_list[0]
+    title = site.title
+    site.title = "Tab\tform\x0cfeed\x00null\x1b & <esc>"
+    try:
+        data = "".join(generate_xml_report([site]))
+    finally:
+        site.title = title
+    root = ET.fromstring(data)
+    assert root.find("site/title").text == "Tab\tformfeednull & <esc>"
 
 
 def test_create_site_dict(test_user):
@@ -35,7 +58,7 @@ def test_create_site_dict(test_user):
     time = random.randint(1, 5000)
     result = create_site_dict(test_user, url, data, time)
     assert isinstance(result, dict)
-    assert result["url"] == url[:-1]
+    assert result["url"] == "https://google.com/"
 
 
 def test_create_fake_user():
@@ -57,3 +80,29 @@ def test_get_user_uploads_folder(app, test_user):
     assert path == app.config["UPLOADS"] / test_user.username
     assert path.exists()
     shutil.rmtree(path)
+
+
+def test_encode_cursor():
+    created_at = datetime(2022, 1, 2, 3, 4, 5, 6)
+    cursor = encode_cursor(created_at, 42)
+    assert decode_cursor(cursor) == (created_at, 42)
+    with pytest.raises(ValueError):
+        decode_cursor("invalid")
+
+
+def test_generate_xml_report_queries(test_database, query_counter):
+    def count_report_queries(users):
+        for number in range(users):
+            Site(
+                user=User(username=f"report-{users}-{number}", password=""),
+                url=f"report-{users}-{number}.com",
+                title=f"Report {number}",
+                scrapping_time=number,
+            ).commit_to_db()
+        db.session.expunge_all()
+        query_counter.clear()
+        data = "".join(generate_xml_report(Site.iter_all()))
+        assert f"report-{users}-{users - 1}" in data
+        return len(query_counter)
+
+    assert count_report_queries(2) == count_report_queries(10)
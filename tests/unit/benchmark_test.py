@@ -0,0 +1,56 @@
+from collections import Counter
+
+from benchmarks.harness import compare
+from benchmarks.server import ServerSettings, create_page, get_fate, get_urls
+
+
+def test_server_fates():
+    settings = ServerSettings(
+        sites=1000, error_rate=0.1, timeout_rate=0.2, redirect_rate=0.3
+    )
+    fates = Counter(get_fate(settings, number) for number in range(1000))
+    assert 50 < fates["error"] < 150
+    assert 150 < fates["timeout"] < 250
+    assert 250 < fates["redirect"] < 350
+    assert get_fate(settings, 7) == get_fate(settings, 7)
+
+
+def test_server_pages():
+    urls = get_urls(ServerSettings(sites=4, hosts=2), 8000)
+    assert urls[:2] == [
+        "http://127.0.0.1:8000/site/0/",
+        "http://127.0.0.2:8000/site/1/",
+    ]
+    page = create_page(ServerSettings(page_size=1000), 3)
+    assert len(page) == 1000
+    assert page.index(b"<title>Site 3</title>") < 100
+    page = create_page(ServerSettings(page_size=1000, title_position=0.5), 3)
+    assert 400 < page.index(b"<title>") < 600
+
+
+def test_compare():
+    baseline = {
+        "phases": {
+            "crawl": {
+                "urls_per_second": 100,
+                "latency_p95_ms": 50,
+                "peak_rss_mb": 100,
+                "db_write_seconds": 0,
+            }
+        }
+    }
+    report = {
+        "phases": {
+            "crawl": {
+                "urls_per_second": 70,
+                "latency_p95_ms": 55,
+                "peak_rss_mb": 150,
+                "db_write_seconds": 1,
+            }
+        }
+    }
+    regressions = compare(report, baseline, tolerance=0.2)
+    assert [regression.split(":")[0] for regression in regressions] == [
+        "crawl urls_per_second",
+        "crawl peak_rss_mb",
+    ]
@@ -0,0 +1,42 @@
+from project.main.dedup import BloomFilter, HashIndex, count_lines
+
+
+def test_bloom_filter():
+    seen = BloomFilter(1000)
+    assert seen.add("http://a.com/")
+    assert not seen.add("http://a.com/")
+    assert "http://a.com/" in seen
+    assert "http://b.com/" not in seen
+    assert len(seen) == 1
+
+
+def test_bloom_filter_error_rate():
+    seen = BloomFilter(10000, error_rate=0.01)
+    for number in range(10000):
+        seen.add(f"http://a.com/{number}")
+    false_positives = sum(
+        f"http://b.com/{number}" in seen for number in range(10000)
+    )
+    assert false_positives < 300
+    assert len(seen._bits) < 20000
+
+
+def test_count_lines(tmp_path):
+    file_path = tmp_path / "links.txt"
+    assert count_lines(file_path) == 0
+    file_path.write_text("a\nb\nc")
+    assert count_lines(file_path) == 3
+    file_path.write_text("a\nb\n")
+    assert count_lines(file_path) == 2
+
+
+def test_hash_index():
+    index = HashIndex(capacity=4)
+    values = [number * 7919 - 5000 for number in range(1000)]
+    assert all(index.add(value) for value in values)
+    assert not any(index.add(value) for value in values)
+    assert len(index) == 1000
+    assert all(value in index for value in values)
+    assert 1 not in index
+    assert index.add(0)
+    assert 0 in index
@@ -0,0 +1,68 @@
+from project.main.extract import (
+    TitleParser,
+    decode_head,
+    extract_links,
+    extract_title,
+    head_complete,
+    resolve_link,
+)
+
+
+def test_title_parser_by_chunks():
+    parser = TitleParser()
+    parser.feed("<html><head><ti")
+    assert not parser.done
+    parser.feed("tle> Some &amp; title </title>")
+    assert parser.done
+    assert parser.title == "Some & title"
+
+
+def test_title_parser_stops_on_body():
+    parser = TitleParser()
+    parser.feed("<html><head></head><body><title>Not a title")
+    assert parser.done
+    assert parser.title is None
+
+
+def test_head_complete():
+    assert head_complete(b"<html><head><title>Title</TITLE >")
+    assert head_complete(b"<html><head></head>")
+    assert not head_complete(b"<html><head><title>Title")
+    assert not head_complete(b"<title>Title</title>", start=13)
+
+
+def test_decode_head_declared_charset():
+    data = '<meta charset="cp1251"><title>Тест</title>'.encode("cp1251")
+    assert "Тест" in decode_head(data)
+    data = b'<meta charset="unknown">'
+    assert decode_head(data) == data.decode()
+
+
+def test_extract_title_modes():
+    page = b"<html><head><title>Title</title></head><body></body></html>"
+    assert extract_title(page) == extract_title(page, title_only=True)
+    for title_only in (False, True):
+        assert extract_title(b"<html></html>", title_only) == "Unknown title"
+
+
+def test_resolve_link():
+    base = "http://test.com/a/b"
+    assert resolve_link(base, "c#top") == "http://test.com/a/c"
+    assert resolve_link(base, " /d?q=1 ") == "http://test.com/d?q=1"
+    assert resolve_link(base, "HTTPS://Other.COM") == "https://other.com/"
+    assert resolve_link(base, "mailto:me@test.com") is None
+    assert resolve_link(base, "javascript:void(0)") is None
+    assert resolve_link("", "/relative") is None
+
+
+def test_extract_links():
+    html = (
+        '<html><head><base href="http://test.com/dir/"></head><body>'
+        '<a href="one">1</a><a href="/two#x">2</a><a href="one">1</a>'
+        '<a name="anchor">no href</a><a href="tel:123">phone</a>'
+        "</body></html>"
+    )
+    assert extract_links(html, "http://other.com/") == [
+        "http://test.com/dir/one",
+        "http://test.com/two",
+    ]
@@ -0,0 +1,28 @@
+from project.main.failures import ErrorAggregator
+
+
+def test_error_aggregator():
+    errors = ErrorAggregator(samples=2, top=1)
+    assert not errors
+    for number in range(10):
+        errors.add(f"http://a.com/{number}", "ClientResponseError", 500, "")
+    errors.add("http://b.com/", "ClientConnectorError", message="refused")
+    assert len(errors) == 11
+    summary = errors.summary()
+    assert summary["errors"] == {
+        "ClientResponseError": 10,
+        "ClientConnectorError": 1,
+    }
+    assert summary["hosts"] == {"a.com": 10}
+    assert summary["statuses"] == {"500": 10}
+    assert len(summary["examples"]["ClientResponseError"]) == 2
+    assert summary["examples"]["ClientConnectorError"] == [
+        {"url": "http://b.com/", "status": None, "message": "refused"}
+    ]
+
+    merged = ErrorAggregator(samples=2)
+    merged.add("http://c.com/", "TimeoutError")
+    merged.merge(summary)
+    assert merged.summary()["failed"] == 12
+    assert merged.summary()["hosts"] == {"a.com": 10, "c.com": 1}
+    assert len(merged.examples["ClientResponseError"]) == 2
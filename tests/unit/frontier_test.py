@@ -0,0 +1,65 @@
+from project.main.frontier import Frontier, Scope
+
+
+def drain(frontier):
+    items = []
+    while True:
+        item = frontier.pop()
+        if item is None:
+            return items
+        items.append(item)
+
+
+def test_frontier_orders_by_depth_and_host():
+    frontier = Frontier()
+    for url in ["http://a.com/1", "http://a.com/2", "http://a.com/3"]:
+        frontier.push(url, 1)
+    frontier.push("http://b.com/1", 1)
+    frontier.push("http://c.com/1", 0)
+    frontier.push("http://b.com/2", 1)
+    assert drain(frontier) == [
+        ("http://c.com/1", 0),
+        ("http://a.com/1", 1),
+        ("http://b.com/1", 1),
+        ("http://a.com/2", 1),
+        ("http://b.com/2", 1),
+        ("http://a.com/3", 1),
+    ]
+
+
+def test_frontier_skips_visited():
+    frontier = Frontier()
+    assert frontier.push("http://a.com/", 0)
+    assert not frontier.push("http://a.com/", 1)
+    assert drain(frontier) == [("http://a.com/", 0)]
+    assert not frontier.push("http://a.com/", 0)
+    assert len(frontier.visited) == 1
+
+
+def test_frontier_spills_to_disk(tmp_path):
+    frontier = Frontier(max_items=4, spill_dir=str(tmp_path))
+    for number in range(10):
+        frontier.push(f"http://a.com/{number}", 2)
+    frontier.push("http://a.com/shallow", 1)
+    assert frontier.spilled == 7
+    assert len(frontier) == 11
+    assert list(tmp_path.iterdir())
+    items = drain(frontier)
+    assert items[0] == ("http://a.com/shallow", 1)
+    assert sorted(url for url, depth in items[1:]) == sorted(
+        f"http://a.com/{number}" for number in range(10)
+    )
+    assert len(frontier) == 0
+    frontier.close()
+    assert not list(tmp_path.iterdir())
+
+
+def test_scope():
+    scope = Scope(["www.example.com"])
+    assert "http://example.com/" in scope
+    assert "http://blog.example.com/a" in scope
+    assert "http://notexample.com/" not in scope
+    assert "http://other.com/" not in scope
+    scope.add("other.com")
+    assert "http://other.com/" in scope
+    assert "http://anything.org/" in Scope()
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+from project.main.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    Registry,
+)
+
+
+def test_counter_threads():
+    registry = Registry()
+    counter = Counter("test_total", "Test.", ("kind",), registry=registry)
+
+    def work():
+        for _ in range(1000):
+            counter.inc(kind="a")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc(2, kind='b"')
+    assert counter.collect() == {("a",): 4000, ('b"',): 2}
+    assert registry.render() == (
+        "# HELP test_total Test.\n"
+        "# TYPE test_total counter\n"
+        'test_total{kind="a"} 4000\n'
+        'test_total{kind="b\\""} 2\n'
+    )
+
+
+def test_gauge():
+    registry = Registry()
+    gauge = Gauge("test_in_flight", "Test.", registry=registry)
+    gauge.inc()
+    thread = threading.Thread(target=gauge.dec)
+    thread.start()
+    thread.join()
+    gauge.inc(3)
+    assert gauge.collect() == {(): 3}
+
+
+def test_histogram():
+    registry = Registry()
+    histogram = Histogram(
+        "test_seconds", "Test.", buckets=(0.1, 1), registry=registry
+    )
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    with histogram.time():
+        pass
+    assert registry.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="0.1"} 3',
+        'test_seconds_bucket{le="1"} 4',
+        'test_seconds_bucket{le="+Inf"} 5',
+        f"test_seconds_sum {histogram.collect()[()][1]}",
+        "test_seconds_count 5",
+    ]
+
+
+def test_registry_load():
+    source, target = Registry(), Registry()
+    for registry in (source, target):
+        Counter("test_total", "Test.", ("kind",), registry=registry)
+        Histogram("test_seconds", "Test.", buckets=(1,), registry=registry)
+    source._metrics["test_total"].inc(kind="a")
+    source._metrics["test_seconds"].observe(0.5)
+    target._metrics["test_seconds"].observe(5)
+    target.load(source.dump())
+    target.load(source.dump())
+    assert target._metrics["test_total"].collect() == {("a",): 2}
+    assert target._metrics["test_seconds"].collect() == {(): [[2, 1], 6.0]}
+
+
+def test_metric_requires_merge():
+    class Incomplete(Metric):
+        kind = "counter"
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "No _merge.", registry=Registry())
@@ -1,7 +1,18 @@
+from datetime import datetime, timedelta
+
 import pytest
 from werkzeug.security import check_password_hash
+from project import db
 from project.main.errors import EmptyQueryError
-from project.main.models import Site
+from project.main.models import (
+    MAX_BIND_PARAMS,
+    CrawlFailure,
+    CrawlTask,
+    ParseRun,
+    Site,
+    User,
+)
+from project.main.urls import url_hash
 
 
 class TestUser:
@@ -38,3 +49,215 @@ class TestSite:
     ):
         site = Site.get_by_user(test_fake_user)
         assert len(site) == 0
+
+    def test_site_get_page(self, test_database):
+        user = User(username="Pager", password="password")
+        user.commit_to_db()
+        created_at = datetime(2022, 1, 1)
+        for number in range(5):
+            Site(
+                user=user,
+                url=f"page{number}.com",
+                title=f"Page {number}",
+                scrapping_time=number,
+                # sites 2 to 4 share created_at, ids break the tie
+                created_at=created_at + timedelta(minutes=min(number, 2)),
+            ).commit_to_db()
+        first = Site.get_page(user, limit=3)
+        assert [site.url for site in first] == [
+            "page4.com",
+            "page3.com",
+            "page2.com",
+        ]
+        assert first[0].username == "Pager"
+        assert not isinstance(first[0], Site)
+        last = first[-1]
+        second = Site.get_page(user, (last.created_at, last.id), limit=3)
+        assert [site.url for site in second] == ["page1.com", "page0.com"]
+        assert len(Site.get_page(limit=100)) >= 5
+
+    def test_site_lookup(self, test_database, test_site):
+        test_site.etag = '"etag"'
+        test_site.created_at = datetime.utcnow() - timedelta(hours=1)
+        test_site.commit_to_db()
+        urls = ["test.com", "invalid.com"]
+        assert Site.lookup(urls) == (
+            set(),
+            {"test.com": {"If-None-Match": '"etag"'}},
+        )
+        since = datetime.utcnow() - timedelta(hours=2)
+        assert Site.lookup(urls, since) == ({"test.com"}, {})
+        since = datetime.utcnow() - timedelta(minutes=30)
+        assert Site.lookup(urls, since) == (
+            set(),
+            {"test.com": {"If-None-Match": '"etag"'}},
+        )
+
+    def test_site_bulk_upsert(self, test_database, test_site, test_user):
+        created_at = datetime.utcnow() + timedelta(days=1)
+        sites = [
+            dict(
+                user=test_user,
+                url=f"bulk{number}.com",
+                title=f"Bulk {number}",
+                scrapping_time=number,
+                created_at=created_at,
+            )
+            for number in range(3)
+        ]
+        sites.append(
+            dict(
+                user=test_user,
+                url="bulk0.com",
+                title="Bulk updated",
+                scrapping_time=10,
+                created_at=created_at,
+                etag='"bulk"',
+            )
+        )
+        sites.append(
+            dict(
+                user=test_user,
+                url="test.com",
+                scrapping_time=1,
+                created_at=created_at,
+            )
+        )
+        Site.bulk_upsert(sites)
+        db.session.commit()
+        assert Site.query.filter(Site.url.like("bulk%")).count() == 3
+        updated = Site.get_by_url("bulk0.com").one()
+        assert updated.title == "Bulk updated"
+        assert updated.etag == '"bulk"'
+        not_modified = Site.get_by_url("test.com").one()
+        assert not_modified.title == "Title"
+        assert not_modified.scrapping_time == 123
+        assert not_modified.created_at == created_at
+        assert updated.url_hash == url_hash("bulk0.com")
+
+    def test_site_bulk_upsert_batches(
+        self, test_database, test_user, query_counter, monkeypatch
+    ):
+        monkeypatch.setitem(MAX_BIND_PARAMS, "sqlite", 30)
+        created_at = datetime.utcnow()
+        sites = [
+            dict(
+                user=test_user,
+                url=f"batch{number}.com",
+                title=f"Batch {number}",
+                scrapping_time=number,
+                created_at=created_at,
+            )
+            for number in range(5)
+        ]
+        Site.bulk_upsert(sites)
+        db.session.commit()
+        inserts = [
+            statement
+            for statement in query_counter
+            if statement.startswith("INSERT INTO sites")
+        ]
+        # 9 columns a row, 2 rows a statement
+        assert len(inserts) == 3
+        assert Site.query.filter(Site.url.like("batch%")).count() == 5
+
+    def test_site_canonicalize_urls(self, test_database, test_user):
+        created_at = datetime.utcnow()
+        for number, url in enumerate(
+            ["HTTP://Dup.com:80", "http://dup.com/#top", "http://other.com"]
+        ):
+            Site(
+                user=test_user,
+                url=url,
+                title=f"Title {number}",
+                scrapping_time=number,
+                created_at=created_at + timedelta(seconds=number),
+            ).commit_to_db()
+        assert Site.get_by_url("HTTP://Dup.com:80").one().url_hash == (
+            url_hash("HTTP://Dup.com:80")
+        )
+        counters = Site.canonicalize_urls(chunk_size=2)
+        db.session.commit()
+        assert counters["deleted"] == 1
+        assert counters["updated"] >= 2
+        duplicate = Site.get_by_url("http://dup.com/").one()
+        assert duplicate.title == "Title 1"
+        assert duplicate.url_hash == url_hash("http://dup.com/")
+        assert Site.get_by_url("http://other.com/").count() == 1
+        assert Site.canonicalize_urls() == {"updated": 0, "deleted": 0}
+
+
+class TestCrawlTask:
+    def test_crawl_task_claim(self, test_database, test_user):
+        run = ParseRun(
+            user_id=test_user.id,
+            file_name="tasks.txt",
+            file_path="tasks.txt",
+            distributed=True,
+        )
+        run.commit_to_db()
+        urls = [f"http://tasks.com/{number}" for number in range(5)]
+        CrawlTask.enqueue(run, urls)
+        CrawlTask.enqueue(run, urls[:2])
+        db.session.commit()
+        assert run.tasks.count() == 5
+
+        first = CrawlTask.claim("first", 3, 60, 2)
+        second = CrawlTask.claim("second", 3, 60, 2)
+        assert len(first) == 3
+        assert len(second) == 2
+        assert not {task.id for task in first} & {task.id for task in second}
+        assert CrawlTask.claim("third", 3, 60, 2) == []
+
+        CrawlTask.complete(first, {first[0].url: "ClientConnectorError"})
+        db.session.commit()
+        counts = CrawlTask.count_by_status(run.id)
+        assert counts[CrawlTask.DONE] == 2
+        assert counts[CrawlTask.FAILED] == 1
+        assert counts[CrawlTask.CLAIMED] == 2
+
+        for task in second:
+            db.session.refresh(task)
+            db.session.expunge(task)
+        CrawlTask.query.filter_by(worker="second").update(
+            {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+        )
+        db.session.commit()
+        reclaimed = CrawlTask.claim("third", 3, 60, 2)
+        assert {task.id for task in reclaimed} == {task.id for task in second}
+        assert all(task.attempts == 2 for task in reclaimed)
+        CrawlTask.complete(second, {})
+        db.session.commit()
+        assert CrawlTask.count_by_status(run.id)[CrawlTask.CLAIMED] == 2
+
+        for task in reclaimed:
+            task.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert CrawlTask.claim("fourth", 3, 60, 2) == []
+        counts = CrawlTask.count_by_status(run.id)
+        assert counts[CrawlTask.FAILED] == 3
+        assert not counts[CrawlTask.CLAIMED]
+
+
+class TestCrawlFailure:
+    def test_crawl_failure_record(self, test_database, test_user):
+        failures = [
+            ("http://failed.com/", "ClientResponseError", 503, True),
+            ("http://missing.com/", "ClientResponseError", 404, False),
+        ]
+        CrawlFailure.record(test_user, failures)
+        CrawlFailure.record(test_user, failures[:1])
+        db.session.commit()
+        failure = CrawlFailure.query.get(
+            (test_user.id, url_hash(failures[0][0]))
+        )
+        assert failure.attempts == 2
+        assert failure.status == 503
+        hashes = CrawlFailure.get_hashes(test_user)
+        assert url_hash("http://failed.com/") in hashes
+        assert url_hash("http://missing.com/") not in hashes
+        assert len(CrawlFailure.get_hashes(test_user, retryable=False)) == 2
+
+        CrawlFailure.clear(test_user, [url_hash("http://failed.com/")])
+        db.session.commit()
+        assert len(CrawlFailure.get_hashes(test_user, retryable=False)) == 1
@@ -0,0 +1,45 @@
+from project.main.robots import RobotsCache, create_parser, get_origin
+
+ROBOTS = """
+User-agent: bot
+Disallow: /
+
+User-agent: *
+Disallow: /private/
+Crawl-delay: 2
+Request-rate: 1/5
+"""
+
+
+def test_get_origin():
+    assert get_origin("http://a.com/x?q=1") == "http://a.com"
+    assert get_origin("https://u:p@a.com:8080/") == "https://a.com:8080"
+
+
+def test_create_parser():
+    assert create_parser(404, "") is None
+    assert create_parser(200, "  \n") is None
+    assert create_parser(403, "").disallow_all
+    assert create_parser(200, ROBOTS) is not None
+
+
+def test_robots_cache_rules():
+    cache = RobotsCache("*", ttl=60, max_delay=3)
+    cache._parsers.update(
+        {
+            "http://a.com": create_parser(200, ROBOTS),
+            "http://b.com": None,
+            "http://c.com": create_parser(401, ""),
+        }
+    )
+    assert "http://a.com" in cache
+    assert "http://d.com" not in cache
+    assert cache.allowed("http://a.com/page")
+    assert not cache.allowed("http://a.com/private/page")
+    assert cache.allowed("http://b.com/private/page")
+    assert not cache.allowed("http://c.com/")
+    assert cache.crawl_delay("http://a.com") == 3
+    assert cache.crawl_delay("http://b.com") is None
+    assert cache.crawl_delay("http://c.com") is None
+    cache.user_agent = "bot/1.0"
+    assert not cache.allowed("http://a.com/page")
@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+from project.main.scheduler import (
+    AdaptiveLimiter,
+    HostScheduler,
+    RetryPolicy,
+    get_host,
+)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_get_host():
+    assert get_host("https://A.com:8080/path") == "a.com"
+    assert get_host("a.com") == "a.com"
+
+
+def test_round_robin_between_hosts():
+    async def schedule():
+        scheduler = HostScheduler(per_host_limit=10)
+        for url in ["http://a.com/1", "http://a.com/2", "http://a.com/3"]:
+            await scheduler.put(url)
+        await scheduler.put("http://b.com/1")
+        await scheduler.put("http://c.com/1")
+        await scheduler.close()
+        urls = []
+        while True:
+            url = await scheduler.get()
+            if url is None:
+                return urls
+            urls.append(url)
+
+    assert run(schedule()) == [
+        "http://a.com/1",
+        "http://b.com/1",
+        "http://c.com/1",
+        "http://a.com/2",
+        "http://a.com/3",
+    ]
+
+
+def test_per_host_limit():
+    async def schedule():
+        scheduler = HostScheduler(per_host_limit=1)
+        await scheduler.put("http://a.com/1")
+        await scheduler.put("http://a.com/2")
+        await scheduler.close()
+        first = await scheduler.get()
+        second = asyncio.ensure_future(scheduler.get())
+        await asyncio.sleep(0.01)
+        assert not second.done()
+        await scheduler.release(first)
+        assert await second == "http://a.com/2"
+
+    run(schedule())
+
+
+def test_per_host_rate():
+    async def schedule():
+        scheduler = HostScheduler(per_host_limit=10, per_host_rate=20)
+        for number in range(3):
+            await scheduler.put(f"http://a.com/{number}")
+        await scheduler.close()
+        start = time.monotonic()
+        while await scheduler.get():
+            pass
+        return time.monotonic() - start
+
+    assert run(schedule()) >= 0.09
+
+
+def test_host_delay():
+    scheduler = HostScheduler(per_host_limit=10, per_host_rate=20)
+    assert scheduler.interval("a.com") == 0.05
+    scheduler.set_delay("a.com", 2)
+    assert scheduler.interval("a.com") == 2
+    assert scheduler.interval("b.com") == 0.05
+
+
+def test_put_waits_for_room():
+    async def schedule():
+        scheduler = HostScheduler(per_host_limit=10, max_pending=1)
+        await scheduler.put("http://a.com/1")
+        put = asyncio.ensure_future(scheduler.put("http://a.com/2"))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+        assert len(scheduler) == 1
+        await scheduler.get()
+        await put
+        assert len(scheduler) == 1
+
+    run(schedule())
+
+
+def test_put_later_keeps_scheduler_open():
+    async def schedule():
+        scheduler = HostScheduler(per_host_limit=10)
+        await scheduler.put("http://a.com/1")
+        await scheduler.put("http://a.com/2")
+        await scheduler.close()
+        first = await scheduler.get()
+        await scheduler.release(first)
+        scheduler.put_later(first, 0.01)
+        return [await scheduler.get() for _ in range(3)]
+
+    assert run(schedule()) == ["http://a.com/2", "http://a.com/1", None]
+
+
+def test_retry_policy_delays():
+    policy = RetryPolicy(attempts=2, base_delay=1, max_delay=1.5)
+    assert 0 <= policy.delay(0) <= 1
+    assert 0 <= policy.delay(1) <= 1.5
+    assert policy.delay(2) is None
+
+
+def test_adaptive_limiter_increases_when_saturated():
+    async def limit():
+        limiter = AdaptiveLimiter(2, 10, initial=2, sample_size=4)
+        for _ in range(2):
+            for _ in range(2):
+                await limiter.acquire()
+            for _ in range(2):
+                await limiter.release(latency=0.1)
+        return limiter
+
+    limiter = run(limit())
+    assert limiter.limit == 4
+    assert limiter.peak == 4
+
+
+def test_adaptive_limiter_decreases_on_errors():
+    async def limit():
+        limiter = AdaptiveLimiter(2, 100, initial=50, sample_size=4)
+        for _ in range(4):
+            await limiter.acquire()
+            await limiter.release(error=True)
+        return limiter
+
+    limiter = run(limit())
+    assert limiter.limit == 35
+    assert limiter.peak == 50
+
+
+def test_adaptive_limiter_decreases_on_latency_growth():
+    async def limit():
+        limiter = AdaptiveLimiter(2, 100, initial=50, sample_size=2)
+        for latency in (0.1, 0.1, 1.0, 1.0):
+            await limiter.acquire()
+            await limiter.release(latency=latency)
+        return limiter
+
+    assert run(limit()).limit == 35
+
+
+def test_adaptive_limiter_bounds_in_flight():
+    async def limit():
+        limiter = AdaptiveLimiter(1, 1)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await limiter.release()
+        await waiter
+        assert limiter.in_flight == 1
+
+    run(limit())
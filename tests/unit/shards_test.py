@@ -0,0 +1,16 @@
+from project.main.shards import get_shard, partition_links
+
+
+def test_partition_links_by_host(tmp_path):
+    links = [
+        f"http://host{number}.com/page/{page}"
+        for number in range(10)
+        for page in range(3)
+    ]
+    paths = partition_links(links, 3, tmp_path)
+    assert 1 < len(paths) <= 3
+    shards = [path.read_text().splitlines() for path in paths]
+    assert sorted(url for shard in shards for url in shard) == sorted(links)
+    for shard in shards:
+        assert len({get_shard(url, 3) for url in shard}) == 1
+    assert partition_links([], 3, tmp_path) == []
@@ -0,0 +1,17 @@
+from project.main.timing import percentile, summarize
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 0) == 1
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) is None
+
+
+def test_summarize():
+    assert summarize([3, None, 1, 2]) == {"p50": 2, "p95": 3, "p99": 3}
+    assert summarize([None]) is None
+    assert summarize([]) is None
@@ -0,0 +1,31 @@
+import pytest
+from project.main.urls import canonicalize_url, url_hash
+
+
+@pytest.mark.parametrize(
+    "url, canonical",
+    [
+        ("http://a.com", "http://a.com/"),
+        ("HTTP://A.COM/Path", "http://a.com/Path"),
+        ("https://a.com:443/x/", "https://a.com/x/"),
+        ("http://a.com:8080", "http://a.com:8080/"),
+        ("http://a.com/?b=2&a=1&&", "http://a.com/?a=1&b=2"),
+        ("http://a.com/?b=1&a=2&a=0&b", "http://a.com/?a=2&a=0&b=1&b"),
+        ("http://a.com/page#section", "http://a.com/page"),
+        (" a.com/x\n", "http://a.com/x"),
+        ("a.com/?next=http://b.com", "http://a.com/?next=http://b.com"),
+        ("a.com:8080/x", "http://a.com:8080/x"),
+        ("http://user:pw@A.com:80/", "http://user:pw@a.com/"),
+        ("http://[::1]:8000/", "http://[::1]:8000/"),
+        ("http://a.com./", "http://a.com/"),
+    ],
+)
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+    assert canonicalize_url(canonical) == canonical
+
+
+def test_url_hash():
+    assert url_hash("http://a.com/") == url_hash("http://a.com/")
+    assert url_hash("http://a.com/") != url_hash("http://b.com/")
+    assert -(2 ** 63) <= url_hash("http://a.com/") < 2 ** 63